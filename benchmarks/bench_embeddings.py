@@ -0,0 +1,131 @@
+"""Compare per-node embedding requests with token packed concurrent batches.
+
+Starts a local fake Azure OpenAI embeddings server that answers every request
+after a fixed latency plus a small per-text cost, then embeds the same nodes
+one request per node (the old EmbeddingTransformation loop) and through
+EmbeddingTransformation, with the embed model main() sets up.
+
+Usage:
+    python benchmarks/bench_embeddings.py [num_nodes] [latency_ms] [concurrency]
+"""
+import base64
+import json
+import os
+import struct
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "knowledge_extractor")))
+# start from an empty embedding cache, every text is a miss
+os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(tempfile.mkdtemp(), "embeddings.sqlite")
+
+from llama_index.core.schema import TextNode
+from scripts.initialiser import initialise_embed_model
+from scripts.llama_ingestionator.transformator import EmbeddingTransformation
+
+EMBEDDING_DIM = 1536
+
+
+def encode_vector(value, as_base64):
+    vector = [value] * EMBEDDING_DIM
+    if as_base64:
+        return base64.b64encode(struct.pack(f"<{EMBEDDING_DIM}f", *vector)).decode()
+    return vector
+
+
+def start_fake_server(latency, per_text_latency=0.0005):
+    """Serve /openai/deployments/<id>/embeddings, returns the server and its request count"""
+    stats = {"requests": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            texts = body["input"] if isinstance(body["input"], list) else [body["input"]]
+            with lock:
+                stats["requests"] += 1
+            time.sleep(latency + per_text_latency * len(texts))
+            # the openai client asks for base64 float32 vectors when numpy is installed
+            as_base64 = body.get("encoding_format") == "base64"
+            payload = json.dumps({
+                "object": "list",
+                "data": [
+                    {"object": "embedding", "index": idx, "embedding": encode_vector(0.001 * idx, as_base64)}
+                    for idx in range(len(texts))
+                ],
+                "model": "text-embedding-ada-002",
+                "usage": {"prompt_tokens": 0, "total_tokens": 0},
+            }).encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, stats
+
+
+def make_nodes(num_nodes, run, words=120):
+    return [
+        TextNode(
+            text=" ".join(f"{run}{idx}" for _ in range(words)),
+            metadata={"needs_embedding": True, "title": f"node {idx}"},
+        )
+        for idx in range(num_nodes)
+    ]
+
+
+def embed_per_node(nodes, embed_model):
+    for node in nodes:
+        node.embedding = embed_model.get_text_embedding(node.text)
+
+
+def embed_batched(nodes, embed_model, concurrency):
+    texts = [node.text for node in nodes]
+    embeddings = EmbeddingTransformation().get_text_embeddings(texts, embed_model, concurrency=concurrency)
+    for node, embedding in zip(nodes, embeddings):
+        node.embedding = embedding
+
+
+def timed(func, stats):
+    stats["requests"] = 0
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start, stats["requests"]
+
+
+if __name__ == "__main__":
+    num_nodes = int(sys.argv[1]) if len(sys.argv) > 1 else 400
+    latency = (float(sys.argv[2]) if len(sys.argv) > 2 else 50) / 1000
+    concurrency = int(sys.argv[3]) if len(sys.argv) > 3 else 4
+
+    server, stats = start_fake_server(latency)
+    embed_model = initialise_embed_model({
+        "EMBEDDING_DEPLOYMENT_ID": "bench",
+        "AZURE_OPENAI_API_KEY": "fake",
+        "OPENAI_ENDPOINT": f"http://127.0.0.1:{server.server_port}",
+        "EMBEDDING_API_VERSION": "2024-02-01",
+    })
+
+    # the embed model caches vectors, so the runs embed different texts
+    per_node = make_nodes(num_nodes, "single")
+    batched = make_nodes(num_nodes, "batched")
+    per_node_time, per_node_requests = timed(lambda: embed_per_node(per_node, embed_model), stats)
+    batched_time, batched_requests = timed(lambda: embed_batched(batched, embed_model, concurrency), stats)
+    server.shutdown()
+
+    print(f"{num_nodes} nodes, {latency * 1000:.0f} ms per request, concurrency {concurrency}")
+    print(f"per node: {per_node_time:.2f} s, {per_node_requests} requests, {num_nodes / per_node_time:.0f} nodes/s")
+    print(f"batched:  {batched_time:.2f} s, {batched_requests} requests, {num_nodes / batched_time:.0f} nodes/s "
+          f"({per_node_time / batched_time:.0f}x faster)")
+    print(f"all nodes embedded: {all(node.embedding is not None for node in per_node + batched)}")
@@ -0,0 +1,110 @@
+"""Compare per-stage image preprocessing with the shared image payload cache.
+
+Stores synthetic photos and charts in a temporary blob store, then prepares
+the payloads the vision stages send for every image two ways:
+
+- before: every stage loads, decodes, resizes and PNG encodes the image itself
+  (description, entities and plot insights, plus the classification request)
+- after: ImagePreprocessingTransformation encodes each image once and every
+  stage takes the payload from the cache, photos as JPEG/WebP and line art as PNG
+
+CPU time is the process time of the whole run, so it covers every thread.
+Payload bytes are the base64 bytes of the image in each request.
+
+Usage:
+    python benchmarks/bench_image_payloads.py [num_images] [stages]
+"""
+import base64
+import io
+import os
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "knowledge_extractor")))
+
+import numpy as np
+from PIL import Image, ImageDraw
+from scripts.llama_ingestionator.image_payloads import ImagePayloadCache, get_image_payload
+import scripts.llama_ingestionator.image_payloads as image_payloads
+from scripts.llama_ingestionator.node_creator import create_image_node
+from scripts.llama_ingestionator.transformator import ImagePreprocessingTransformation
+from scripts.storage.blob_store import BlobStore, load_node_image
+import scripts.storage.blob_store as blob_store
+
+
+def make_photo(rng, width=3000, height=2000):
+    y, x = np.mgrid[0:height, 0:width] / width
+    pixels = np.stack([128 + 100 * np.sin(x * rng.uniform(2, 8) + c) for c in range(3)], axis=2)
+    pixels += rng.normal(0, 8, (height, width, 3))
+    buffer = io.BytesIO()
+    Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)).save(buffer, format="JPEG", quality=90)
+    return buffer.getvalue()
+
+
+def make_chart(rng, width=1800, height=1200):
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    draw.line([(80, 40), (80, height - 80), (width - 40, height - 80)], fill="black", width=4)
+    values = np.cumsum(rng.normal(0, 20, 50)) + height / 2
+    draw.line([(80 + idx * (width - 120) / 49, float(value)) for idx, value in enumerate(values)], fill="blue", width=4)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def resize_image_before(image_data, max_size=(1024, 1024)):
+    """The preprocessing each vision stage did on its own before the payload cache"""
+    image = Image.open(io.BytesIO(image_data))
+    image.thumbnail(max_size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def measure(label, run, num_images):
+    wall, cpu = time.perf_counter(), time.process_time()
+    payloads = run()
+    wall, cpu = time.perf_counter() - wall, time.process_time() - cpu
+    payload_kb = sum(len(payload) for payload in payloads) / len(payloads) / 1024
+    print(f"{label:<8} cpu {cpu / num_images * 1000:7.1f} ms/image   wall {wall:6.2f} s   payload {payload_kb:7.1f} KB/request")
+    return cpu, payload_kb
+
+
+def main():
+    num_images = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    stages = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    rng = np.random.default_rng(0)
+
+    with tempfile.TemporaryDirectory() as directory:
+        store = BlobStore(directory)
+        blob_store._blob_store = store
+        nodes = []
+        for idx in range(num_images):
+            data = make_photo(rng) if idx % 2 == 0 else make_chart(rng)
+            nodes.append(create_image_node(store.put(data), {"title": f"image_{idx}", "type": "image"}))
+
+        print(f"{num_images} images, {stages} vision stages plus classification")
+
+        def before():
+            payloads = []
+            for node in nodes:
+                # classification sent the stored image, each stage resized it again
+                payloads.append(base64.b64encode(load_node_image(node)).decode())
+                for _ in range(stages):
+                    payloads.append(resize_image_before(load_node_image(node)))
+            return payloads
+
+        def after():
+            ImagePreprocessingTransformation()(nodes)
+            return [get_image_payload(node) for node in nodes for _ in range(stages)]
+
+        before_cpu, before_kb = measure("before", before, num_images)
+        image_payloads._payload_cache = ImagePayloadCache()
+        after_cpu, after_kb = measure("after", after, num_images)
+        print(f"CPU time reduced {before_cpu / after_cpu:.1f}x, payload bytes {before_kb / after_kb:.1f}x")
+        print(f"cache: {image_payloads.image_payload_stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,97 @@
+"""Compare the BeautifulSoup page passes with the single-pass lxml analyser.
+
+The old path builds a BeautifulSoup tree for extract_tables and runs
+parse_section_links for every section, as the referenciator helpers did for
+links, cite notes and references (three loops over the sections). Only the
+parsing is timed, not the network calls those helpers used to make.
+
+The stored fixture in tests/fixtures is repeated to build a long article.
+
+Usage:
+    python benchmarks/bench_page_analyser.py [repeats_of_fixture_body]
+"""
+import os
+import re
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "knowledge_extractor")))
+
+import pandas as pd
+from bs4 import BeautifulSoup
+from mediawiki import MediaWikiPage
+from scripts.wiki_crawler.analysinator import analyse_page_html
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "..", "tests", "fixtures", "wiki_page.html")
+
+
+def build_page_html(repeats):
+    with open(FIXTURE_PATH, encoding="utf-8") as f:
+        fixture = f.read()
+    body_start = fixture.index('<h2><span class="mw-headline" id="History">')
+    body_end = fixture.index('<h2><span class="mw-headline" id="References">')
+    body = fixture[body_start:body_end]
+    copies = [
+        re.sub(r'id="(History|Construction|Design)"', rf'id="\1_{idx}"', body)
+        .replace(">History<", f">History {idx}<")
+        .replace(">Construction<", f">Construction {idx}<")
+        .replace(">Design<", f">Design {idx}<")
+        for idx in range(repeats)
+    ]
+    return fixture[:body_start] + "".join(copies) + fixture[body_end:]
+
+
+def soup_extract_tables(html_page):
+    soup = BeautifulSoup(html_page, "lxml")
+    tables = []
+    for table in soup.find_all("table", class_="wikitable"):
+        table_data = [
+            [col.text.strip() for col in row.find_all(["td", "th"])]
+            for row in table.find_all("tr")
+        ]
+        tables.append(pd.DataFrame(table_data))
+    return tables
+
+
+def make_page(html_page):
+    page = MediaWikiPage.__new__(MediaWikiPage)
+    page._html = html_page
+    page._soup = None
+    page.url = "https://en.wikipedia.org/wiki/Eiffel_Tower"
+    page.mediawiki = SimpleNamespace(base_url="https://en.wikipedia.org")
+    return page
+
+
+def soup_passes(html_page, section_titles):
+    tables = soup_extract_tables(html_page)
+    page = make_page(html_page)
+    # links, cite notes and references each looped over every section
+    links = []
+    for _ in range(3):
+        for section in section_titles:
+            links.extend(page.parse_section_links(section) or [])
+    return tables, links
+
+
+def timed(func, *args, repeats=3):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func(*args)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == "__main__":
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 40
+    html_page = build_page_html(repeats)
+    analysis = analyse_page_html(html_page)
+    section_titles = list(dict.fromkeys(analysis.links["section"].dropna()))
+
+    soup_time = timed(soup_passes, html_page, section_titles)
+    lxml_time = timed(analyse_page_html, html_page)
+
+    print(f"page: {len(html_page) / 1e3:.0f}K chars, {len(section_titles)} sections, {len(analysis.tables)} tables")
+    print(f"BeautifulSoup passes: {soup_time * 1000:.1f} ms")
+    print(f"analyse_page_html:    {lxml_time * 1000:.1f} ms ({soup_time / lxml_time:.1f}x faster)")
@@ -0,0 +1,67 @@
+"""Compare per-section page.section() scans with the one-pass section index.
+
+Builds a synthetic long article and times extracting every section and
+subsection text both ways.
+
+Usage:
+    python benchmarks/bench_section_index.py [num_sections] [subsections_per_section]
+"""
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "knowledge_extractor")))
+
+from mediawiki import MediaWikiPage
+from scripts.wiki_crawler.navigifier import extract_section_titles, index_sections
+
+
+def build_article(num_sections, subsections_per_section, paragraph_words=400):
+    paragraph = " ".join(["lorem"] * paragraph_words)
+    parts = [paragraph]
+    for section_idx in range(num_sections):
+        parts.append(f"\n\n== Section {section_idx} ==\n{paragraph}")
+        for subsection_idx in range(subsections_per_section):
+            parts.append(f"\n\n=== Subsection {section_idx}.{subsection_idx} ===\n{paragraph}")
+    return "".join(parts)
+
+
+def scan_sections(page):
+    texts = []
+    for section_title, subsections in extract_section_titles(page.content):
+        texts.append(MediaWikiPage.section(page, section_title))
+        for subsection_title in subsections:
+            texts.append(MediaWikiPage.section(page, subsection_title))
+    return texts
+
+
+def indexed_sections(page):
+    texts = []
+    for section, subsections in index_sections(page.content):
+        texts.append(section.text)
+        texts.extend(subsection.text for subsection in subsections)
+    return texts
+
+
+def timed(func, page, repeats=3):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(page)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+if __name__ == "__main__":
+    num_sections = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    subsections_per_section = int(sys.argv[2]) if len(sys.argv) > 2 else 3
+    page = SimpleNamespace(content=build_article(num_sections, subsections_per_section))
+
+    scan_time, scanned = timed(scan_sections, page)
+    index_time, indexed = timed(indexed_sections, page)
+
+    print(f"article: {len(page.content) / 1e6:.1f}M chars, {len(indexed)} sections")
+    print(f"page.section() scans: {scan_time * 1000:.1f} ms")
+    print(f"index_sections:       {index_time * 1000:.1f} ms ({scan_time / index_time:.0f}x faster)")
+    print(f"same texts: {scanned == indexed}")
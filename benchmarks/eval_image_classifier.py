@@ -0,0 +1,237 @@
+"""Evaluate the local image classifier on a labelled image set.
+
+Every image is classified locally. The script reports how many images were
+decided locally, so their analysis request skips the classification step and
+asks only for the fields of their type, the accuracy on those, and the images
+left to the model.
+
+The labelled set is a directory with a `plot` and an `image` subdirectory.
+SVG files are rasterised the way the crawler does it. Without a directory, a
+synthetic fixture set is generated: charts, diagrams and SVG drawings, noisy
+photo-like textures, and a few hard cases (heatmaps, dark charts, flags,
+night shots).
+
+Usage:
+    python benchmarks/eval_image_classifier.py [labelled_dir]
+"""
+import io
+import os
+import sys
+import time
+from collections import Counter
+
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "knowledge_extractor")))
+
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+from scripts.llama_ingestionator.image_classifier import classify_image_locally
+
+LABELS = ["plot", "image"]
+
+
+def to_bytes(image, format="PNG", **kwargs):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format, **kwargs)
+    return buffer.getvalue()
+
+
+def draw_axes(draw, width, height, colour="black"):
+    draw.line([(40, 20), (40, height - 30), (width - 20, height - 30)], fill=colour, width=2)
+    for idx in range(5):
+        y = 20 + idx * (height - 50) // 4
+        draw.line([(35, y), (40, y)], fill=colour)
+        draw.text((5, y - 5), str(100 - idx * 25), fill=colour)
+
+
+def line_chart(rng, width=480, height=320):
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    draw_axes(draw, width, height)
+    for colour in ["blue", "red", "green"][: rng.integers(1, 4)]:
+        values = np.cumsum(rng.normal(0, 10, 20)) + height / 2
+        points = [(40 + idx * (width - 60) / 19, float(np.clip(value, 25, height - 35))) for idx, value in enumerate(values)]
+        draw.line(points, fill=colour, width=2)
+    return to_bytes(image)
+
+
+def bar_chart(rng, width=480, height=320):
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    draw_axes(draw, width, height)
+    bars = rng.integers(4, 12)
+    bar_width = (width - 80) / bars
+    for idx in range(bars):
+        top = int(rng.integers(30, height - 40))
+        draw.rectangle([50 + idx * bar_width, top, 50 + (idx + 0.7) * bar_width, height - 31], fill="steelblue")
+        draw.text((50 + idx * bar_width, height - 25), f"c{idx}", fill="black")
+    return to_bytes(image)
+
+
+def scatter_plot(rng, width=480, height=320):
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    draw_axes(draw, width, height)
+    for x, y in zip(rng.uniform(50, width - 30, 80), rng.uniform(30, height - 40, 80)):
+        draw.ellipse([x - 3, y - 3, x + 3, y + 3], fill="darkorange")
+    return to_bytes(image)
+
+
+def pie_chart(rng, width=400, height=400):
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    shares = rng.dirichlet(np.ones(rng.integers(3, 7)))
+    start = 0.0
+    colours = ["tomato", "gold", "skyblue", "yellowgreen", "orchid", "sandybrown"]
+    for share, colour in zip(shares, colours):
+        draw.pieslice([60, 60, width - 60, height - 60], start, start + share * 360, fill=colour, outline="black")
+        start += share * 360
+    return to_bytes(image)
+
+
+def flowchart(rng, width=480, height=360):
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    boxes = rng.integers(3, 6)
+    for idx in range(boxes):
+        top = 20 + idx * (height - 40) // boxes
+        draw.rectangle([150, top, 330, top + 40], outline="black", fill="lightyellow", width=2)
+        draw.text((170, top + 15), f"Step {idx + 1}", fill="black")
+        if idx:
+            draw.line([(240, top - 30), (240, top)], fill="black", width=2)
+    return to_bytes(image)
+
+
+def svg_diagram(rng):
+    """An SVG line diagram rasterised the way the crawler does it, returned with its url"""
+    from scripts.wiki_crawler.rasterinator import rasterise_svg
+
+    points = " ".join(f"{20 + idx * 30},{int(rng.integers(20, 180))}" for idx in range(12))
+    svg = f"""<svg xmlns="http://www.w3.org/2000/svg" width="400" height="200">
+        <line x1="20" y1="190" x2="380" y2="190" stroke="black"/>
+        <line x1="20" y1="10" x2="20" y2="190" stroke="black"/>
+        <polyline points="{points}" fill="none" stroke="navy" stroke-width="2"/>
+    </svg>""".encode()
+    return rasterise_svg(svg).png_data, "https://upload.wikimedia.org/diagram.svg"
+
+
+def heatmap(rng, width=320, height=320):
+    """A plot filled with a colour gradient, hard to tell apart from a photo"""
+    values = np.clip(rng.normal(0.5, 0.25, (16, 16)), 0, 1)
+    cells = np.kron(values, np.ones((height // 16, width // 16)))
+    rgb = np.stack([cells * 255, 80 + cells * 100, (1 - cells) * 255], axis=2).astype(np.uint8)
+    return to_bytes(Image.fromarray(rgb).filter(ImageFilter.GaussianBlur(2)), "JPEG", quality=85)
+
+
+def dark_chart(rng, width=480, height=320):
+    image = Image.new("RGB", (width, height), (30, 30, 40))
+    draw = ImageDraw.Draw(image)
+    draw_axes(draw, width, height, colour="white")
+    values = np.cumsum(rng.normal(0, 10, 20)) + height / 2
+    draw.line([(40 + idx * 22, float(np.clip(value, 25, height - 35))) for idx, value in enumerate(values)], fill="cyan", width=2)
+    return to_bytes(image)
+
+
+def photo(rng, width=640, height=480, quality=85):
+    """A photo-like texture: lit gradients, blurred shapes and sensor noise, saved as JPEG"""
+    y, x = np.mgrid[0:height, 0:width] / max(width, height)
+    tint = rng.uniform(0.3, 1.0, 3)
+    rgb = np.stack([255 * tint[c] * (0.4 + 0.6 * np.sin(x * rng.uniform(1, 4) + y * rng.uniform(1, 4) + c)) for c in range(3)], axis=2)
+    image = Image.fromarray(np.clip(rgb, 0, 255).astype(np.uint8))
+    draw = ImageDraw.Draw(image)
+    for _ in range(rng.integers(3, 10)):
+        cx, cy, r = rng.uniform(0, width), rng.uniform(0, height), rng.uniform(20, 150)
+        draw.ellipse([cx - r, cy - r, cx + r, cy + r], fill=tuple(int(v) for v in rng.integers(0, 256, 3)))
+    image = image.filter(ImageFilter.GaussianBlur(rng.uniform(2, 8)))
+    noisy = np.asarray(image, dtype=np.float32) + rng.normal(0, rng.uniform(4, 12), (height, width, 3))
+    return to_bytes(Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8)), "JPEG", quality=quality)
+
+
+def flag(rng, width=450, height=300):
+    """A drawn image that is not a plot"""
+    image = Image.new("RGB", (width, height))
+    draw = ImageDraw.Draw(image)
+    colours = [tuple(int(v) for v in rng.integers(0, 256, 3)) for _ in range(3)]
+    for idx, colour in enumerate(colours):
+        draw.rectangle([idx * width // 3, 0, (idx + 1) * width // 3, height], fill=colour)
+    return to_bytes(image)
+
+
+def night_photo(rng, width=640, height=480):
+    noisy = rng.normal(25, 8, (height, width, 3))
+    return to_bytes(Image.fromarray(np.clip(noisy, 0, 255).astype(np.uint8)), "JPEG", quality=70)
+
+
+def synthetic_fixtures(seed=0):
+    """Generate the labelled fixture set as (name, label, image bytes, url)"""
+    rng = np.random.default_rng(seed)
+    fixtures = []
+    for generator, count in [(line_chart, 10), (bar_chart, 10), (scatter_plot, 8), (pie_chart, 8), (flowchart, 8)]:
+        fixtures += [(f"{generator.__name__}_{idx}", "plot", generator(rng), None) for idx in range(count)]
+    for idx in range(6):
+        data, url = svg_diagram(rng)
+        # skipped where cairo is not installed
+        if data:
+            fixtures.append((f"svg_diagram_{idx}", "plot", data, url))
+    fixtures += [(f"heatmap_{idx}", "plot", heatmap(rng), None) for idx in range(3)]
+    fixtures += [(f"dark_chart_{idx}", "plot", dark_chart(rng), None) for idx in range(3)]
+    fixtures += [(f"photo_{idx}", "image", photo(rng, quality=int(rng.integers(60, 95))), None) for idx in range(50)]
+    fixtures += [(f"flag_{idx}", "image", flag(rng), None) for idx in range(3)]
+    fixtures += [(f"night_photo_{idx}", "image", night_photo(rng), None) for idx in range(3)]
+    return fixtures
+
+
+def load_fixtures(directory):
+    """Load a labelled directory as (name, label, image bytes, url)"""
+    from scripts.wiki_crawler.rasterinator import rasterise_svg
+
+    fixtures = []
+    for label in LABELS:
+        label_dir = os.path.join(directory, label)
+        for name in sorted(os.listdir(label_dir)):
+            with open(os.path.join(label_dir, name), "rb") as file:
+                data = file.read()
+            url = None
+            if name.lower().endswith(".svg"):
+                data, url = rasterise_svg(data).png_data, name
+                if data is None:
+                    continue
+            fixtures.append((name, label, data, url))
+    return fixtures
+
+
+def evaluate(fixtures):
+    decisions = Counter()
+    mistakes = []
+    escalated = Counter()
+    start = time.perf_counter()
+    for name, label, data, url in fixtures:
+        predicted = classify_image_locally(data, url)
+        if predicted is None:
+            escalated[label] += 1
+            continue
+        decisions[label, predicted] += 1
+        if predicted != label:
+            mistakes.append((name, label, predicted))
+    duration = time.perf_counter() - start
+
+    decided = sum(decisions.values())
+    correct = sum(count for (label, predicted), count in decisions.items() if label == predicted)
+    print(f"images:                 {len(fixtures)}")
+    print(f"decided locally:        {decided} ({decided / len(fixtures):.0%} analysed without the classification step)")
+    print(f"accuracy when decided:  {correct / decided:.1%}" if decided else "accuracy when decided:  n/a")
+    print(f"escalated to the model: {sum(escalated.values())} ({', '.join(f'{count} {label}' for label, count in escalated.items()) or 'none'})")
+    print(f"local time per image:   {duration / len(fixtures) * 1000:.1f} ms")
+    print("confusion (label -> predicted):")
+    for label in LABELS:
+        print(f"  {label:>5}: " + "  ".join(f"{predicted} {decisions[label, predicted]}" for predicted in LABELS))
+    for name, label, predicted in mistakes:
+        print(f"  wrong: {name} is a {label}, classified as {predicted}")
+
+
+def main():
+    fixtures = load_fixtures(sys.argv[1]) if len(sys.argv) > 1 else synthetic_fixtures()
+    evaluate(fixtures)
+
+
+if __name__ == "__main__":
+    main()
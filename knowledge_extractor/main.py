@@ -15,6 +15,7 @@ from scripts.config import (
     setup_logging,
     get_neo4j_config,
     get_qdrant_config,
+    get_crawl_config,
 )
 
 from scripts.wiki_crawler.searchinator import search_wiki
@@ -27,7 +28,7 @@ from scripts.llama_ingestionator.pipeline import create_pipeline, run_pipeline
 from scripts.storage.storage_manager import StorageManager
 
 # import data processing
-from scripts.data_processing import get_initial_nodes, create_transformed_nodes
+from scripts.data_processing import get_initial_nodes, create_transformed_nodes, store_page_nodes
 
 
 
@@ -42,6 +43,7 @@ def main() -> None:
         # Neo4j and Qdrant configurations
         neo4j_config = get_neo4j_config(env_vars)
         qdrant_config = get_qdrant_config(env_vars)
+        crawl_config = get_crawl_config(env_vars)
 
         # Set up embedding model
         embed_model = initialise_embed_model(env_vars)
@@ -60,7 +62,9 @@ def main() -> None:
 
         # Load or create initial nodes
         logging.info(f'topic: {topic}, num_pages: {num_pages}')
-        initial_documents = get_initial_nodes(topic, num_pages)
+        initial_documents = get_initial_nodes(
+            topic, num_pages, crawl_config["wiki_url"], crawl_config
+        )
 
         # Initialise the pipeline
         pipeline = create_pipeline()
@@ -71,10 +75,10 @@ def main() -> None:
             initial_documents, env_vars['DOMAIN_TOPIC'], pipeline, embed_model
         )
 
-        # Store nodes and relationships in Neo4j
-        # uncoment later - already stored
-        for page in pipeline_transformed_nodes:
-            storage_manager.store_nodes(page)
+        # Store nodes and relationships of new and changed pages in Neo4j and Qdrant
+        store_page_nodes(
+            storage_manager, initial_documents, pipeline_transformed_nodes, env_vars['DOMAIN_TOPIC']
+        )
 
     except Exception as e:
         logging.error(f"An error occurred: {e}")
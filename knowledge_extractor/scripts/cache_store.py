@@ -0,0 +1,195 @@
+import os
+import sqlite3
+import threading
+import hashlib
+import time
+import logging
+
+
+# access times of hits are written in batches of this many, instead of one commit per hit
+TOUCH_BATCH_SIZE = 100
+
+
+def make_cache_key(*parts):
+    """Build a cache key from the sha256 of the given parts
+
+    Parameters
+        parts : str | bytes
+            the values the cached entry depends on
+
+    Returns
+        key : str
+            hex digest identifying the entry
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        if part is None:
+            part = b""
+        elif not isinstance(part, (bytes, bytearray)):
+            part = str(part).encode("utf-8")
+        digest.update(len(part).to_bytes(8, "big"))
+        digest.update(part)
+    return digest.hexdigest()
+
+
+class SQLiteCache:
+    """Persistent key/value cache stored in a single SQLite file.
+
+    Entries are evicted least recently used first once the stored values grow
+    past `max_bytes`, and entries older than `max_age` seconds are treated as
+    missing. Hits and misses are counted for the lifetime of the object. The
+    access times of hits are kept in memory and written TOUCH_BATCH_SIZE at a
+    time, before any eviction and on close.
+    """
+
+    def __init__(self, path, max_bytes=512 * 1024 * 1024, max_age=None):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._touched = {}
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS entries (
+                key TEXT PRIMARY KEY,
+                value BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+            """
+        )
+        self._conn.commit()
+        self.total_bytes = self._conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM entries"
+        ).fetchone()[0]
+
+    def get(self, key, record_stats=True):
+        """Get a cached value
+
+        Parameters
+            key : str
+                the cache key
+            record_stats : bool, optional
+                whether the lookup counts towards the hit/miss statistics
+
+        Returns
+            value : bytes | None
+                the cached value or None if missing or expired
+        """
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, created_at FROM entries WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None and self.max_age and now - row[1] > self.max_age:
+                self._delete(key)
+                self._conn.commit()
+                row = None
+            if row is None:
+                if record_stats:
+                    self.misses += 1
+                return None
+            self._touched[key] = now
+            if len(self._touched) >= TOUCH_BATCH_SIZE:
+                self._flush_touches()
+                self._conn.commit()
+            if record_stats:
+                self.hits += 1
+            return bytes(row[0])
+
+    def set(self, key, value):
+        """Store a value, evicting old entries if the cache grows too big
+
+        Parameters
+            key : str
+                the cache key
+            value : bytes
+                the value to store
+        """
+        now = time.time()
+        with self._lock:
+            self._delete(key)
+            self._touched.pop(key, None)
+            self._conn.execute(
+                "INSERT INTO entries (key, value, size, created_at, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, sqlite3.Binary(value), len(value), now, now),
+            )
+            self.total_bytes += len(value)
+            if self.max_bytes and self.total_bytes > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def delete(self, key):
+        """Remove an entry from the cache"""
+        with self._lock:
+            self._delete(key)
+            self._conn.commit()
+
+    def _flush_touches(self):
+        """Write the access times of the hits since the last flush"""
+        if self._touched:
+            self._conn.executemany(
+                "UPDATE entries SET accessed_at = ? WHERE key = ?",
+                [(accessed_at, key) for key, accessed_at in self._touched.items()],
+            )
+            self._touched = {}
+
+    def _delete(self, key):
+        row = self._conn.execute(
+            "SELECT size FROM entries WHERE key = ?", (key,)
+        ).fetchone()
+        if row is not None:
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.total_bytes -= row[0]
+
+    def _evict(self):
+        """Drop least recently used entries until the cache is back under 90% of its size"""
+        target = int(self.max_bytes * 0.9)
+        self._flush_touches()
+        rows = self._conn.execute(
+            "SELECT key, size FROM entries ORDER BY accessed_at ASC"
+        ).fetchall()
+        evicted = 0
+        for key, size in rows:
+            if self.total_bytes <= target:
+                break
+            self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+            self.total_bytes -= size
+            evicted += 1
+        self.evictions += evicted
+        logging.info(f"Evicted {evicted} entries from cache {self.path}")
+
+    def stats(self):
+        """Get hit/miss counters and size of the cache
+
+        Returns
+            dict
+                hits, misses, hit_rate, evictions, entries and bytes of the cache
+        """
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "entries": entries,
+            "bytes": self.total_bytes,
+        }
+
+    def close(self):
+        with self._lock:
+            self._flush_touches()
+            self._conn.commit()
+            self._conn.close()
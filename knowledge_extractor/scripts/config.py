@@ -19,7 +19,18 @@ def get_env_vars():
         "DB_NEO4J_USER",
         "DB_NEO4J_PASSWORD",
         "DOMAIN_TOPIC",
-        "NUM_WIKI_PAGES"
+        "NUM_WIKI_PAGES",
+        "WIKI_API_URL",
+        "CRAWL_MAX_WORKERS",
+        "CRAWL_HOST_CONCURRENCY",
+        "CRAWL_POLITENESS_DELAY",
+        "CRAWL_MAX_DEPTH",
+        "CRAWL_MAX_PAGES",
+        "CRAWL_TIME_BUDGET",
+        "WIKI_DUMP_PATH",
+        "WIKI_DUMP_INDEX_PATH",
+        "WIKI_DUMP_CATEGORIES",
+        "WIKI_DUMP_WORKERS",
     )
 
 
@@ -62,3 +73,26 @@ def get_qdrant_config(env_vars):
         "port": env_vars["QDRANT_PORT"],
         "collection_name": env_vars["QDRANT_COLLECTION_NAME"],
     }
+
+
+def get_crawl_config(env_vars):
+    return {
+        "wiki_url": env_vars["WIKI_API_URL"],
+        "max_workers": int(env_vars["CRAWL_MAX_WORKERS"] or 4),
+        # pages, not requests: a page holds its host slot for all of its API requests
+        "max_per_host": int(env_vars["CRAWL_HOST_CONCURRENCY"] or 2),
+        "politeness_delay": float(env_vars["CRAWL_POLITENESS_DELAY"] or 1.0),
+        # follow links from the search results this many links deep, 0 keeps just the results
+        "max_depth": int(env_vars["CRAWL_MAX_DEPTH"] or 0),
+        "max_pages": int(env_vars["CRAWL_MAX_PAGES"] or 100),
+        "time_budget": float(env_vars["CRAWL_TIME_BUDGET"]) if env_vars["CRAWL_TIME_BUDGET"] else None,
+        # read pages from a local dump instead of the API when a dump path is set
+        "dump_path": env_vars["WIKI_DUMP_PATH"],
+        "dump_index_path": env_vars["WIKI_DUMP_INDEX_PATH"],
+        "dump_categories": [
+            category.strip()
+            for category in (env_vars["WIKI_DUMP_CATEGORIES"] or "").split(",")
+            if category.strip()
+        ],
+        "dump_workers": int(env_vars["WIKI_DUMP_WORKERS"] or 4),
+    }
@@ -1,89 +1,254 @@
 import os
 import logging
+from itertools import islice
+from concurrent.futures import ThreadPoolExecutor
 
 from scripts.helper import sanitise_filename, load_documents_from_file, save_documents_to_file
 from scripts.wiki_crawler.searchinator import search_wiki
 from scripts.llama_ingestionator.documentifier import process_page_into_doc_and_nodes
-from scripts.llama_ingestionator.pipeline import run_pipeline
+from scripts.llama_ingestionator.pipeline import run_pipeline_on_changes
+from scripts.llama_ingestionator.node_creator import get_node_fingerprint
+from scripts.wiki_crawler.throttlinator import HostThrottle, get_api_host
+from scripts.wiki_crawler.dumpifier import DumpPage, iter_dump_pages, iter_multistream_pages
+from scripts.wiki_crawler.crawlinator import crawl_link_graph
+from scripts.wiki_crawler.navigifier import fetch_page_records
+from scripts.storage.ingestion_manifest import IngestionManifest, get_page_key, get_page_revision
 
-def get_initial_nodes(topic="test", num_pages=1, wiki_url = None) -> list:
-    """Load initial nodes from a file or process a page to create them."""
-    
-    clean_topic = sanitise_filename(topic)
-    # to change later after cleaning
-    filename = f'./data/{clean_topic}_initial_test'
+def get_manifest(topic: str) -> IngestionManifest:
+    """Open the ingestion manifest of a topic, kept with the saved nodes of its pages."""
+    return IngestionManifest(f'./data/{sanitise_filename(topic)}')
 
+
+def load_page_nodes(filename: str):
+    """Load the saved nodes of a page, None if the file is missing or corrupted."""
+    if not os.path.exists(filename):
+        return None
+    try:
+        return load_documents_from_file(filename)
+    except Exception as e:
+        logging.error(f"File {filename} is corrupted: {e}. The page will be processed again.")
+        os.remove(filename)
+        return None
+
+
+def get_initial_nodes(topic="test", num_pages=1, wiki_url = None, crawl_config=None) -> list:
+    """Build the initial nodes of the topic pages, reusing the nodes of unchanged pages.
+
+    The pages are looked up on every run together with their revision ids and
+    content. Pages the manifest has nodes for at the same revision and content
+    hash are loaded from file, only new and changed pages are fetched and built.
+    """
+    manifest = get_manifest(topic)
     try:
-        if os.path.exists(filename):
-            try:
-                documents = load_documents_from_file(filename)
-                logging.info(f"Loaded {len(documents)} documents from {filename}")
-            except Exception as e:
-                if 'pickle data was truncated' in str(e):
-                    logging.error(f"File {filename} is corrupted: {e}. Deleting the file and creating a new one.")
-                    os.remove(filename)
-                    documents = process_and_save_initial_documents(topic, num_pages, wiki_url, filename)
-                else:
-                    raise
-        else:
-            documents = process_and_save_initial_documents(topic, num_pages, wiki_url, filename)
+        pages = find_pages(topic, num_pages, wiki_url, crawl_config)
+
+        page_keys = []
+        documents = {}
+        changed = {}
+        for page in pages:
+            key = get_page_key(getattr(page, "title", page))
+            page_keys.append(key)
+            revision_id, content_hash = get_page_revision(page)
+            if manifest.is_current(key, revision_id, content_hash):
+                nodes = load_page_nodes(manifest.initial_path(key))
+                if nodes is not None:
+                    documents[key] = nodes
+                    continue
+            changed[key] = (page, revision_id, content_hash)
+
+        logging.info(f"{len(documents)} pages unchanged, {len(changed)} pages new or changed")
+        for nodes in process_pages([page for page, _, _ in changed.values()], wiki_url, crawl_config):
+            key = nodes[0].metadata["title"]
+            if key not in changed:
+                logging.warning(f"Processed page {key} was not requested, skipping it")
+                continue
+            _, revision_id, content_hash = changed[key]
+            save_documents_to_file(nodes, manifest.initial_path(key))
+            manifest.record_initial(key, revision_id, content_hash)
+            documents[key] = nodes
+        manifest.save()
     except Exception as e:
         logging.error(f"Failed to get initial nodes: {e}")
         raise
-    return documents
+    return [documents[key] for key in dict.fromkeys(page_keys) if key in documents]
+
+
+def find_pages(topic: str, num_pages: int, wiki_url: str, crawl_config: dict = None) -> list:
+    """Find the pages of the topic, read with their revision where possible."""
+    if crawl_config and crawl_config.get("dump_path"):
+        pages = get_dump_pages(topic, num_pages, crawl_config)
+        logging.info(f'dump pages: {[page.title for page in pages]}')
+        return pages
+
+    pages = search_wiki(topic, wiki_url, num_pages)
+    logging.info(f'search results: {pages}')
+    if crawl_config and crawl_config.get("max_depth"):
+        pages = crawl_from_seeds(pages, wiki_url, crawl_config)
+    return prefetch_page_records(pages, wiki_url, crawl_config)
+
+
+def get_dump_pages(topic: str, num_pages: int, crawl_config: dict) -> list:
+    """Read pages of the configured local dump.
+
+    Pages in the configured dump categories are taken, or in the topic as a
+    category name if none are configured. A multistream dump with an index is
+    decompressed in parallel, a plain dump is streamed.
+    """
+    categories = crawl_config.get("dump_categories") or [topic]
+    if crawl_config.get("dump_index_path"):
+        pages = iter_multistream_pages(
+            crawl_config["dump_path"],
+            crawl_config["dump_index_path"],
+            categories=categories,
+            max_workers=crawl_config.get("dump_workers", 4),
+        )
+    else:
+        pages = iter_dump_pages(crawl_config["dump_path"], categories=categories)
+    return list(islice(pages, num_pages))
 
-def process_and_save_initial_documents(topic: str, num_pages: int, wiki_url: str, filename: str) -> list:
-    """Process initial documents and save them to a file."""
-    search_results = search_wiki(topic, wiki_url, num_pages)
-    logging.info(f'search results: {search_results}')
-    documents = []
-    for title in search_results:
-        results = process_page_into_doc_and_nodes(title) 
-        documents.append(results)
-    save_documents_to_file(documents, filename)
-    logging.info(f"Processed and saved {len(documents)} documents")
-    return documents
+
+def crawl_from_seeds(seeds: list, wiki_url: str, crawl_config: dict) -> list:
+    """Expand the seed titles along in-article links within the crawl budgets."""
+    crawled = crawl_link_graph(
+        seeds,
+        max_depth=crawl_config["max_depth"],
+        max_pages=crawl_config.get("max_pages", 100),
+        max_workers=max(1, crawl_config.get("max_workers", 1)),
+        time_budget=crawl_config.get("time_budget"),
+        wiki_url=wiki_url or crawl_config.get("wiki_url"),
+        throttle=HostThrottle(
+            crawl_config.get("max_per_host", 2), crawl_config.get("politeness_delay", 1.0)
+        ),
+    )
+    logging.info(f"Crawled {len(crawled)} pages from {len(seeds)} seeds")
+    return [page.title for page in crawled]
+
+
+def prefetch_page_records(titles: list, wiki_url: str = None, crawl_config: dict = None, throttle=None) -> list:
+    """Replace the titles in the list by page records fetched 50 titles per request.
+
+    Titles the bulk query misses stay as they are and are fetched page by page.
+    """
+    api_titles = [title for title in titles if isinstance(title, str)]
+    if not api_titles:
+        return titles
+    crawl_config = crawl_config or {}
+    throttle = throttle or HostThrottle(
+        crawl_config.get("max_per_host", 2), crawl_config.get("politeness_delay", 1.0)
+    )
+    with throttle.slot(get_api_host(wiki_url or crawl_config.get("wiki_url"))):
+        records = fetch_page_records(api_titles)
+    return [records.get(title, title) if isinstance(title, str) else title for title in titles]
+
+
+def process_pages(titles: list, wiki_url: str = None, crawl_config: dict = None) -> list:
+    """Fetch and build several pages at once, keeping the order of the titles.
+
+    Pages are processed by a bounded worker pool. Every worker takes a slot of
+    the API host before it starts a page and holds it until the page is built,
+    so the per-host limit and politeness delay count pages, not requests: a
+    page still makes its text, html, image info and image requests inside its
+    slot. Pages read from a dump need no API and skip the throttle. The
+    summary, categories and revision of all titles are prefetched 50 titles per
+    request first. A page that fails is logged and left out without aborting
+    the rest of the batch.
+    """
+    crawl_config = crawl_config or {}
+    max_workers = max(1, crawl_config.get("max_workers", 1))
+    throttle = HostThrottle(
+        crawl_config.get("max_per_host", 2), crawl_config.get("politeness_delay", 1.0)
+    )
+    host = get_api_host(wiki_url or crawl_config.get("wiki_url"))
+    titles = prefetch_page_records(titles, wiki_url, crawl_config, throttle)
+
+    def process_title(title):
+        try:
+            if isinstance(title, DumpPage):
+                return process_page_into_doc_and_nodes(title)
+            with throttle.slot(host):
+                return process_page_into_doc_and_nodes(title)
+        except Exception as e:
+            logging.error(f"Failed to process page {title}: {e}")
+            return None
+
+    logging.info(f"Processing {len(titles)} pages with {max_workers} workers")
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(process_title, titles))
+
+    return [result for result in results if result]
 
 
 
 def create_transformed_nodes(
     documents: list, topic: str, pipeline, embed_model
 ) -> list:
-    """Transform and save nodes using the pipeline."""
+    """Transform the nodes of every page, reusing the saved result of unchanged pages.
 
-    clean_topic = sanitise_filename(topic)
-    filename = f'./data/{clean_topic}_pipeline_test'
+    Of a changed page only the new and modified sections, images and tables go
+    through the pipeline, the transformed nodes of the others are kept. The
+    transformed nodes of a page are saved as soon as they are made, so an
+    interrupted run does not pay for the pages it finished again.
+    """
+    manifest = get_manifest(topic)
+    pipeline_transformed_nodes = []
     try:
-        if os.path.exists(filename):
-            try:
-                pipeline_transformed_nodes = load_documents_from_file(filename)
-                logging.info(
-                    f"Loaded {len(pipeline_transformed_nodes)} documents from {filename}"
-                )
-            except Exception as e:
-                if 'pickle data was truncated' in str(e):
-                    logging.error(f"File {filename} is corrupted: {e}. Deleting the file and creating a new one.")
-                    os.remove(filename)
-                    pipeline_transformed_nodes = process_and_save_transformed_documents(documents, filename, pipeline, embed_model)
-                else:
-                    raise
-        else:
-            pipeline_transformed_nodes = process_and_save_transformed_documents(documents, filename, pipeline, embed_model)
+        for doc in documents:
+            key = doc[0].metadata["title"]
+            transformed_nodes = None
+            if manifest.is_transformed(key):
+                transformed_nodes = load_page_nodes(manifest.transformed_path(key))
+            if transformed_nodes is None:
+                logging.info(f"Processing document {key}")
+                # the saved nodes of the previous version of the page, if there is one
+                previous_nodes = load_page_nodes(manifest.transformed_path(key)) or []
+                transformed_nodes = run_pipeline_on_changes(doc, previous_nodes, pipeline, embed_model)
+                save_documents_to_file(transformed_nodes, manifest.transformed_path(key))
+                manifest.record_transformed(key)
+                manifest.save()
+                logging.info(f"Processed and saved {len(transformed_nodes)} nodes of {key}")
+            else:
+                logging.info(f"Loaded {len(transformed_nodes)} transformed nodes of unchanged page {key}")
+            pipeline_transformed_nodes.append(transformed_nodes)
     except Exception as e:
         logging.error(f"Failed to create transformed nodes: {e}")
         raise
     return pipeline_transformed_nodes
 
-def process_and_save_transformed_documents(documents: list, filename: str, pipeline, embed_model) -> list:
-    """Process documents through the pipeline and save them to a file."""
-    logging.info(f"Processing {len(documents)} documents")
-    pipeline_transformed_nodes = []
-    for doc in documents:
-        logging.info(f"Processing document")
-        transformed_nodes = run_pipeline(doc, pipeline, embed_model)
+
+def store_page_nodes(storage_manager, documents: list, pipeline_transformed_nodes: list, topic: str) -> None:
+    """Store the nodes of new and changed pages, keeping the stored nodes that did not change.
+
+    Stored nodes that are gone or changed are deleted and the new and changed
+    nodes stored, unchanged nodes and their vectors are left as they are.
+    """
+    manifest = get_manifest(topic)
+    for doc, transformed_nodes in zip(documents, pipeline_transformed_nodes):
+        key = doc[0].metadata["title"]
+        if manifest.is_stored(key):
+            logging.info(f"Page {key} is unchanged since it was stored")
+            continue
+        previous_nodes = manifest.stored_nodes(key)
+        fingerprints = {node.node_id: get_node_fingerprint(node) for node in transformed_nodes}
+        stale_node_ids = [
+            node_id for node_id, fingerprint in previous_nodes.items()
+            if fingerprints.get(node_id) != fingerprint
+        ]
+        changed_node_ids = {
+            node_id for node_id, fingerprint in fingerprints.items()
+            if previous_nodes.get(node_id) != fingerprint
+        }
+        changed_nodes = [node for node in transformed_nodes if node.node_id in changed_node_ids]
         logging.info(
-            f"Processed and saved {len(transformed_nodes)} documents"
+            f"Page {key}: {len(changed_nodes)} nodes to store, {len(stale_node_ids)} stored nodes to replace, "
+            f"{len(transformed_nodes) - len(changed_nodes)} unchanged"
         )
-        pipeline_transformed_nodes.append(transformed_nodes)
-    save_documents_to_file(pipeline_transformed_nodes, filename)
-    return pipeline_transformed_nodes
+        if stale_node_ids:
+            storage_manager.delete_nodes(stale_node_ids)
+        storage_manager.store_nodes(changed_nodes)
+        # relationships of unchanged nodes to replaced nodes were deleted with them
+        replaced_node_ids = changed_node_ids.intersection(stale_node_ids)
+        unchanged_nodes = [node for node in transformed_nodes if node.node_id not in changed_node_ids]
+        if unchanged_nodes and replaced_node_ids:
+            storage_manager.link_nodes(unchanged_nodes, replaced_node_ids)
+        manifest.record_stored(key, fingerprints)
+        manifest.save()
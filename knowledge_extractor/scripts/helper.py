@@ -19,6 +19,25 @@ def load_env(*keys):
         "GPT4_ENDPOINT": f"{os.getenv('OPENAI_ENDPOINT')}/openai/deployments/{os.getenv('GPT4O_DEPLOYMENT_ID')}/chat/completions?api-version={os.getenv('GPT4O_API_VERSION')}",
         "EMBEDDING_DEPLOYMENT_ID": os.getenv("EMBEDDING_DEPLOYMENT_ID"),
         "EMBEDDING_API_VERSION": os.getenv("EMBEDDING_API_VERSION"),
+        "EMBEDDING_BATCH_MAX_TOKENS": os.getenv("EMBEDDING_BATCH_MAX_TOKENS"),
+        "EMBEDDING_BATCH_MAX_SIZE": os.getenv("EMBEDDING_BATCH_MAX_SIZE"),
+        "EMBEDDING_CONCURRENCY": os.getenv("EMBEDDING_CONCURRENCY"),
+        "EMBEDDING_CACHE_ENABLED": os.getenv("EMBEDDING_CACHE_ENABLED"),
+        "EMBEDDING_CACHE_PATH": os.getenv("EMBEDDING_CACHE_PATH"),
+        "EMBEDDING_CACHE_MAX_MB": os.getenv("EMBEDDING_CACHE_MAX_MB"),
+        "LLM_REQUESTS_PER_MINUTE": os.getenv("LLM_REQUESTS_PER_MINUTE"),
+        "LLM_TOKENS_PER_MINUTE": os.getenv("LLM_TOKENS_PER_MINUTE"),
+        "LLM_MAX_CONCURRENCY": os.getenv("LLM_MAX_CONCURRENCY"),
+        "LLM_CACHE_ENABLED": os.getenv("LLM_CACHE_ENABLED"),
+        "LLM_CACHE_BYPASS": os.getenv("LLM_CACHE_BYPASS"),
+        "LLM_CACHE_PATH": os.getenv("LLM_CACHE_PATH"),
+        "LLM_CACHE_MAX_MB": os.getenv("LLM_CACHE_MAX_MB"),
+        "LLM_CACHE_MAX_AGE_DAYS": os.getenv("LLM_CACHE_MAX_AGE_DAYS"),
+        "IMAGE_PAYLOAD_CACHE_MB": os.getenv("IMAGE_PAYLOAD_CACHE_MB"),
+        "IMAGE_PREPROCESS_WORKERS": os.getenv("IMAGE_PREPROCESS_WORKERS"),
+        "IMAGE_PAYLOAD_LOSSY_FORMAT": os.getenv("IMAGE_PAYLOAD_LOSSY_FORMAT"),
+        "IMAGE_PAYLOAD_QUALITY": os.getenv("IMAGE_PAYLOAD_QUALITY"),
+        "IMAGE_PAYLOAD_MAX_KB": os.getenv("IMAGE_PAYLOAD_MAX_KB"),
         "QDRANT_PORT": os.getenv("QDRANT_PORT"),
         "QDRANT_HOST": os.getenv("QDRANT_HOST"),
         "QDRANT_COLLECTION_NAME": os.getenv("QDRANT_COLLECTION_NAME"),
@@ -29,6 +48,17 @@ def load_env(*keys):
         "COMPUTER_VISION_API_KEY": os.getenv("COMPUTER_VISION_API_KEY"),
         "DOMAIN_TOPIC": os.getenv("DOMAIN_TOPIC"),
         "NUM_WIKI_PAGES": os.getenv("NUM_WIKI_PAGES"),
+        "WIKI_API_URL": os.getenv("WIKI_API_URL"),
+        "CRAWL_MAX_WORKERS": os.getenv("CRAWL_MAX_WORKERS"),
+        "CRAWL_HOST_CONCURRENCY": os.getenv("CRAWL_HOST_CONCURRENCY"),
+        "CRAWL_POLITENESS_DELAY": os.getenv("CRAWL_POLITENESS_DELAY"),
+        "CRAWL_MAX_DEPTH": os.getenv("CRAWL_MAX_DEPTH"),
+        "CRAWL_MAX_PAGES": os.getenv("CRAWL_MAX_PAGES"),
+        "CRAWL_TIME_BUDGET": os.getenv("CRAWL_TIME_BUDGET"),
+        "WIKI_DUMP_PATH": os.getenv("WIKI_DUMP_PATH"),
+        "WIKI_DUMP_INDEX_PATH": os.getenv("WIKI_DUMP_INDEX_PATH"),
+        "WIKI_DUMP_CATEGORIES": os.getenv("WIKI_DUMP_CATEGORIES"),
+        "WIKI_DUMP_WORKERS": os.getenv("WIKI_DUMP_WORKERS"),
     }
     return {key: env_vars[key] for key in keys}
 
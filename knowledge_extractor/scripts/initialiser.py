@@ -3,17 +3,21 @@ from llama_index.embeddings.azure_openai import AzureOpenAIEmbedding
 from llama_index.llms.azure_openai import AzureOpenAI
 from llama_index.core import Settings
 from scripts.storage.storage_manager import StorageManager
+from scripts.llama_ingestionator.transformator import EMBEDDING_BATCH_MAX_SIZE
+from scripts.llama_ingestionator.embedding_cache import cache_embeddings
 
 
 def initialise_embed_model(env_vars):
-    """Initialise the embedding model"""
-    embed_model = AzureOpenAIEmbedding(
+    """Initialise the embedding model, wrapped with the shared embedding cache"""
+    embed_model = cache_embeddings(AzureOpenAIEmbedding(
         model="text-embedding-ada-002",
         deployment_name=env_vars["EMBEDDING_DEPLOYMENT_ID"],
         api_key=env_vars["AZURE_OPENAI_API_KEY"],
         azure_endpoint=env_vars["OPENAI_ENDPOINT"],
         api_version=env_vars["EMBEDDING_API_VERSION"],
-    )
+        # batches are packed by EmbeddingTransformation, don't split them again
+        embed_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+    ))
     Settings.embed_model = embed_model
     return embed_model
 
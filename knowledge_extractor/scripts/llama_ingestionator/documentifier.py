@@ -4,12 +4,6 @@ import os
 # Add the project root to sys.path
 # sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..")))
 
-from scripts.wiki_crawler.navigifier import (
-    get_section_content
-)
-
-from scripts.llama_ingestionator.image_classifier import classify_and_update_image_type
-
 # from transformator import general_summarisor, get_summary
 from scripts.wiki_crawler.data_fetcher import fetch_wiki_data
 from scripts.llama_ingestionator.node_creator import (
@@ -24,6 +18,7 @@ from scripts.llama_ingestionator.node_creator import (
     add_table_node,
     add_reference_node,
     add_citation_node,
+    assign_stable_node_ids,
 )
 import logging
 from scripts.helper import log_duration, sanitise_filename
@@ -57,14 +52,13 @@ def create_main_document(page_title, page_content, document_summary, categories)
 
 
 # create section and subsection nodes
-def process_sections(sections, main_document, document_summary, page):
+def process_sections(sections, main_document, document_summary):
     """ Create Llamaindex nodes for sections and subsections of the wikimedia page
     
     Args:   
-        sections (list): list of tuples containing section title and list of subsections
+        sections (list): list of tuples of indexed Section and list of its subsection Sections
         main_document (Document): the main document representing the Wikimedia page
         document_summary (str): the summary of the Wikimedia page
-        page (MediaWikiPage): the MediaWikiPage object
     
     Returns:
         list: list of LlamaIndex nodes representing the sections and subsections
@@ -77,8 +71,9 @@ def process_sections(sections, main_document, document_summary, page):
     section_node_map = {}
 
     # Process sections
-    for section_title, subsections in sections:
-        section_content = get_section_content(page, section_title)
+    for section, subsections in sections:
+        section_title = section.title
+        section_content = section.text
         if section_content:
             section_metadata = {
                 "title": f"{sanitise_filename(section_title)}",
@@ -101,8 +96,9 @@ def process_sections(sections, main_document, document_summary, page):
             prev_subsection_node = None
 
             # Process subsections
-            for subsection_title in subsections:
-                subsection_content = get_section_content(page, subsection_title)
+            for subsection in subsections:
+                subsection_title = subsection.title
+                subsection_content = subsection.text
                 if subsection_content:
                     subsection_metadata = {
                         "title": f"{sanitise_filename(subsection_title)}",
@@ -131,21 +127,18 @@ def process_images(images, main_document, document_summary):
     logging.info(f"Processing images for main document: {main_document.doc_id}")
     nodes = []
     prev_image_node = None
-    for image in images:
-        logging.info(f"Processing image - classifying: {image['image_name']}")
-        image_type = classify_and_update_image_type(image["image_data"], image['image_name'])
-        if "image" in image_type:
-            image_type = "image"
 
+    # images are classified as image or plot by the image analysis transformation
+    for image in images:
         image_metadata = {
             "title": image["image_name"],
-            "type": image_type,
+            "type": "image",
             "source_page": main_document.metadata["title"],
             "context": document_summary,
             "url": image["image_url"],
         }
         image_node = create_image_node(
-            image_data=image["image_data"], 
+            image_hash=image["image_hash"],
             metadata=image_metadata,
             parent_id=main_document.doc_id,
             source_id=main_document.doc_id
@@ -199,6 +192,7 @@ def process_references(
                 "source_page": main_document.metadata["title"],
                 "type": "citation",
                 "context": document_summary,
+                "url": url,
             }
             citation_node = create_citation_node(
                 url, 
@@ -224,6 +218,7 @@ def process_references(
                     "parent_section": sanitise_filename(section),
                     "source_page": main_document.metadata["title"],
                     "type": "archive-citation",
+                    "url": url,
                 }
                 citation_node = create_citation_node(
                     url,
@@ -256,6 +251,7 @@ def process_wiki_links(
                 "source_page": main_document.metadata["title"],
                 "type": "wiki-ref",
                 "context": document_summary,
+                "url": link[1],
             }
             reference_node = create_reference_node(
                 link[1],
@@ -276,7 +272,7 @@ def process_page_into_doc_and_nodes(page_title):
     """Process a Wikipedia page to create LlamaIndex nodes
 
     Args:
-        page_title (str): the title of the Wikipedia page
+        page_title (str | DumpPage | PageRecord): the title of the Wikipedia page, a page read from a dump or a prefetched page record
 
     Returns:
         list: list of LlamaIndex nodes representing the Wikipedia page
@@ -297,6 +293,7 @@ def process_page_into_doc_and_nodes(page_title):
     ) = fetch_wiki_data(page_title)
 
     logging.info("Wiki data fetched successfully")
+    page_title = getattr(page_title, "title", page_title)
 
     logging.info(f"Creating main document for page: {page_title}")
     document_summary = page.summary
@@ -327,8 +324,11 @@ def process_page_into_doc_and_nodes(page_title):
 
     # Process sections, images, tables, references, and wiki links
     section_nodes, section_node_map = process_sections(
-        sections, main_document, document_summary, page
+        sections, main_document, document_summary
     )
+    # citations and links before the first heading are listed under "Introduction"
+    if intro_content:
+        section_node_map["Introduction"] = intro_node.node_id
     image_nodes = process_images(images, main_document, document_summary)
     table_nodes = process_tables(tables, main_document, document_summary)
     reference_nodes = process_references(
@@ -346,6 +346,8 @@ def process_page_into_doc_and_nodes(page_title):
         + reference_nodes
         + wiki_link_nodes
     )
+    # ids that survive a rebuild let unchanged sections keep their transformed nodes
+    assign_stable_node_ids(all_nodes, main_document.metadata["title"])
     logging.info("All nodes processed successfully")
     logging.info(f"Total nodes created: {len(all_nodes)}")
     return all_nodes
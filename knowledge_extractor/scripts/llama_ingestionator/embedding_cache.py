@@ -0,0 +1,147 @@
+import threading
+from array import array
+from typing import Any
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.bridge.pydantic import Field, PrivateAttr
+from scripts.cache_store import SQLiteCache, make_cache_key
+from scripts.helper import load_env
+
+
+# get env variables
+env_vars = load_env(
+    "EMBEDDING_CACHE_ENABLED",
+    "EMBEDDING_CACHE_PATH",
+    "EMBEDDING_CACHE_MAX_MB",
+)
+
+EMBEDDING_CACHE_ENABLED = (env_vars["EMBEDDING_CACHE_ENABLED"] or "true").lower() not in ("0", "false", "no")
+EMBEDDING_CACHE_PATH = env_vars["EMBEDDING_CACHE_PATH"] or "./data/cache/embeddings.sqlite"
+EMBEDDING_CACHE_MAX_MB = int(env_vars["EMBEDDING_CACHE_MAX_MB"] or 2048)
+
+_embedding_cache = None
+_embedding_cache_lock = threading.Lock()
+
+
+def get_embedding_cache():
+    """Get the process wide embedding cache, None if caching is disabled"""
+    global _embedding_cache
+    if not EMBEDDING_CACHE_ENABLED:
+        return None
+    with _embedding_cache_lock:
+        if _embedding_cache is None:
+            _embedding_cache = SQLiteCache(
+                EMBEDDING_CACHE_PATH, max_bytes=EMBEDDING_CACHE_MAX_MB * 1024 * 1024
+            )
+        return _embedding_cache
+
+
+def get_model_id(embed_model):
+    """Identify the vectors of an embedding model by its class, model name and deployment"""
+    parts = [embed_model.class_name(), embed_model.model_name]
+    deployment = getattr(embed_model, "deployment_name", None)
+    if deployment:
+        parts.append(deployment)
+    return ":".join(parts)
+
+
+def pack_vector(vector):
+    """Store a vector as float32 bytes, 6 KB for a 1536 dimension embedding"""
+    return array("f", vector).tobytes()
+
+
+def unpack_vector(data):
+    vector = array("f")
+    vector.frombytes(data)
+    return vector.tolist()
+
+
+class CachedEmbedding(BaseEmbedding):
+    """Embedding model that keeps the vectors of another model in a persistent cache.
+
+    Vectors are keyed on the model id and the text, so a text is only sent to
+    the wrapped model the first time it is seen, whether by the semantic
+    splitter, the embedding transformation or a later run. Texts missing from
+    the cache are embedded in one batch call of the wrapped model. Without a
+    given cache the shared one is opened on first use.
+    """
+
+    embed_model: BaseEmbedding = Field(description="The wrapped embedding model.")
+    model_id: str = Field(description="Identifies the vectors of the wrapped model in the cache.")
+    _cache: Any = PrivateAttr()
+
+    def __init__(self, embed_model, cache=None, model_id=None, **kwargs):
+        super().__init__(
+            embed_model=embed_model,
+            model_id=model_id or get_model_id(embed_model),
+            model_name=embed_model.model_name,
+            embed_batch_size=embed_model.embed_batch_size,
+            **kwargs,
+        )
+        self._cache = cache
+
+    @classmethod
+    def class_name(cls):
+        return "CachedEmbedding"
+
+    @property
+    def cache(self):
+        if self._cache is None:
+            self._cache = get_embedding_cache()
+        return self._cache
+
+    def _key(self, kind, text):
+        return make_cache_key("embedding", self.model_id, kind, text)
+
+    def _get_cached(self, kind, texts, embed_missing):
+        """Get the vectors of texts from the cache, embedding the missing ones with embed_missing"""
+        vectors = {}
+        for text in texts:
+            if text not in vectors:
+                cached = self.cache.get(self._key(kind, text))
+                vectors[text] = unpack_vector(cached) if cached is not None else None
+
+        missing = [text for text, vector in vectors.items() if vector is None]
+        if missing:
+            for text, vector in zip(missing, embed_missing(missing)):
+                self.cache.set(self._key(kind, text), pack_vector(vector))
+                vectors[text] = vector
+        return [vectors[text] for text in texts]
+
+    def _get_text_embeddings(self, texts):
+        return self._get_cached("text", texts, self.embed_model.get_text_embedding_batch)
+
+    def _get_text_embedding(self, text):
+        return self._get_text_embeddings([text])[0]
+
+    async def _aget_text_embedding(self, text):
+        return self._get_text_embedding(text)
+
+    def _get_query_embedding(self, query):
+        return self._get_cached(
+            "query", [query], lambda queries: [self.embed_model.get_query_embedding(queries[0])]
+        )[0]
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+    def cache_stats(self):
+        """Get the embedding cache counters
+
+        Returns:
+            dict: hits, misses, hit_rate, evictions, entries and bytes of the cache
+        """
+        return self.cache.stats()
+
+
+def cache_embeddings(embed_model):
+    """Wrap an embedding model with the shared embedding cache
+
+    Args:
+        embed_model (BaseEmbedding): the embedding model
+
+    Returns:
+        BaseEmbedding: a CachedEmbedding, or the model itself if caching is disabled
+    """
+    if not EMBEDDING_CACHE_ENABLED:
+        return embed_model
+    return CachedEmbedding(embed_model)
@@ -1,150 +1,135 @@
-from dotenv import load_dotenv
-import requests
-import base64
 from PIL import Image
 import io
 import logging
-from scripts.helper import load_env
-from tenacity import (
-    retry,
-    stop_after_attempt,
-    wait_exponential_jitter,
-    retry_if_exception_type,
-    before_sleep_log,
-    after_log,)
-import time
+import numpy as np
+
+
+# longest side the local classifier measures an image at
+FEATURE_SIZE = 256
+# share of neighbouring pixels with the same colour, high for drawn images and
+# near zero for photos
+PLOT_MIN_FLAT_RATIO = 0.6
+SVG_PLOT_MIN_FLAT_RATIO = 0.4
+IMAGE_MAX_FLAT_RATIO = 0.1
+# entropy in bits of the colours quantised to 4 bits a channel
+PLOT_MAX_COLOUR_ENTROPY = 5.0
+IMAGE_MIN_COLOUR_ENTROPY = 5.5
+# share of the image covered by a light background colour for a plot
+PLOT_MIN_BACKGROUND = 0.4
+LIGHT_COLOUR = 0xC
+# share of sharp edges a plot needs, blank images are left to the model
+PLOT_MIN_EDGE_DENSITY = 0.005
+# width to height ratios past which banners and panoramas are left to the model
+MAX_ASPECT_RATIO = 3.0
+
+
+def extract_image_features(image):
+    """Measure the colour palette and edges of an image
 
+    Args:
+        image (PIL.Image.Image or bytes): the decoded image, or its bytes
 
-load_dotenv()
-
-# get env variables
-env_vars = load_env(
-    "AZURE_OPENAI_API_KEY",
-    "OPENAI_ENDPOINT",
-    "GPT4O_DEPLOYMENT_ID",
-    "GPT4O_API_VERSION",
-)
-
-GPT4_ENDPOINT = f'{env_vars["OPENAI_ENDPOINT"]}/openai/deployments/{env_vars["GPT4O_DEPLOYMENT_ID"]}/chat/completions?api-version={env_vars["GPT4O_API_VERSION"]}'
+    Returns:
+        dict: colour_entropy, background (share and lightness of the most common colour),
+            flat_ratio, edge_density and aspect_ratio of the image
+    """
+    if isinstance(image, bytes):
+        image = Image.open(io.BytesIO(image))
+        image.draft("RGB", (FEATURE_SIZE, FEATURE_SIZE))
+    aspect_ratio = image.size[0] / max(1, image.size[1])
+    image = image.convert("RGBA")
+    image.thumbnail((FEATURE_SIZE, FEATURE_SIZE), Image.BILINEAR)
+    # transparent areas of drawings count as a white background
+    background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+    pixels = np.asarray(Image.alpha_composite(background, image).convert("RGB"), dtype=np.int16)
+
+    quantised = pixels >> 4
+    codes = (quantised[..., 0] << 8) | (quantised[..., 1] << 4) | quantised[..., 2]
+    counts = np.bincount(codes.ravel(), minlength=4096)
+    shares = counts[counts > 0] / codes.size
+    dominant = int(counts.argmax())
+
+    grey = pixels.mean(axis=2)
+    gradient = np.abs(np.diff(grey, axis=1))
+    same_colour = np.all(pixels[:, 1:] == pixels[:, :-1], axis=2)
+    return {
+        "colour_entropy": float(-(shares * np.log2(shares)).sum()),
+        "background_share": float(counts[dominant] / codes.size),
+        "light_background": all(((dominant >> shift) & 0xF) >= LIGHT_COLOUR for shift in (8, 4, 0)),
+        "flat_ratio": float(same_colour.mean()) if same_colour.size else 1.0,
+        "edge_density": float((gradient > 32).mean()) if gradient.size else 0.0,
+        "aspect_ratio": aspect_ratio,
+    }
 
-# set headers
-headers = {
-    "Content-Type": "application/json",
-    "api-key": env_vars["AZURE_OPENAI_API_KEY"],
-}
 
+def classify_image_locally(image, image_url=None):
+    """Classify the confident cases of an image as a plot or an actual image without a request
 
-def resize_image_if_large(base64_image, max_size=(1024, 1024)):
-    """
-    Resize the image if it's larger than the max size while keeping it as PNG.
+    Plots, graphs and diagrams are drawn on a light background with few
+    colours and large flat areas, photos have many colours and almost no two
+    neighbouring pixels alike. SVGs are always drawings, so they are never
+    classified as photos. Anything in between is left to the model.
 
-    args:  
-        base64_image: str - base64 encoded image
-        max_size: tuple - maximum size of the image
+    Args:
+        image (PIL.Image.Image or bytes): the decoded image, or its bytes
+        image_url (str): url the image was downloaded from, to tell SVGs apart
 
     Returns:
-        str: base64 encoded image
+        str: "plot" or "image", None if the image is ambiguous
     """
     try:
-        image_data = base64.b64decode(base64_image)
-
-        with Image.open(io.BytesIO(image_data)) as img:
-            if img.size[0] * img.size[1] > max_size[0] * max_size[1]:
-                img.thumbnail(max_size, Image.LANCZOS)
-
-                # Save the resized image to a bytes buffer
-                buffer = io.BytesIO()
-                img.save(buffer, format="PNG", optimize=True)
+        features = extract_image_features(image)
+    except Exception as e:
+        logging.warning(f"Failed to measure the image for local classification: {e}")
+        return None
+    return classify_image_features(features, image_url)
 
-                resized_image_data = buffer.getvalue()
-                return base64.b64encode(resized_image_data).decode("utf-8")
 
-        return base64_image
+def classify_image_features(features, image_url=None):
+    """Classify the confident cases of an image from its features, see classify_image_locally
 
-    except Exception as e:
-        logging.error(f"Error resizing image: {e}")
-        return base64_image
-
-
-@retry(
-    wait=wait_exponential_jitter(initial=1, max=60),
-    stop=stop_after_attempt(10),
-    retry=retry_if_exception_type(requests.exceptions.RequestException),
-    before_sleep=before_sleep_log(logging, logging.WARNING),
-    after=after_log(logging, logging.ERROR)
-)
-def classify_image(image_data, image_name):
-    """ Classify an image as a plot or an actual image using the AI.
-    
     Args:
-        image_data (str): base64 encoded image
-        image_name (str): name of the image
+        features (dict): the features measured by extract_image_features
+        image_url (str): url the image was downloaded from, to tell SVGs apart
 
     Returns:
-        str: classification of the image
+        str: "plot" or "image", None if the image is ambiguous
     """
+    if not 1 / MAX_ASPECT_RATIO <= features["aspect_ratio"] <= MAX_ASPECT_RATIO:
+        return None
+    is_svg = bool(image_url) and image_url.lower().endswith(".svg")
+    min_flat_ratio = SVG_PLOT_MIN_FLAT_RATIO if is_svg else PLOT_MIN_FLAT_RATIO
+    if (
+        features["light_background"]
+        and features["background_share"] >= PLOT_MIN_BACKGROUND
+        and features["flat_ratio"] >= min_flat_ratio
+        and features["colour_entropy"] <= PLOT_MAX_COLOUR_ENTROPY
+        and features["edge_density"] >= PLOT_MIN_EDGE_DENSITY
+    ):
+        return "plot"
+    if (
+        not is_svg
+        and features["flat_ratio"] <= IMAGE_MAX_FLAT_RATIO
+        and features["colour_entropy"] >= IMAGE_MIN_COLOUR_ENTROPY
+    ):
+        return "image"
+    return None
+
+
+def is_drawn_image(features, image_type=None):
+    """Tell drawn images, plots, diagrams, maps and logos, from photos
+
+    Plots are drawn and confidently classified images are photos. Of the
+    ambiguous images, the ones with at least the flat areas of an SVG plot are
+    taken as drawn.
 
-    payload = {
-        "messages": [
-            {
-                "role": "system",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": "You are an AI assistant that helps people classify images.",
-                    }
-                ],
-            },
-            {
-                "role": "user",
-                "content": [
-                    {
-                        "type": "text",
-                        "text": f"Please classify the following image of {image_name} as either a plot (including plots, graphs, diagrams) or an actual image and output the classification class only.",
-                    },
-                    {
-                        "type": "image_url",
-                        "image_url": {"url": f"data:image/png;base64,{image_data}"},
-                    },
-                ],
-            },
-        ],
-        "temperature": 0.7,
-        "top_p": 0.95,
-        "max_tokens": 800,
-    }
-    response = None
+    Args:
+        features (dict): the features measured by extract_image_features
+        image_type (str): the local classification of the image, None if it is ambiguous
 
-    try:
-        response = requests.post(GPT4_ENDPOINT, headers=headers, json=payload)
-        response.raise_for_status()
-        response_json = response.json()
-        classification = response_json["choices"][0]["message"]["content"]
-
-    except requests.exceptions.RequestException as e:
-        if response is not None:
-            response_json = response.json()
-            if response.status_code == 429:
-                logging.warning("Rate limit exceeded. Retrying...")
-                time.sleep(10)
-            elif response.status_code == 400 and "image is too large" in response.text:
-                logging.warning("Image is too large. Resizing and retrying...")
-                resized_image = resize_image_if_large(image_data)
-                return classify_image(resized_image, image_name)
-            elif response.status_code == 400  and response_json["error"].get("code", "") == "content_filter":
-                logging.warning(
-                    "Image classification was blocked by Azure's content management policy due to potentially sensitive content. Skipping this image."
-                )
-                return "sensitive_image" 
-
-        logging.error(f"Failed to classify the image. Error: {e}")
-        raise
-
-    return classification
-
-
-def classify_and_update_image_type(image_data, image_name):
-    """Classify the image and return the classification."""
-    classification = classify_image(image_data, image_name)
-    logging.info(f"Image classification: {classification}")
-    return classification.lower() if classification else "unknown"
+    Returns:
+        bool: True if the image is drawn
+    """
+    if image_type is not None:
+        return image_type == "plot"
+    return features["flat_ratio"] >= SVG_PLOT_MIN_FLAT_RATIO
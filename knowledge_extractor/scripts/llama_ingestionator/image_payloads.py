@@ -0,0 +1,250 @@
+import base64
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from PIL import Image
+from scripts.cache_store import make_cache_key
+from scripts.helper import load_env
+from scripts.llama_ingestionator.image_classifier import (
+    classify_image_features,
+    extract_image_features,
+    is_drawn_image,
+)
+from scripts.storage.blob_store import load_node_image
+
+
+# get env variables
+env_vars = load_env(
+    "IMAGE_PAYLOAD_CACHE_MB",
+    "IMAGE_PREPROCESS_WORKERS",
+    "IMAGE_PAYLOAD_LOSSY_FORMAT",
+    "IMAGE_PAYLOAD_QUALITY",
+    "IMAGE_PAYLOAD_MAX_KB",
+)
+
+IMAGE_PAYLOAD_CACHE_MB = int(env_vars["IMAGE_PAYLOAD_CACHE_MB"] or 256)
+IMAGE_PREPROCESS_WORKERS = int(env_vars["IMAGE_PREPROCESS_WORKERS"] or os.cpu_count() or 1)
+# format and quality photos are sent in, drawn images are always sent as PNG
+IMAGE_PAYLOAD_LOSSY_FORMAT = (env_vars["IMAGE_PAYLOAD_LOSSY_FORMAT"] or "JPEG").upper()
+IMAGE_PAYLOAD_QUALITY = int(env_vars["IMAGE_PAYLOAD_QUALITY"] or 85)
+# encoded size an image is scaled down until it fits in
+IMAGE_PAYLOAD_MAX_KB = int(env_vars["IMAGE_PAYLOAD_MAX_KB"] or 512)
+# largest image sent to the model, GPT-4o scales anything bigger down anyway
+IMAGE_PAYLOAD_MAX_SIZE = (1024, 1024)
+# smallest side the byte budget scales an image down to, and the scale of each step
+IMAGE_PAYLOAD_MIN_SIZE = 256
+STEP_DOWN_SCALE = 0.75
+
+MIME_TYPES = {"PNG": "image/png", "JPEG": "image/jpeg", "WEBP": "image/webp"}
+
+_payload_cache = None
+_payload_cache_lock = threading.Lock()
+
+
+def encode_image(image, format, quality=IMAGE_PAYLOAD_QUALITY):
+    """Encode an image as PNG or as a lossy JPEG or WebP at the given quality"""
+    buffer = io.BytesIO()
+    if format == "PNG":
+        image.save(buffer, format="PNG")
+        return buffer.getvalue()
+    if image.mode in ("RGBA", "LA") or (image.mode == "P" and "transparency" in image.info):
+        # transparent areas of drawings are shown on white
+        background = Image.new("RGBA", image.size, (255, 255, 255, 255))
+        image = Image.alpha_composite(background, image.convert("RGBA"))
+    image.convert("RGB").save(buffer, format=format, quality=quality)
+    return buffer.getvalue()
+
+
+def encode_image_payload(image_data, max_size=IMAGE_PAYLOAD_MAX_SIZE, max_bytes=None, image_url=None):
+    """Resize image bytes to max size, encode them as a data url for the model and classify them locally
+
+    The local classifier measures the resized image, so the image is decoded
+    once for both. Plots and other drawn images are encoded as PNG and photos
+    in the lossy IMAGE_PAYLOAD_LOSSY_FORMAT, which is several times smaller
+    for them and faster to encode. An image still larger than max_bytes once
+    encoded is scaled down step by step until it fits or reaches
+    IMAGE_PAYLOAD_MIN_SIZE.
+
+    Args:
+        image_data (bytes): the image
+        max_size (tuple): largest width and height of the payload
+        max_bytes (int): largest encoded size, defaults to IMAGE_PAYLOAD_MAX_KB
+        image_url (str): url the image was downloaded from, to tell SVGs apart
+
+    Returns:
+        tuple: the data url sent to the model, and "plot" or "image" if the local
+            classifier is confident about the image, None otherwise
+    """
+    max_bytes = max_bytes or IMAGE_PAYLOAD_MAX_KB * 1024
+    image = Image.open(io.BytesIO(image_data))
+    image.draft(None, max_size)
+    image.thumbnail(max_size, Image.LANCZOS)
+    features = extract_image_features(image)
+    image_type = classify_image_features(features, image_url)
+    format = "PNG" if is_drawn_image(features, image_type) else IMAGE_PAYLOAD_LOSSY_FORMAT
+
+    encoded = encode_image(image, format)
+    while len(encoded) > max_bytes and min(image.size) * STEP_DOWN_SCALE >= IMAGE_PAYLOAD_MIN_SIZE:
+        image = image.resize(
+            (round(image.width * STEP_DOWN_SCALE), round(image.height * STEP_DOWN_SCALE)), Image.LANCZOS
+        )
+        encoded = encode_image(image, format)
+    return f"data:{MIME_TYPES[format]};base64,{base64.b64encode(encoded).decode()}", image_type
+
+
+def image_data_url(image):
+    """Get the data url of an image payload, a bare base64 image is taken as PNG"""
+    return image if image.startswith("data:") else f"data:image/png;base64,{image}"
+
+
+class ImagePayloadCache:
+    """In memory cache of the model-ready payloads of images, least recently used first out.
+
+    Every vision request for an image reuses the payload encoded the first
+    time it was asked for, and the local classification made from the same
+    decoded image, so an image is decoded, resized and encoded once per
+    run. Besides the hits and misses, the CPU time spent encoding and the
+    payload bytes uploaded are counted for each stage.
+    """
+
+    def __init__(self, max_bytes=IMAGE_PAYLOAD_CACHE_MB * 1024 * 1024):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.formats = {}
+        self.stages = {}
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Get the payload and local classification of an image, None on a miss"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def set(self, key, payload, image_type=None):
+        with self._lock:
+            if key in self._entries:
+                self.bytes -= len(self._entries.pop(key)[0])
+            self._entries[key] = (payload, image_type)
+            self.bytes += len(payload)
+            while self.bytes > self.max_bytes and len(self._entries) > 1:
+                _, (evicted, _) = self._entries.popitem(last=False)
+                self.bytes -= len(evicted)
+                self.evictions += 1
+
+    def record(self, stage, **counts):
+        """Add counts to the counters of a stage"""
+        with self._lock:
+            stage_counts = self.stages.setdefault(
+                stage, {"encodes": 0, "encode_seconds": 0.0, "uploads": 0, "upload_bytes": 0}
+            )
+            for name, value in counts.items():
+                stage_counts[name] += value
+
+    def get_or_encode(self, key, load, max_size=IMAGE_PAYLOAD_MAX_SIZE, stage=None, image_url=None):
+        """Get the payload of an image, encoding the bytes returned by load on a miss
+
+        Returns:
+            tuple: the data url payload and the local classification, (None, None) if there is no image
+        """
+        entry = self.get(key)
+        if entry is not None:
+            return entry
+        image_data = load()
+        if image_data is None:
+            return None, None
+        start = time.thread_time()
+        payload, image_type = encode_image_payload(image_data, max_size, image_url=image_url)
+        self.record(stage or "unknown", encodes=1, encode_seconds=time.thread_time() - start)
+        format = payload[len("data:"):payload.index(";")]
+        with self._lock:
+            self.formats[format] = self.formats.get(format, 0) + 1
+        self.set(key, payload, image_type)
+        return payload, image_type
+
+    def stats(self):
+        """Get the payload cache counters
+
+        Returns:
+            dict: hits, misses, evictions, entries and bytes of the cache, the payloads encoded
+                in each format, and for each stage the encodes, their CPU time and the uploads
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "formats": dict(self.formats),
+                "stages": {
+                    stage: {**counts, "encode_seconds": round(counts["encode_seconds"], 3)}
+                    for stage, counts in self.stages.items()
+                },
+            }
+
+
+def get_payload_cache():
+    """Get the process wide image payload cache"""
+    global _payload_cache
+    with _payload_cache_lock:
+        if _payload_cache is None:
+            _payload_cache = ImagePayloadCache()
+        return _payload_cache
+
+
+def get_image_key(node, max_size=IMAGE_PAYLOAD_MAX_SIZE):
+    """Identify the payload of an image node by its image and the payload size"""
+    image = node.metadata.get("image_hash") or node.image or node.image_path or node.node_id
+    return make_cache_key("image_payload", image, *max_size)
+
+
+def get_classified_image_payload(node, max_size=IMAGE_PAYLOAD_MAX_SIZE, stage=None):
+    """Get the model-ready payload of an ImageNode and its local classification, made on first use
+
+    Args:
+        node (ImageNode): the image node
+        max_size (tuple): largest width and height of the payload
+        stage (str): the stage asking for the payload, the encoding time is counted for it
+
+    Returns:
+        tuple: the data url sent to the model, None if the node has no image, and
+            "plot" or "image" if the local classifier is confident about the image
+    """
+    return get_payload_cache().get_or_encode(
+        get_image_key(node, max_size), lambda: load_node_image(node), max_size, stage, node.metadata.get("url")
+    )
+
+
+def get_image_payload(node, max_size=IMAGE_PAYLOAD_MAX_SIZE, stage=None):
+    """Get the model-ready payload of an ImageNode, encoded on first use
+
+    Args:
+        node (ImageNode): the image node
+        max_size (tuple): largest width and height of the payload
+        stage (str): the stage asking for the payload, the encoding time is counted for it
+
+    Returns:
+        str: the data url sent to the model, None if the node has no image
+    """
+    return get_classified_image_payload(node, max_size, stage)[0]
+
+
+def record_image_upload(stage, image):
+    """Count an image payload a stage sent to the model"""
+    get_payload_cache().record(stage, uploads=1, upload_bytes=len(image))
+
+
+def image_payload_stats():
+    """Get the image payload cache counters"""
+    return get_payload_cache().stats()
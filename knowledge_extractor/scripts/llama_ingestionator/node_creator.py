@@ -1,3 +1,7 @@
+import json
+import uuid
+import hashlib
+from collections import Counter
 from llama_index.core import Document
 from llama_index.core.schema import (
     TextNode,
@@ -5,8 +9,12 @@ from llama_index.core.schema import (
     NodeRelationship,
     RelatedNodeInfo,
 )
+from scripts.storage.blob_store import get_blob_store
 
 
+# node types the LLM transformations create new nodes from
+ENRICHED_NODE_TYPES = ["section", "subsection", "image", "plot", "table"]
+
 
 # Create document
 def create_document(title, content, metadata=None):
@@ -22,8 +30,15 @@ def create_text_node(content, metadata=None, parent_id=None, source_id=None):
         node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=source_id)
     return node
 
-def create_image_node(image_data, metadata=None, parent_id=None, source_id=None):
-    node = ImageNode(image=image_data, metadata=metadata)
+def create_image_node(image_hash, metadata=None, parent_id=None, source_id=None):
+    # the node only references the image in the blob store, the bytes are loaded when needed
+    metadata = {**(metadata or {}), "image_hash": image_hash}
+    node = ImageNode(
+        image_path=get_blob_store().path(image_hash),
+        metadata=metadata,
+        excluded_embed_metadata_keys=["image_hash"],
+        excluded_llm_metadata_keys=["image_hash"],
+    )
     if parent_id:
         node.relationships[NodeRelationship.PARENT] = RelatedNodeInfo(node_id=parent_id)
     if source_id:
@@ -183,3 +198,78 @@ def add_citation_node(nodes, node, prev_node):
     prev_node = node
     nodes.append(node)
     return prev_node
+
+
+def get_content_hash(node):
+    """ Hash of the content the transformations of a node read - its image or its text """
+    content = node.metadata.get("image_hash") or node.text or ""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
+
+
+def _remap_related(related, id_map):
+    if isinstance(related, list):
+        return [_remap_related(info, id_map) for info in related]
+    return RelatedNodeInfo(node_id=id_map.get(related.node_id, related.node_id))
+
+
+def assign_stable_node_ids(nodes, page_title):
+    """ Give the nodes of a page ids derived from the page and node titles
+
+    The ids stay the same when the page is built again, so a rebuilt node can
+    be matched with the node it replaces. Nodes the transformations enrich also
+    get the hash of their content, to tell whether they changed.
+
+    Args:
+        nodes (list): all nodes of the page, relationships between them are updated
+        page_title (str): the title of the page
+
+    Returns:
+        list: the same nodes
+    """
+    id_map = {}
+    seen = Counter()
+    for node in nodes:
+        key = f"{page_title}/{node.metadata.get('type', '')}/{node.metadata.get('title', '')}"
+        seen[key] += 1
+        if seen[key] > 1:
+            key = f"{key}/{seen[key]}"
+        id_map[node.node_id] = str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+
+    for node in nodes:
+        node.id_ = id_map[node.node_id]
+        for relationship, related in node.relationships.items():
+            node.relationships[relationship] = _remap_related(related, id_map)
+        if node.metadata.get("type") in ENRICHED_NODE_TYPES:
+            node.metadata["content_hash"] = get_content_hash(node)
+            node.excluded_embed_metadata_keys.append("content_hash")
+            node.excluded_llm_metadata_keys.append("content_hash")
+    return nodes
+
+
+def get_node_fingerprint(node):
+    """ Hash of everything stored for a node, to tell whether a stored node is still current
+
+    Args:
+        node (Node): the node
+
+    Returns:
+        str: sha256 of the node's content, metadata and relationships
+    """
+    relationships = {
+        relationship.name: [
+            info.node_id for info in (related if isinstance(related, list) else [related])
+        ]
+        for relationship, related in node.relationships.items()
+    }
+    fingerprint = {
+        "class": type(node).__name__,
+        "text": getattr(node, "text", None),
+        "image_path": getattr(node, "image_path", None),
+        # the time of the last transformation changes on every run
+        "metadata": {key: value for key, value in node.metadata.items() if key != "last_transformed"},
+        "relationships": relationships,
+        "has_embedding": node.embedding is not None,
+    }
+    return hashlib.sha256(
+        json.dumps(fingerprint, sort_keys=True, default=str).encode("utf-8")
+    ).hexdigest()
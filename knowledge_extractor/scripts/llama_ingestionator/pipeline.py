@@ -1,20 +1,35 @@
+import logging
+from collections import defaultdict
 from scripts.helper import log_duration
 from llama_index.core.ingestion import IngestionPipeline
+from llama_index.core.schema import NodeRelationship
+from scripts.llama_ingestionator.node_creator import ENRICHED_NODE_TYPES
+from scripts.llama_ingestionator.image_payloads import image_payload_stats
+from scripts.llama_ingestionator.request_executor import llm_cache_stats
 from scripts.llama_ingestionator.transformator import (
     TextCleaner,
     SemanticChunkingTransformation,
-    EntityExtractorTransformation,
-    SummaryTransformation,
-    KeyTakeawaysTransformation,
+    SectionEnrichmentTransformation,
     EmbeddingTransformation,
-    ImageDescriptionTransformation,
-    PlotInsightsTransformation,
-    ImageEntitiesTransformation,
+    ImagePreprocessingTransformation,
+    ImageAnalysisTransformation,
     TableAnalysisTransformation
 )
 from llama_index.core import Settings
 
 
+# node types the transformations add, each with the enriched node as its parent
+DERIVED_NODE_TYPES = [
+    "entities",
+    "summary",
+    "key_takeaways",
+    "image_description",
+    "plot_insights",
+    "image_entities",
+    "table_analysis",
+    "chunk",
+]
+
 
 def create_pipeline():
     """Create the ingestion pipeline"""
@@ -22,24 +37,21 @@ def create_pipeline():
     # initialise the transformations
     text_cleaner = TextCleaner()
     semantic_chunking = SemanticChunkingTransformation()
-    entities_extractor = EntityExtractorTransformation()
-    summarisor = SummaryTransformation()
-    key_takeaways = KeyTakeawaysTransformation()
-    image_description = ImageDescriptionTransformation()
-    plot_insights = PlotInsightsTransformation()
-    image_entities = ImageEntitiesTransformation()
+    # entities, summary and key takeaways of a section in one request
+    section_enrichment = SectionEnrichmentTransformation()
+    # model-ready image payloads encoded once and reused by every vision request
+    image_preprocessing = ImagePreprocessingTransformation()
+    # classification, description, entities and plot insights of an image in one request
+    image_analysis = ImageAnalysisTransformation()
     table_analysis = TableAnalysisTransformation()
     embedding = EmbeddingTransformation()
 
     # ingestion pipeline
     pipeline = IngestionPipeline(
         transformations=[
-            entities_extractor,
-            summarisor,
-            key_takeaways,
-            image_description,
-            image_entities,
-            plot_insights,
+            section_enrichment,
+            image_preprocessing,
+            image_analysis,
             table_analysis,
             semantic_chunking,
             text_cleaner,
@@ -53,4 +65,59 @@ def create_pipeline():
 @log_duration
 def run_pipeline(documents, pipeline, embed_model=Settings.embed_model):
     """Run the ingestion pipeline on a list of documents"""
-    return pipeline.run(documents=documents, text_embed_model=embed_model)
+    nodes = pipeline.run(documents=documents, text_embed_model=embed_model)
+    logging.info(f"LLM response cache: {llm_cache_stats()}")
+    logging.info(f"Image payload cache: {image_payload_stats()}")
+    if hasattr(embed_model, "cache_stats"):
+        logging.info(f"Embedding cache: {embed_model.cache_stats()}")
+    return nodes
+
+
+def split_unchanged_nodes(documents, previous_nodes):
+    """Split the nodes of a rebuilt page into nodes to transform and transformed nodes to keep
+
+    A section, image or table with the same id and content hash as in the
+    previous run keeps its transformed node and every node derived from it
+    (entities, summary, chunks, ...) with their embeddings. The kept node takes
+    the relationships of the rebuilt one, as its neighbours may have changed.
+
+    Args:
+        documents (list): the nodes of the rebuilt page
+        previous_nodes (list): the transformed nodes of the previous run of the page
+
+    Returns:
+        tuple: the nodes to run through the pipeline and the transformed nodes kept
+    """
+    previous_by_id = {node.node_id: node for node in previous_nodes}
+    derived_nodes = defaultdict(list)
+    for node in previous_nodes:
+        parent = node.relationships.get(NodeRelationship.PARENT)
+        if parent is not None and node.metadata.get("type") in DERIVED_NODE_TYPES:
+            derived_nodes[parent.node_id].append(node)
+
+    nodes_to_transform = []
+    kept_nodes = []
+    for node in documents:
+        previous = previous_by_id.get(node.node_id)
+        content_hash = node.metadata.get("content_hash")
+        if (
+            node.metadata.get("type") in ENRICHED_NODE_TYPES
+            and previous is not None
+            and content_hash is not None
+            and previous.metadata.get("content_hash") == content_hash
+        ):
+            previous.relationships = node.relationships
+            kept_nodes.append(previous)
+            kept_nodes.extend(derived_nodes[node.node_id])
+        else:
+            nodes_to_transform.append(node)
+    return nodes_to_transform, kept_nodes
+
+
+def run_pipeline_on_changes(documents, previous_nodes, pipeline, embed_model=Settings.embed_model):
+    """Run the ingestion pipeline only on the nodes that changed since the previous run"""
+    nodes_to_transform, kept_nodes = split_unchanged_nodes(documents, previous_nodes)
+    logging.info(
+        f"Transforming {len(nodes_to_transform)} nodes, keeping {len(kept_nodes)} unchanged transformed nodes"
+    )
+    return run_pipeline(nodes_to_transform, pipeline, embed_model) + kept_nodes
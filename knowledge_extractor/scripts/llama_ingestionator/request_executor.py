@@ -0,0 +1,305 @@
+import json
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from llama_index.core.utils import get_tokenizer
+from scripts.cache_store import SQLiteCache, make_cache_key
+from scripts.helper import load_env
+from scripts.wiki_crawler.clientifier import HTTP_CONNECT_TIMEOUT, create_http_session
+
+
+# get env variables
+env_vars = load_env(
+    "AZURE_OPENAI_API_KEY",
+    "GPT4_ENDPOINT",
+    "LLM_REQUESTS_PER_MINUTE",
+    "LLM_TOKENS_PER_MINUTE",
+    "LLM_MAX_CONCURRENCY",
+    "LLM_CACHE_ENABLED",
+    "LLM_CACHE_BYPASS",
+    "LLM_CACHE_PATH",
+    "LLM_CACHE_MAX_MB",
+    "LLM_CACHE_MAX_AGE_DAYS",
+)
+
+GPT4_ENDPOINT = env_vars["GPT4_ENDPOINT"]
+# quota of the deployment, shared by every enrichment and classification request
+LLM_REQUESTS_PER_MINUTE = int(env_vars["LLM_REQUESTS_PER_MINUTE"] or 480)
+LLM_TOKENS_PER_MINUTE = int(env_vars["LLM_TOKENS_PER_MINUTE"] or 80000)
+LLM_MAX_CONCURRENCY = int(env_vars["LLM_MAX_CONCURRENCY"] or 8)
+LLM_READ_TIMEOUT = 120
+LLM_CACHE_ENABLED = (env_vars["LLM_CACHE_ENABLED"] or "true").lower() not in ("0", "false", "no")
+# look up nothing, but still store the fresh responses
+LLM_CACHE_BYPASS = (env_vars["LLM_CACHE_BYPASS"] or "false").lower() in ("1", "true", "yes")
+LLM_CACHE_PATH = env_vars["LLM_CACHE_PATH"] or "./data/cache/llm_responses.sqlite"
+LLM_CACHE_MAX_MB = int(env_vars["LLM_CACHE_MAX_MB"] or 1024)
+LLM_CACHE_MAX_AGE_DAYS = float(env_vars["LLM_CACHE_MAX_AGE_DAYS"] or 90)
+
+# Azure checks the quota over short windows, so at most this many seconds of
+# it are spent at once
+BURST_SECONDS = 10
+# tokens counted for an image sent in high detail at up to 1024x1024
+IMAGE_TOKENS = 765
+# wait after a 429 without a Retry-After header
+DEFAULT_RETRY_AFTER = 10
+
+headers = {
+    "Content-Type": "application/json",
+    "api-key": env_vars["AZURE_OPENAI_API_KEY"],
+}
+
+_session = None
+_rate_limiter = None
+_executor = None
+_llm_cache = None
+_tokens_saved = 0
+_lock = threading.Lock()
+
+
+class TokenBucket:
+    """Bucket refilled evenly with per_minute tokens a minute, holding up to burst_seconds of them"""
+
+    def __init__(self, per_minute, burst_seconds=BURST_SECONDS):
+        self.rate = per_minute / 60
+        self.capacity = max(1, self.rate * burst_seconds)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount, now):
+        """Seconds until amount tokens are available, a request larger than the bucket waits for a full one"""
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        amount = min(amount, self.capacity)
+        return max(0.0, (amount - self.tokens) / self.rate)
+
+    def take(self, amount):
+        self.tokens -= amount
+
+
+class RateLimiter:
+    """Requests per minute and tokens per minute limits shared by all request threads"""
+
+    def __init__(
+        self,
+        requests_per_minute=LLM_REQUESTS_PER_MINUTE,
+        tokens_per_minute=LLM_TOKENS_PER_MINUTE,
+        burst_seconds=BURST_SECONDS,
+    ):
+        self.requests = TokenBucket(requests_per_minute, burst_seconds)
+        self.tokens = TokenBucket(tokens_per_minute, burst_seconds)
+        self.paused_until = 0.0
+        self.lock = threading.Lock()
+
+    def acquire(self, tokens=0):
+        """Block until a request of the given tokens fits in both limits"""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                wait = max(
+                    self.paused_until - now,
+                    self.requests.wait_time(1, now),
+                    self.tokens.wait_time(tokens, now),
+                )
+                if wait <= 0:
+                    self.requests.take(1)
+                    self.tokens.take(tokens)
+                    return
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """Hold back every request for the given seconds, after the API answered 429"""
+        with self.lock:
+            self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+
+def get_rate_limiter():
+    global _rate_limiter
+    with _lock:
+        if _rate_limiter is None:
+            _rate_limiter = RateLimiter()
+        return _rate_limiter
+
+
+def get_llm_session():
+    global _session
+    with _lock:
+        if _session is None:
+            _session = create_http_session(
+                pool_size=LLM_MAX_CONCURRENCY,
+                max_retries=0,
+                timeout=(HTTP_CONNECT_TIMEOUT, LLM_READ_TIMEOUT),
+            )
+        return _session
+
+
+def get_request_executor():
+    global _executor
+    with _lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=LLM_MAX_CONCURRENCY, thread_name_prefix="llm-request"
+            )
+        return _executor
+
+
+def map_concurrently(func, items):
+    """Call func on every item on the shared request threads
+
+    Args:
+        func (callable): function making the requests of one item
+        items (iterable): the items
+
+    Returns:
+        list: the results in the order of the items, the first exception is raised
+    """
+    items = list(items)
+    if not items:
+        return []
+    return list(get_request_executor().map(func, items))
+
+
+def estimate_request_tokens(payload):
+    """Estimate the tokens a chat completion request counts against the quota
+
+    Azure counts the prompt and the max_tokens of the completion when the
+    request is made.
+    """
+    tokenizer = get_tokenizer()
+    tokens = payload.get("max_tokens") or 0
+    for message in payload["messages"]:
+        content = message["content"]
+        if isinstance(content, str):
+            content = [{"type": "text", "text": content}]
+        for part in content:
+            if part["type"] == "text":
+                tokens += len(tokenizer(part["text"]))
+            else:
+                tokens += IMAGE_TOKENS
+    for function in payload.get("functions", []):
+        tokens += len(tokenizer(json.dumps(function)))
+    return tokens
+
+
+def get_retry_after(response):
+    """Seconds the API asks to wait before retrying, None if it doesn't say"""
+    if response is None:
+        return None
+    for header, scale in (("retry-after-ms", 1000), ("Retry-After", 1)):
+        value = response.headers.get(header)
+        if value:
+            try:
+                return float(value) / scale
+            except ValueError:
+                continue
+    return None
+
+
+def wait_retry_after(fallback):
+    """Tenacity wait using the Retry-After of the failed response, or the fallback wait"""
+
+    def wait(retry_state):
+        exception = retry_state.outcome.exception()
+        retry_after = get_retry_after(getattr(exception, "response", None))
+        return retry_after if retry_after is not None else fallback(retry_state)
+
+    return wait
+
+
+def is_content_filtered(exception):
+    """Check if a request failed because Azure's content filter blocked it"""
+    response = getattr(exception, "response", None)
+    if response is None or response.status_code != 400:
+        return False
+    try:
+        return response.json().get("error", {}).get("code", "") == "content_filter"
+    except ValueError:
+        return False
+
+
+def post_chat_completion(payload):
+    """Send a chat completion request to the GPT-4o deployment once the rate limits allow it
+
+    A 429 answer pauses all requests for as long as its Retry-After asks.
+
+    Args:
+        payload (dict): the request body
+
+    Returns:
+        requests.Response: the successful response
+
+    Raises:
+        requests.exceptions.RequestException: if the request failed
+    """
+    rate_limiter = get_rate_limiter()
+    rate_limiter.acquire(estimate_request_tokens(payload))
+    response = get_llm_session().post(GPT4_ENDPOINT, headers=headers, json=payload)
+    if response.status_code == 429:
+        retry_after = get_retry_after(response) or DEFAULT_RETRY_AFTER
+        logging.warning(f"Rate limit exceeded. Pausing requests for {retry_after} seconds")
+        rate_limiter.pause(retry_after)
+    response.raise_for_status()
+    return response
+
+
+def get_llm_cache():
+    """Get the process wide LLM response cache, None if caching is disabled"""
+    global _llm_cache
+    if not LLM_CACHE_ENABLED:
+        return None
+    with _lock:
+        if _llm_cache is None:
+            _llm_cache = SQLiteCache(
+                LLM_CACHE_PATH,
+                max_bytes=LLM_CACHE_MAX_MB * 1024 * 1024,
+                max_age=LLM_CACHE_MAX_AGE_DAYS * 24 * 3600,
+            )
+        return _llm_cache
+
+
+def get_chat_completion(payload, use_cache=True):
+    """Get the chat completion of a request, from the response cache if it was made before
+
+    The cache key is the hash of the deployment endpoint and the whole request,
+    so the prompt, text, image bytes and sampling parameters all take part.
+    Only successful completions are stored.
+
+    Args:
+        payload (dict): the request body
+        use_cache (bool): whether to use the response cache
+
+    Returns:
+        dict: the parsed completion
+
+    Raises:
+        requests.exceptions.RequestException: if the request failed
+    """
+    global _tokens_saved
+    cache = get_llm_cache() if use_cache else None
+    if cache is not None:
+        key = make_cache_key("chat", GPT4_ENDPOINT, json.dumps(payload, sort_keys=True))
+        cached = None if LLM_CACHE_BYPASS else cache.get(key)
+        if cached is not None:
+            response = json.loads(cached)
+            with _lock:
+                _tokens_saved += response.get("usage", {}).get("total_tokens", 0)
+            return response
+
+    response = post_chat_completion(payload).json()
+    if cache is not None and response.get("choices"):
+        cache.set(key, json.dumps(response).encode("utf-8"))
+    return response
+
+
+def llm_cache_stats():
+    """Get the LLM response cache counters
+
+    Returns:
+        dict: the cache statistics plus the tokens the cache hits saved, empty if caching is disabled
+    """
+    cache = get_llm_cache()
+    if cache is None:
+        return {}
+    stats = cache.stats()
+    stats["tokens_saved"] = _tokens_saved
+    return stats
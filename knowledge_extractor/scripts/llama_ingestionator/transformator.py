@@ -1,4 +1,5 @@
 import os
+import json
 import requests
 from llama_index.core.schema import TransformComponent
 import re
@@ -8,7 +9,8 @@ import logging
 from llama_index.embeddings.azure_openai import AzureOpenAIEmbedding
 from llama_index.core.schema import NodeRelationship, RelatedNodeInfo
 from llama_index.core import Settings
-from pydantic import Field
+from llama_index.core.utils import get_tokenizer
+from concurrent.futures import ThreadPoolExecutor
 from tenacity import (
     retry,
     stop_after_attempt,
@@ -18,9 +20,20 @@ from tenacity import (
 )
 import time
 from scripts.helper import load_env, log_duration
-import base64
-from PIL import Image
-import io
+from scripts.llama_ingestionator.image_payloads import (
+    IMAGE_PREPROCESS_WORKERS,
+    get_classified_image_payload,
+    get_image_payload,
+    image_data_url,
+    record_image_upload,
+)
+from scripts.llama_ingestionator.embedding_cache import cache_embeddings
+from scripts.llama_ingestionator.request_executor import (
+    is_content_filtered,
+    get_chat_completion,
+    map_concurrently,
+    wait_retry_after,
+)
 
 
 # get env variables
@@ -32,6 +45,9 @@ env_vars = load_env(
     "GPT4_ENDPOINT",
     "EMBEDDING_DEPLOYMENT_ID",
     "EMBEDDING_API_VERSION",
+    "EMBEDDING_BATCH_MAX_TOKENS",
+    "EMBEDDING_BATCH_MAX_SIZE",
+    "EMBEDDING_CONCURRENCY",
     "COMPUTER_VISION_ENDPOINT",
     "COMPUTER_VISION_API_KEY",
 )
@@ -43,21 +59,22 @@ GPT4O_API_VERSION = env_vars["GPT4O_API_VERSION"]
 GPT4_ENDPOINT = env_vars["GPT4_ENDPOINT"]
 EMBEDDING_DEPLOYMENT_ID = env_vars["EMBEDDING_DEPLOYMENT_ID"]
 EMBEDDING_API_VERSION = env_vars["EMBEDDING_API_VERSION"]
-
-headers = {
-    "Content-Type": "application/json",
-    "api-key": AZURE_OPENAI_API_KEY,
-}
-
-
-# Configure global settings
-Settings.embed_model = AzureOpenAIEmbedding(
+# tokens and texts sent in one embeddings request, and requests sent at once
+EMBEDDING_BATCH_MAX_TOKENS = int(env_vars["EMBEDDING_BATCH_MAX_TOKENS"] or 8191)
+EMBEDDING_BATCH_MAX_SIZE = int(env_vars["EMBEDDING_BATCH_MAX_SIZE"] or 2048)
+EMBEDDING_CONCURRENCY = int(env_vars["EMBEDDING_CONCURRENCY"] or 4)
+
+# Configure global settings, the splitter and the embedding transformation
+# share the cached vectors
+Settings.embed_model = cache_embeddings(AzureOpenAIEmbedding(
     model="text-embedding-ada-002",
     deployment_name=EMBEDDING_DEPLOYMENT_ID,
     api_key=AZURE_OPENAI_API_KEY,
     azure_endpoint=OPENAI_ENDPOINT,
     api_version=EMBEDDING_API_VERSION,
-)
+    # batches are packed by EmbeddingTransformation, don't split them again
+    embed_batch_size=EMBEDDING_BATCH_MAX_SIZE,
+))
 
 
 Settings.text_splitter = SemanticSplitterNodeParser(
@@ -68,26 +85,77 @@ Settings.text_splitter = SemanticSplitterNodeParser(
 )
 
 
+def pack_embedding_batches(texts, max_tokens=None, max_size=None, tokenizer=None):
+    """ Pack texts in order into batches of at most max_size texts and max_tokens tokens
+
+    The limits default to EMBEDDING_BATCH_MAX_TOKENS and EMBEDDING_BATCH_MAX_SIZE,
+    a text longer than max_tokens is sent in a batch of its own.
+    Returns the batches as lists of indices into texts.
+    """
+    max_tokens = max_tokens or EMBEDDING_BATCH_MAX_TOKENS
+    max_size = max_size or EMBEDDING_BATCH_MAX_SIZE
+    tokenizer = tokenizer or get_tokenizer()
+    batches = []
+    batch = []
+    batch_tokens = 0
+    for idx, text in enumerate(texts):
+        num_tokens = len(tokenizer(text))
+        if batch and (batch_tokens + num_tokens > max_tokens or len(batch) >= max_size):
+            batches.append(batch)
+            batch = []
+            batch_tokens = 0
+        batch.append(idx)
+        batch_tokens += num_tokens
+    if batch:
+        batches.append(batch)
+    return batches
+
+
 class EmbeddingTransformation(TransformComponent):
     """ Embedding transformation component to generate embeddings for text and image nodes """
     def __call__(self, documents, text_embed_model, **kwargs):
         logging.info(f"embed model: {text_embed_model}")
         logging.info(f"Processing {len(documents)} nodes")
-        text_embed_model = text_embed_model
+        text_nodes = []
         for doc in documents:
             if doc.metadata.get("needs_embedding"):
-                logging.info(f"Generating embedding for node ID: {doc.metadata['title']}")
                 if isinstance(doc, ImageNode):
-                    embedding = None
                     # uncomment if want to generate image embeddings using Computer Vision API for future work
-                    # embedding = self.get_image_embedding(doc.metadata["url"])
-                    doc.embedding = embedding
+                    # doc.embedding = self.get_image_embedding(doc.metadata["url"])
+                    doc.embedding = None
                 elif isinstance(doc, TextNode):
-                    embedding = text_embed_model.get_text_embedding(doc.text)
-                    doc.embedding = embedding
-                    
+                    text_nodes.append(doc)
+
+        embeddings = self.get_text_embeddings([doc.text for doc in text_nodes], text_embed_model)
+        for doc, embedding in zip(text_nodes, embeddings):
+            doc.embedding = embedding
+
         return documents
 
+    @log_duration
+    def get_text_embeddings(self, texts, text_embed_model, concurrency=EMBEDDING_CONCURRENCY):
+        """ Embed texts in token packed batches, sending up to concurrency batches at once
+
+        The embeddings are returned in the order of the texts.
+        """
+        if not texts:
+            return []
+        batches = pack_embedding_batches(texts)
+        logging.info(f"Generating embeddings for {len(texts)} nodes in {len(batches)} batches")
+
+        def embed_batch(batch):
+            batch_texts = [texts[idx] for idx in batch]
+            if hasattr(text_embed_model, "get_text_embedding_batch"):
+                return text_embed_model.get_text_embedding_batch(batch_texts)
+            return [text_embed_model.get_text_embedding(text) for text in batch_texts]
+
+        embeddings = [None] * len(texts)
+        with ThreadPoolExecutor(max_workers=max(1, min(concurrency, len(batches)))) as executor:
+            for batch, batch_embeddings in zip(batches, executor.map(embed_batch, batches)):
+                for idx, embedding in zip(batch, batch_embeddings):
+                    embeddings[idx] = embedding
+        return embeddings
+
     @retry(
         wait=wait_exponential_jitter(initial=1, max=60),
         stop=stop_after_attempt(10),
@@ -147,12 +215,32 @@ class OpenAIBaseTransformation(TransformComponent):
     """ Base class for OpenAI transformations """
     @log_duration
     @retry(
-        wait=wait_exponential_jitter(initial=1, max=60),
+        wait=wait_retry_after(wait_exponential_jitter(initial=1, max=60)),
         stop=stop_after_attempt(10),
-        retry=retry_if_exception(lambda e: not (isinstance(e, requests.exceptions.RequestException) and e.response is not None and e.response.status_code == 400 and e.response.json().get("error", {}).get("code", "") == "content_filter")),
+        retry=retry_if_exception(lambda e: not is_content_filtered(e)),
     )
-    def openai_request(self, prompt, image=None, text=None, function=None):
-        """ Make a request to OpenAI API """
+    def openai_request(self, prompt, image=None, text=None, function=None, max_tokens=800):
+        """ Make a request to OpenAI API, within the rate limits shared by all transformations """
+
+        payload = self.create_payload(prompt, image=image, text=text, function=function, max_tokens=max_tokens)
+        if image:
+            record_image_upload(type(self).__name__, image)
+        try:
+            return get_chat_completion(payload)
+        except requests.exceptions.RequestException as e:
+            if is_content_filtered(e):
+                logging.error(
+                    "The content was blocked by Azure's content management policy due to potentially sensitive content. Skipping this image."
+                )
+                return None
+            if e.response is not None:
+                logging.error(
+                    f"Request failed with error: {e}. Response content: {e.response.content}"
+                )
+            raise
+
+    def create_payload(self, prompt, image=None, text=None, function=None, max_tokens=800):
+        """ Create the chat completion request body, calling function if given """
 
         user_content = [{"type": "text", "text": prompt}]
 
@@ -163,7 +251,7 @@ class OpenAIBaseTransformation(TransformComponent):
             user_content.append(
                 {
                     "type": "image_url",
-                    "image_url": {"url": f"data:image/png;base64,{image}"},
+                    "image_url": {"url": image_data_url(image)},
                 }
             )
 
@@ -174,34 +262,12 @@ class OpenAIBaseTransformation(TransformComponent):
             ],
             "temperature": 0.7,
             "top_p": 0.95,
-            "max_tokens": 800,
+            "max_tokens": max_tokens,
         }
         if function:
             payload["functions"] = [function]
             payload["function_call"] = {"name": function["name"]}
-
-        response = None
-        try:
-            response = requests.post(GPT4_ENDPOINT, headers=headers, json=payload)
-            response.raise_for_status()
-            return response.json()
-        except requests.exceptions.RequestException as e:
-            response_json = response.json() 
-            if response and response.status_code == 429:
-                logging.warning("Rate limit exceeded. Retrying...")
-                time.sleep(10)
-            
-            if response:
-                logging.error(
-                    f"Request failed with error: {e}. Response content: {response.content}"
-                )
-            if response.status_code == 400 and response_json.get("error", {}).get("code", "") == "content_filter":
-                logging.error(
-                    "The content was blocked by Azure's content management policy due to potentially sensitive content. Skipping this image."
-                )
-                return None
-        
-            raise
+        return payload
 
     def get_response(self, response):
         """ Get response from OpenAI API with logging information of tokens used and estimated cost """
@@ -215,6 +281,18 @@ class OpenAIBaseTransformation(TransformComponent):
             logging.error(f"Failed to retrieve response.")
             return "Transformation failed or unclear"
 
+    def get_function_arguments(self, response):
+        """ Get the arguments of the function call in a response from OpenAI API, None if unreadable """
+        try:
+            token_usage = response["usage"]["total_tokens"]
+            logging.info(f"Tokens used: {token_usage}")
+            cost = self.calculate_cost(token_usage)
+            logging.info(f"Estimated cost: ${cost:.2f}")
+            return json.loads(response["choices"][0]["message"]["function_call"]["arguments"])
+        except (KeyError, IndexError, TypeError, ValueError):
+            logging.error(f"Failed to retrieve function call arguments.")
+            return None
+
     def calculate_cost(self, tokens):
         return tokens * 0.00002
 
@@ -276,197 +354,115 @@ class SemanticChunkingTransformation(TransformComponent):
         return transformed_nodes
 
 
-class EntityExtractorTransformation(OpenAIBaseTransformation):
-    """ Entity extraction transformation component to extract entities from text nodes """
-    function: dict = Field(
-        {
-            "name": "extract_entities",
-            "description": "Extract entities from text and return as structured JSON",
-            "parameters": {
-                "type": "object",
-                "parameters": {
+# entity types of the enrichment and the keys they are grouped under
+ENTITY_GROUPS = {
+    "person": "persons",
+    "organization": "organizations",
+    "location": "locations",
+    "date": "dates",
+}
+
+# function called with the enrichment of a section
+ENRICH_SECTION_FUNCTION = {
+    "name": "enrich_section",
+    "description": "Record the entities, summary and key takeaways of a text",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "entities": {
+                "type": "array",
+                "items": {
                     "type": "object",
                     "properties": {
-                        "persons": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "type": {"type": "string", "default": "person"},
-                                    "name": {"type": "string"},
-                                    "context": {"type": "string"},
-                                },
-                                "required": ["type", "name", "context"],
-                            },
-                        },
-                        "organizations": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "type": {
-                                        "type": "string",
-                                        "default": "organization",
-                                    },
-                                    "name": {"type": "string"},
-                                    "context": {"type": "string"},
-                                },
-                                "required": ["type", "name", "context"],
-                            },
-                        },
-                        "locations": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "type": {"type": "string", "default": "location"},
-                                    "name": {"type": "string"},
-                                    "context": {"type": "string"},
-                                },
-                                "required": ["type", "name", "context"],
-                            },
-                        },
-                        "dates": {
-                            "type": "array",
-                            "items": {
-                                "type": "object",
-                                "properties": {
-                                    "type": {"type": "string", "default": "date"},
-                                    "name": {"type": "string"},
-                                    "context": {"type": "string"},
-                                },
-                                "required": ["type", "name", "context"],
-                            },
-                        },
+                        "type": {"type": "string", "enum": list(ENTITY_GROUPS)},
+                        "name": {"type": "string"},
+                        "context": {"type": "string"},
                     },
-                    "required": ["persons", "organizations", "locations", "dates"],
+                    "required": ["type", "name", "context"],
                 },
             },
+            "summary": {"type": "string"},
+            "key_takeaways": {"type": "array", "items": {"type": "string"}},
         },
-        alias="extract_entities",
-    )
-
-    def __call__(self, documents, **kwargs):
-        entities_nodes = []
-        prompt = (
-            "Extract all entities (persons, organizations, locations, dates) from the following text "
-            "and provide the output in the specified JSON format with type, name, and short description of what the entity represents taken from the text for each entity."
-        )
-        for idx, node in enumerate(documents):
-            logging.info(f"Extracting entities from text node ID: {node.metadata['title']}")
-            if node.metadata.get("type") in ["section", "subsection"]:
-                response = self.openai_request(prompt, text=node.text)
-
-                if response:
-                    entities_json = self.get_response(response)
-
-                    if entities_json:
-                        entity_node = TextNode(
-                            text=entities_json,
-                            metadata={
-                                "title": f"{node.metadata['title']}_entities",
-                                "type": "entities",
-                                "needs_embedding": True,
-                            },
-                        )
-                        entity_node.relationships[NodeRelationship.PARENT] = (
-                            RelatedNodeInfo(node_id=node.node_id)
-                        )
-                        source_id = node.relationships[NodeRelationship.SOURCE].node_id
-                        entity_node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
-                            node_id=source_id
-                        )   
-                        entities_nodes.append(entity_node)
-        logging.info(f"Extracted entities")
-
-        transformed_nodes = documents + entities_nodes
+        "required": ["entities", "summary", "key_takeaways"],
+    },
+}
 
 
-        # to avoid terminating the pipeline if there are no transfromed nodes
-        for node in transformed_nodes:
-            node.metadata["last_transformed"] = str(time.time())
+def group_entities(entities):
+    """ Group entities by type as {"persons": [...], "organizations": [...], ...} """
+    grouped = {group: [] for group in ENTITY_GROUPS.values()}
+    for entity in entities:
+        group = ENTITY_GROUPS.get(entity.get("type"))
+        if group:
+            grouped[group].append(entity)
+    return grouped
 
-        return transformed_nodes
 
+class SectionEnrichmentTransformation(OpenAIBaseTransformation):
+    """ Section enrichment transformation component to extract entities, a summary and key takeaways
+    from text nodes with one request per node.
 
-class SummaryTransformation(OpenAIBaseTransformation):
-    """ Summary transformation component to generate summaries for text nodes """
+    Adds an entities, a summary and a key_takeaways node for every section and subsection,
+    sending the text once for all three.
+    """
     def __call__(self, documents, **kwargs):
-        new_nodes = []
+        entities_nodes = []
+        summary_nodes = []
+        takeaways_nodes = []
+        text_nodes = [node for node in documents if node.metadata.get("type") in ["section", "subsection"]]
+
+        def enrich(node):
+            logging.info(f"Enriching text node ID: {node.metadata['title']}")
+            context = node.metadata.get("context")
+            prompt = (
+                f"Analyse the following text, taking into account given context: {context}. "
+                "Extract all entities (persons, organizations, locations, dates) with type, name, and short description "
+                "of what the entity represents taken from the text for each entity, "
+                "give a brief summary (6 sentences) of the text and a list of key takeaways from the text."
+            )
+            return self.openai_request(prompt, text=node.text, function=ENRICH_SECTION_FUNCTION, max_tokens=2000)
 
-        for idx, node in enumerate(documents):
-            if node.metadata.get("type") in ["section", "subsection"]:
-                logging.info(f"Summarising node ID: {node.node_id}")
-                context = node.metadata.get("context")
-                prompt = (
-                    f"Summarise the following text {node.text}, taking into account given context: {context}"
-                    "as output give a string of a brief summary (6 sentences) of the text."
-                )
+        responses = map_concurrently(enrich, text_nodes)
+        for node, response in zip(text_nodes, responses):
+            if not response:
+                continue
+            enrichment = self.get_function_arguments(response)
+            if not enrichment:
+                continue
 
-                response = self.openai_request(prompt, text=node.text)
-                summary = self.get_response(response)
-                summary_node = TextNode(
-                    text=summary,
+            context = node.metadata.get("context")
+            takeaways = enrichment.get("key_takeaways") or []
+            if isinstance(takeaways, list):
+                takeaways = "\n".join(f"- {takeaway}" for takeaway in takeaways)
+            derived = [
+                (entities_nodes, json.dumps(group_entities(enrichment.get("entities") or [])), "entities", "entities", {}),
+                (summary_nodes, enrichment.get("summary"), "summary", "summary", {"context": context}),
+                (takeaways_nodes, takeaways, "takeaways", "key_takeaways", {"context": context}),
+            ]
+            source_id = node.relationships[NodeRelationship.SOURCE].node_id
+            for new_nodes, text, suffix, node_type, extra_metadata in derived:
+                if not text:
+                    continue
+                new_node = TextNode(
+                    text=text,
                     metadata={
-                        "title": f"{node.metadata['title']}_summary",
-                        "type": "summary",
+                        "title": f"{node.metadata['title']}_{suffix}",
+                        "type": node_type,
                         "needs_embedding": True,
-                        "context": context,
+                        **extra_metadata,
                     },
                 )
-                summary_node.relationships[NodeRelationship.PARENT] = RelatedNodeInfo(
+                new_node.relationships[NodeRelationship.PARENT] = RelatedNodeInfo(
                     node_id=node.node_id
                 )
-                source_id = node.relationships[NodeRelationship.SOURCE].node_id
-                summary_node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
-                    node_id=source_id
-                )
-                new_nodes.append(summary_node)
-
-        transformed_nodes = documents + new_nodes
-
-        # to avoid terminating the pipeline if there are no transfromed nodes
-        for node in transformed_nodes:
-            node.metadata["last_transformed"] = str(time.time())
-
-        return transformed_nodes
-
-
-class KeyTakeawaysTransformation(OpenAIBaseTransformation):
-    """ Key takeaways transformation component to extract key takeaways from text nodes """
-    def __call__(self, documents, **kwargs):
-        new_nodes = []
-
-        for idx, node in enumerate(documents):
-            if node.metadata.get("type") in ["section", "subsection"]:
-                logging.info(f"Extracting key takeaways from text node ID: {node.metadata['title']}")
-                context = node.metadata.get("context")
-                prompt = (
-                    f"Give a list of key takeaways from this text {node.text}, taking into account given context: {context}"
-                    "as output give a string of a list of key takeaways from the text."
-                )
-                response = self.openai_request(prompt, text=node.text)
-                if response:
-                    takeways = self.get_response(response)
-                    takeaways_node = TextNode(
-                        text=takeways,
-                        metadata={
-                            "title": f"{node.metadata['title']}_takeaways",
-                            "type": "key_takeaways",
-                            "needs_embedding": True,
-                            "context": context,
-                        },
-                    )
-                    takeaways_node.relationships[NodeRelationship.PARENT] = RelatedNodeInfo(
-                        node_id=node.node_id
-                    )
-                    source_id = node.relationships[NodeRelationship.SOURCE].node_id
-                    takeaways_node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
+                new_node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
                     node_id=source_id
                 )
-                    new_nodes.append(takeaways_node)
+                new_nodes.append(new_node)
+        logging.info(f"Enriched {len(text_nodes)} text nodes")
 
-        transformed_nodes = documents + new_nodes
+        transformed_nodes = documents + entities_nodes + summary_nodes + takeaways_nodes
 
         # to avoid terminating the pipeline if there are no transfromed nodes
         for node in transformed_nodes:
@@ -475,201 +471,160 @@ class KeyTakeawaysTransformation(OpenAIBaseTransformation):
         return transformed_nodes
 
 
-def resize_image(image_base64, max_size=(1024, 1024)):
-    """ Resize image to max size """
-    image_data = base64.b64decode(image_base64)
-    image = Image.open(io.BytesIO(image_data))
-    image.thumbnail(max_size, Image.LANCZOS)
-
-    buffer = io.BytesIO()
-    image.save(buffer, format="PNG")
-    return base64.b64encode(buffer.getvalue()).decode()
-
+class ImagePreprocessingTransformation(TransformComponent):
+    """ Image preprocessing transformation component to encode the model-ready payload of every image node once.
 
-class ImageDescriptionTransformation(OpenAIBaseTransformation):
-    ''' Image description transformation component to generate descriptions for image nodes '''
+    The payloads are kept in the shared image payload cache, where the vision transformations
+    find them instead of decoding, resizing and encoding the image again for every request.
+    """
     def __call__(self, documents, **kwargs):
-        new_nodes = []
-        total_images = sum(1 for node in documents if isinstance(node, ImageNode) and node.metadata.get("type") == "image")
-        total_plots = sum(1 for node in documents if isinstance(node, ImageNode) and node.metadata.get("type") == "plot")
-        processed_images = 0
-        processed_plots = 0
+        image_nodes = [node for node in documents if isinstance(node, ImageNode) and node.metadata.get("type") in ["image", "plot"]]
+        logging.info(f"Preprocessing {len(image_nodes)} images")
+        # decoding, resizing and encoding release the GIL
+        with ThreadPoolExecutor(max_workers=IMAGE_PREPROCESS_WORKERS) as executor:
+            list(executor.map(lambda node: get_image_payload(node, stage=type(self).__name__), image_nodes))
+        return documents
 
-        for idx, node in enumerate(documents):
-            logging.info(f"Processing documents for image description. Total documents: {len(documents)}")
 
-            if isinstance(node, ImageNode):
-                logging.info(
-                    f"Creating description for image: {node.metadata['title']}"
-                )
-                context = node.metadata.get("context")
-            
-                if node.metadata.get("type") == "image":
-                    prompt = f"""Considering the context for the image: {context}.
-                                 Please describe the image in detail, covering the main elements visible in the picture. 
-                                 Mention the setting, any people or objects of interest, and their interactions or relationships. 
-                                 Highlight any emotions or atmospheres conveyed by the image, and speculate on the context or story behind what is depicted. 
-                                 If certain aspects are unclear, provide a brief description of the elements that are clear and meaningful. 
-                                 If you cannot provide a complete answer, specify which aspects are unclear or missing, and then state "error: unable to provide an answer
-                                 Avoid stating "error: unable to provide answer" unless absolutely no analysis can be provided."""
-                    processed_images += 1
-
-                elif node.metadata.get("type") == "plot":
-                    prompt = f"""Considering the context for the image: {context}. 
-                                 Provide a detailed analysis of the image, identifying and describing any data, labels, or key elements visible.
-                                 Explain the relationships, trends, or patterns depicted.
-                                 If some parts are unclear, summarize the insights that are clear and significant.
-                                 If you cannot provide a complete answer, specify which aspects are unclear or missing, and then state "error: unable to provide an answer
-                                 Avoid stating "error: unable to provide answer" unless absolutely no analysis can be provided.    """
-                    processed_plots += 1
-
-                resised_image = resize_image(node.image)
-                response = self.openai_request(prompt, image=resised_image)
-                if response:
-                    description = self.get_response(response)
-
-                    if "error: unable" not in description:
-                        description_node = TextNode(
-                            text=description,
-                            metadata={
-                                "title": f"{node.metadata['title']}_image_description",
-                                "type": "image_description",
-                                "needs_embedding": True,
-                                "context": context,
-                            },
-                        )
-                        description_node.relationships[NodeRelationship.PARENT] = (
-                            RelatedNodeInfo(node_id=node.node_id)
-                        )
-                        source_id = node.relationships[NodeRelationship.SOURCE].node_id
-                        description_node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
-                         node_id=source_id
-                        )
-                        if node.metadata.get("type") == "image":
-                            logging.info(f"Processed {processed_images} out of {total_images} images")
-                        elif node.metadata.get("type") == "plot":
-                            logging.info(f"Processed {processed_plots} out of {total_plots} plots")
-
-                        new_nodes.append(description_node)
+# function called with the analysis of an image
+ANALYSE_IMAGE_FUNCTION = {
+    "name": "analyse_image",
+    "description": "Record the classification, description, entities and plot insights of an image",
+    "parameters": {
+        "type": "object",
+        "properties": {
+            "classification": {
+                "type": "string",
+                "enum": ["image", "plot"],
+                "description": "plot for plots, graphs, charts and diagrams, image for anything else",
+            },
+            "description": {"type": "string"},
+            "entities": {"type": "string", "description": "Empty for plots"},
+            "plot_insights": {"type": "string", "description": "Empty for images"},
+        },
+        "required": ["classification", "description", "entities", "plot_insights"],
+    },
+}
 
-        transformed_nodes = documents + new_nodes
+# field of the analysis that only images of each type have
+IMAGE_TYPE_FIELDS = {"image": "entities", "plot": "plot_insights"}
 
-        # to avoid terminating the pipeline if there are no transfromed nodes
-        for node in transformed_nodes:
-            node.metadata["last_transformed"] = str(time.time())
+IMAGE_ANALYSIS_INSTRUCTIONS = {
+    "image": """For an image, describe it in detail, covering the main elements visible in the picture, the setting,
+                         any people or objects of interest and their interactions or relationships, and the emotions or atmosphere it conveys.
+                         Then list all important entities present, describing their characteristics and significance within the context.""",
+    "plot": """For a plot, provide a detailed analysis identifying and describing any data, labels, or key elements visible
+                         and the relationships, trends, or patterns depicted. Then summarise the key insights,
+                         identifying the most significant data points and trends, without making things up.""",
+}
 
-        return transformed_nodes
 
-class PlotInsightsTransformation(OpenAIBaseTransformation):
-    ''' Plot insights transformation component to generate insights for plot nodes '''
+def get_analyse_image_function(image_type=None):
+    """ The analyse_image function, asking an image of known type only for the fields of its type """
+    if image_type is None:
+        return ANALYSE_IMAGE_FUNCTION
+    fields = ["description", IMAGE_TYPE_FIELDS[image_type]]
+    return {
+        "name": ANALYSE_IMAGE_FUNCTION["name"],
+        "description": f"Record the description and {fields[1].replace('_', ' ')} of {'a plot' if image_type == 'plot' else 'an image'}",
+        "parameters": {
+            "type": "object",
+            "properties": {field: {"type": "string"} for field in fields},
+            "required": fields,
+        },
+    }
+
+
+def get_image_analysis_prompt(context, image_type=None):
+    """ The image analysis prompt, without the classification step and the other type's instructions if the type is known """
+    if image_type is None:
+        steps = "First classify the image as a plot if it is a plot, graph, chart or diagram, otherwise as an image."
+        instructions = "\n".join([IMAGE_ANALYSIS_INSTRUCTIONS["image"], IMAGE_ANALYSIS_INSTRUCTIONS["plot"]])
+    else:
+        steps = f"The image is {'a plot' if image_type == 'plot' else 'an image'}."
+        instructions = IMAGE_ANALYSIS_INSTRUCTIONS[image_type]
+    return f"""Considering the context for the image: {context}.
+                         {steps}
+                         {instructions}
+                         If some parts are unclear, describe the elements that are clear and meaningful.
+                         If you cannot provide a complete answer, specify which aspects are unclear or missing, and then state "error: unable to provide an answer
+                         Avoid stating "error: unable to provide answer" unless absolutely no analysis can be provided."""
+
+
+class ImageAnalysisTransformation(OpenAIBaseTransformation):
+    """ Image analysis transformation component to classify image nodes and extract their description,
+    entities and plot insights with one request per image.
+
+    The local classifier measures the image decoded for its payload. Images it is confident
+    about keep its classification and are sent without the classification step, asking only
+    for the fields of their type; the model classifies the ambiguous ones. Every image still
+    takes one request, for its description. Sets the type of each image node to image or plot and adds
+    an image_description node and an image_entities or plot_insights node, uploading the image
+    once instead of once for the classification and once per node type.
+    """
     def __call__(self, documents, **kwargs):
-        logging.info(f"Processing documents for plot insights. Total documents: {len(documents)}")
-        new_nodes = []
-        plots_found = False
-
-        for idx, node in enumerate(documents):
-            if isinstance(node, ImageNode) and node.metadata.get("type") == "plot":
-                plots_found = True
-                logging.info(f"Extracting insights for plot: {node.metadata['title']}")
-                context = node.metadata.get("context")
-
-                prompt = f"""
-                Considering the context for the image: {context}. 
-                Please analyse the diagram and summarise the key insights. 
-                Identify the most significant data points and trends shown in the image. 
-                If any information is unclear or missing, provide a brief explanation of the insights that are clear.
-                In case you cannot provide a comprehensive answer, do not make things up. 
-                If you cannot provide a complete answer, specify which aspects are unclear or missing, and then state "error: unable to provide an answer
-                Avoid stating "error: unable to provide answer" unless absolutely no analysis can be provided."""
-
-                resised_image = resize_image(node.image)
-                response = self.openai_request(prompt, image=resised_image)
-                if response:
-                    insights = self.get_response(response)
-
-                    if "error: unable" not in insights:
-                        insights_node = TextNode(
-                            text=insights,
-                            metadata={
-                                "title": f"{node.metadata['title']}_plot_insights",
-                                "type": "plot_insights",
-                                "needs_embedding": True,
-                                "context": context,
-                            },
-                        )
-                        insights_node.relationships[NodeRelationship.PARENT] = (
-                            RelatedNodeInfo(node_id=node.node_id)
-                        )
-                        source_id = node.relationships[NodeRelationship.SOURCE].node_id
-                        insights_node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
-                         node_id=source_id
-                        )
-                        logging.info(f"Processed {idx+1} out of {len(documents)} plots")
-                        new_nodes.append(insights_node)
-            else:
+        description_nodes = []
+        entities_nodes = []
+        insights_nodes = []
+        image_nodes = [
+            node for node in documents
+            if isinstance(node, ImageNode) and node.metadata.get("type") in ["image", "plot"]
+        ]
+
+        def analyse_image(node):
+            logging.info(f"Analysing image: {node.metadata['title']}")
+            # classified from the image decoded for the payload
+            image_payload, local_type = get_classified_image_payload(node, stage=type(self).__name__)
+            prompt = get_image_analysis_prompt(node.metadata.get("context"), local_type)
+            function = get_analyse_image_function(local_type)
+            response = self.openai_request(prompt, image=image_payload, function=function, max_tokens=2000)
+            return local_type, response
+
+        results = map_concurrently(analyse_image, image_nodes)
+        locally_classified = sum(1 for local_type, _ in results if local_type)
+        logging.info(
+            f"Classified {locally_classified} out of {len(image_nodes)} images locally, "
+            f"analysed without the classification step"
+        )
+        for node, (local_type, response) in zip(image_nodes, results):
+            if not response:
+                continue
+            analysis = self.get_function_arguments(response)
+            if not analysis:
                 continue
 
-        if not plots_found:
-            logging.info("No plots found in the documents. Skipping plot insights extraction.")
-            output_docs = documents + new_nodes
-
-            for node in output_docs:
-                node.metadata["last_transformed"] = str(time.time())
-
-            return output_docs
-        
-        else:
-            output_docs = documents + new_nodes
-
-            for node in output_docs:
-                node.metadata["last_transformed"] = str(time.time())
-
-            return output_docs
-
-
-class ImageEntitiesTransformation(OpenAIBaseTransformation):
-    ''' Image entities transformation component to extract entities from image nodes '''
-    def __call__(self, documents, **kwargs):
-        new_nodes = []
-
-        for idx, node in enumerate(documents):
-            if isinstance(node, ImageNode) and node.metadata.get("type") == "image":
-                logging.info(f"Extracting insights for image: {node.metadata['title']}")
-                context = node.metadata.get("context")
-
-                prompt = f"""Given the image, analyze and list all important entities present.
-                    Describe each entity in detail, focusing on their characteristics and significance within the provided context: {context}.
-                    If certain entities or details are unclear, provide as much accurate information as you can about the elements that are clear and meaningful.
-                    Avoid stating "error: unable to provide answer" unless absolutely no analysis can be provided. 
-                    Ensure your response is clear and concise, highlighting any insights or observations, even if they are partial."""
-
-                resised_image = resize_image(node.image)
-                response = self.openai_request(prompt, image=resised_image)
-                if response:
-                    entities = self.get_response(response)
-
-                    if "error: unable" not in entities:
-                        entities_node = TextNode(
-                            text=entities,
-                            metadata={
-                                "title": f"{node.metadata['title']}_image_entities",
-                                "type": "image_entities",
-                                "needs_embedding": True,
-                                "context": context,
-                            },
-                        )
-                        entities_node.relationships[NodeRelationship.PARENT] = (
-                            RelatedNodeInfo(node_id=node.node_id)
-                        )
-                        source_id = node.relationships[NodeRelationship.SOURCE].node_id
-                        entities_node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
-                         node_id=source_id
-                        )
-                        logging.info(f"Processed {idx+1} out of {len(documents)} images")
-
-                        new_nodes.append(entities_node)
+            image_type = local_type or ("plot" if analysis.get("classification") == "plot" else "image")
+            node.metadata["type"] = image_type
+            derived = [(description_nodes, analysis.get("description"), "image_description")]
+            if image_type == "image":
+                derived.append((entities_nodes, analysis.get("entities"), "image_entities"))
+            else:
+                derived.append((insights_nodes, analysis.get("plot_insights"), "plot_insights"))
+
+            context = node.metadata.get("context")
+            source_id = node.relationships[NodeRelationship.SOURCE].node_id
+            for new_nodes, text, node_type in derived:
+                if not text or "error: unable" in text:
+                    continue
+                new_node = TextNode(
+                    text=text,
+                    metadata={
+                        "title": f"{node.metadata['title']}_{node_type}",
+                        "type": node_type,
+                        "needs_embedding": True,
+                        "context": context,
+                    },
+                )
+                new_node.relationships[NodeRelationship.PARENT] = RelatedNodeInfo(
+                    node_id=node.node_id
+                )
+                new_node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
+                    node_id=source_id
+                )
+                new_nodes.append(new_node)
+        logging.info(f"Analysed {len(image_nodes)} images")
 
-        transformed_nodes = documents + new_nodes
+        transformed_nodes = documents + description_nodes + entities_nodes + insights_nodes
 
         # to avoid terminating the pipeline if there are no transfromed nodes
         for node in transformed_nodes:
@@ -683,38 +638,42 @@ class TableAnalysisTransformation(OpenAIBaseTransformation):
     def __call__(self, documents, **kwargs):
         new_nodes = []
 
-        for idx, node in enumerate(documents):
-            if node.metadata.get("type") == "table":
-                logging.info(f"Analysinng table from node: {node.metadata['title']}")
-                context = node.metadata.get("context")
-                prompt = (
-                    f"Analyse the following table data and provide a list of key insights and observations, considering the context: {context}. "
-                     "Please focus on identifying significant trends, patterns, or anomalies, and include any important numerical values that support your analysis. "
-                     "Your output should be a concise and well-structured list of key points, each highlighting an important aspect of the table data. "
-                     "If applicable, include comparisons between different data points or categories and mention any outliers or unexpected results."
-)
+        table_nodes = [node for node in documents if node.metadata.get("type") == "table"]
 
-                response = self.openai_request(prompt, text=node.text)
-                if response:
-                    takeways = self.get_response(response)
-                    takeaways_node = TextNode(
-                        text=takeways,
-                        metadata={
-                            "title": f"{node.metadata['title']}_analysis",
-                            "type": "table_analysis",
-                            "needs_embedding": True,
-                            "context": context,
-                        },
-                    )
-                    takeaways_node.relationships[NodeRelationship.PARENT] = RelatedNodeInfo(
-                        node_id=node.node_id
+        def analyse_table(node):
+            logging.info(f"Analysinng table from node: {node.metadata['title']}")
+            context = node.metadata.get("context")
+            prompt = (
+                f"Analyse the following table data and provide a list of key insights and observations, considering the context: {context}. "
+                 "Please focus on identifying significant trends, patterns, or anomalies, and include any important numerical values that support your analysis. "
+                 "Your output should be a concise and well-structured list of key points, each highlighting an important aspect of the table data. "
+                 "If applicable, include comparisons between different data points or categories and mention any outliers or unexpected results."
+            )
+            return self.openai_request(prompt, text=node.text)
+
+        responses = map_concurrently(analyse_table, table_nodes)
+        for idx, (node, response) in enumerate(zip(table_nodes, responses)):
+            if response:
+                context = node.metadata.get("context")
+                takeways = self.get_response(response)
+                takeaways_node = TextNode(
+                    text=takeways,
+                    metadata={
+                        "title": f"{node.metadata['title']}_analysis",
+                        "type": "table_analysis",
+                        "needs_embedding": True,
+                        "context": context,
+                    },
+                )
+                takeaways_node.relationships[NodeRelationship.PARENT] = RelatedNodeInfo(
+                    node_id=node.node_id
+                )
+                source_id = node.relationships[NodeRelationship.SOURCE].node_id
+                takeaways_node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
+                     node_id=source_id
                     )
-                    source_id = node.relationships[NodeRelationship.SOURCE].node_id
-                    takeaways_node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(
-                         node_id=source_id
-                        )
-                    logging.info(f"Processed {idx+1} out of {len(documents)} tables")
-                    new_nodes.append(takeaways_node)
+                logging.info(f"Processed {idx+1} out of {len(table_nodes)} tables")
+                new_nodes.append(takeaways_node)
 
         transformed_nodes = documents + new_nodes
 
@@ -0,0 +1,141 @@
+import os
+import base64
+import hashlib
+import threading
+import tempfile
+import logging
+from dotenv import load_dotenv
+
+
+# get env variables
+load_dotenv()
+IMAGE_BLOB_STORE_PATH = os.getenv("IMAGE_BLOB_STORE_PATH") or "./data/blobs"
+
+_blob_store = None
+_blob_store_lock = threading.Lock()
+
+
+class BlobStore:
+    """Content addressed store of binary blobs on local disk.
+
+    Every blob is saved once under the sha256 of its bytes, in directories
+    sharded by the first characters of the hash, so the same image found on
+    several pages takes the space of one. Blobs are read whole, with a
+    single read, as every image is decoded in full.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def path(self, blob_hash):
+        """Get the file path of a blob
+
+        Parameters
+            blob_hash : str
+                the sha256 hex digest of the blob
+
+        Returns
+            str
+                the path the blob is stored at
+        """
+        return os.path.join(self.root, blob_hash[:2], blob_hash[2:4], blob_hash)
+
+    def put(self, data):
+        """Store a blob unless it is already stored
+
+        Parameters
+            data : bytes
+                the blob content
+
+        Returns
+            blob_hash : str
+                the sha256 hex digest identifying the blob
+        """
+        blob_hash = hashlib.sha256(data).hexdigest()
+        path = self.path(blob_hash)
+        if os.path.exists(path):
+            return blob_hash
+
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        # write to a temporary file first so readers never see a partial blob
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.error(f"Error storing blob {blob_hash}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        return blob_hash
+
+    def exists(self, blob_hash):
+        return os.path.exists(self.path(blob_hash))
+
+    def get(self, blob_hash):
+        """Read a stored blob
+
+        Parameters
+            blob_hash : str
+                the sha256 hex digest of the blob
+
+        Returns
+            bytes | None
+                the blob content or None if it is not stored
+        """
+        try:
+            with open(self.path(blob_hash), "rb") as f:
+                return f.read()
+        except FileNotFoundError:
+            logging.error(f"Blob not found: {blob_hash}")
+            return None
+
+    def get_base64(self, blob_hash):
+        """Read a stored blob as a base64 string, None if it is not stored"""
+        data = self.get(blob_hash)
+        return base64.b64encode(data).decode("utf-8") if data is not None else None
+
+
+def get_blob_store():
+    """Get the process wide image blob store
+
+    Returns
+        store : BlobStore
+            the store rooted at IMAGE_BLOB_STORE_PATH
+    """
+    global _blob_store
+    with _blob_store_lock:
+        if _blob_store is None:
+            _blob_store = BlobStore(IMAGE_BLOB_STORE_PATH)
+        return _blob_store
+
+
+def load_node_image(node, store=None):
+    """Load the image bytes of an ImageNode
+
+    Nodes created by the crawler hold the hash of their image in the
+    `image_hash` metadata; nodes carrying a base64 image or an image path
+    are read from those instead.
+
+    Parameters
+        node : ImageNode
+            the image node
+        store : BlobStore, optional
+            the store the image is in, defaults to the shared store
+
+    Returns
+        bytes | None
+            the image content or None if the node has no image
+    """
+    blob_hash = node.metadata.get("image_hash")
+    if blob_hash:
+        return (store or get_blob_store()).get(blob_hash)
+    if node.image:
+        return base64.b64decode(node.image)
+    if node.image_path and os.path.exists(node.image_path):
+        with open(node.image_path, "rb") as f:
+            return f.read()
+    return None
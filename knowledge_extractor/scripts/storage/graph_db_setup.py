@@ -107,6 +107,31 @@ class Neo4jClient:
         result = tx.run(query, **node_data)
         return result.single()["neo_node_id"]
 
+    def delete_nodes(self, llama_node_ids):
+        """ Delete nodes and their relationships from the graph db
+
+        Args:
+            llama_node_ids (List[str]): The llama node IDs of the nodes to delete
+
+        Returns:
+            int: The number of deleted nodes
+        """
+        with self.driver.session() as session:
+            deleted = session.execute_write(self._delete_nodes, list(llama_node_ids))
+        logging.info(f"Deleted {deleted} nodes from neo4j")
+        return deleted
+
+    @staticmethod
+    def _delete_nodes(tx, llama_node_ids):
+        """ Delete nodes by llama node ID with CYPHER query """
+        query = """
+        MATCH (n) WHERE n.llama_node_id IN $llama_node_ids
+        DETACH DELETE n
+        RETURN count(n) AS deleted
+        """
+        result = tx.run(query, llama_node_ids=llama_node_ids)
+        return result.single()["deleted"]
+
     def create_relationship(
         self, from_node_id: str, to_node_id: str, relationship_type: str
     ):
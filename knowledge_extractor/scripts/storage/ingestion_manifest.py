@@ -0,0 +1,137 @@
+import os
+import json
+import uuid
+import hashlib
+import logging
+import tempfile
+from scripts.helper import sanitise_filename
+
+
+MANIFEST_FILENAME = "manifest.json"
+# format of the nodes built from a page, bump it when parsing a page gives different nodes
+# 2: tables use their header row as column names and hold numeric columns as numbers
+MANIFEST_VERSION = 2
+
+
+def get_page_key(title):
+    """Get the key a page is recorded under, the sanitised title its document gets"""
+    return sanitise_filename(title)
+
+
+def get_page_revision(page):
+    """Get the revision id and content hash of a page
+
+    Parameters
+        page : str | PageRecord | DumpPage
+            a page title or a page read with its wikitext
+
+    Returns
+        tuple
+            revision id and sha256 of the wikitext, both None for a bare title
+    """
+    wikitext = getattr(page, "wikitext", None)
+    if wikitext is None:
+        return None, None
+    return getattr(page, "revision_id", None), hashlib.sha256(wikitext.encode("utf-8")).hexdigest()
+
+
+class IngestionManifest:
+    """Record of the pages ingested for a topic and what they were built from.
+
+    Every page has an entry with the revision id and content hash its initial
+    nodes were built from. Building the nodes again gives the entry a new
+    version, and the transformed nodes and the stored nodes record the version
+    they were made from, so a changed page is transformed and stored again
+    while an unchanged one is skipped at every stage. The nodes of each page
+    are saved to their own files next to the manifest. Pages recorded under an
+    older MANIFEST_VERSION are built again, their stored nodes are replaced.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.path = os.path.join(root, MANIFEST_FILENAME)
+        self.pages = {}
+        if os.path.exists(self.path):
+            try:
+                with open(self.path, encoding="utf-8") as f:
+                    manifest = json.load(f)
+                self.pages = manifest.get("pages", {})
+            except (OSError, ValueError) as e:
+                logging.error(f"Failed to read manifest {self.path}: {e}. Starting a new one.")
+            else:
+                if manifest.get("version", 1) != MANIFEST_VERSION:
+                    logging.info(f"Manifest {self.path} is from an older version, building every page again.")
+                    for entry in self.pages.values():
+                        entry["content_hash"] = None
+
+    def initial_path(self, key):
+        return os.path.join(self.root, "pages", f"{key}_initial")
+
+    def transformed_path(self, key):
+        return os.path.join(self.root, "pages", f"{key}_transformed")
+
+    def is_current(self, key, revision_id, content_hash):
+        """Check whether the saved initial nodes of a page were built from this revision
+
+        Pages without a known revision are never current.
+        """
+        entry = self.pages.get(key)
+        return (
+            entry is not None
+            and revision_id is not None
+            and content_hash is not None
+            and entry.get("revision_id") == revision_id
+            and entry.get("content_hash") == content_hash
+            and os.path.exists(self.initial_path(key))
+        )
+
+    def is_transformed(self, key):
+        """Check whether the saved transformed nodes were made from the current initial nodes"""
+        entry = self.pages.get(key)
+        return (
+            entry is not None
+            and entry.get("transformed_version") == entry.get("version")
+            and os.path.exists(self.transformed_path(key))
+        )
+
+    def is_stored(self, key):
+        """Check whether the stored nodes were made from the current initial nodes"""
+        entry = self.pages.get(key)
+        return entry is not None and entry.get("stored_version") == entry.get("version")
+
+    def record_initial(self, key, revision_id, content_hash):
+        """Record that the initial nodes of a page were built, giving them a new version"""
+        entry = self.pages.setdefault(key, {})
+        entry.update(
+            revision_id=revision_id,
+            content_hash=content_hash,
+            version=uuid.uuid4().hex,
+        )
+
+    def record_transformed(self, key):
+        entry = self.pages[key]
+        entry["transformed_version"] = entry["version"]
+
+    def record_stored(self, key, node_fingerprints):
+        """Record the ids and fingerprints of the nodes stored for a page, replacing the previous ones"""
+        entry = self.pages[key]
+        entry["stored_version"] = entry["version"]
+        entry["nodes"] = dict(node_fingerprints)
+
+    def stored_nodes(self, key):
+        """Get the node id -> fingerprint of the nodes stored for a page"""
+        return self.pages.get(key, {}).get("nodes", {})
+
+    def save(self):
+        """Write the manifest, replacing the old file only once the new one is complete"""
+        os.makedirs(self.root, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=self.root, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "pages": self.pages}, f, indent=2)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logging.error(f"Failed to save manifest {self.path}: {e}")
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
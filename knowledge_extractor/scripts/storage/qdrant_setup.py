@@ -1,7 +1,7 @@
 from qdrant_client import QdrantClient
 from llama_index.vector_stores.qdrant import QdrantVectorStore
 from llama_index.core import StorageContext
-from qdrant_client.http.models import VectorParams, Distance
+from qdrant_client.http.models import VectorParams, Distance, PointIdsList
 import logging
 from llama_index.core.schema import Node
 
@@ -138,6 +138,24 @@ def add_node_to_qdrant(vector_store, node, neo_node_id, llama_node_id):
         )
 
 
+def delete_nodes_from_qdrant(client, vector_store, llama_node_ids):
+    """Delete the points of nodes from a Qdrant collection.
+
+    Args:
+        client (QdrantClient): The Qdrant client
+        vector_store (QdrantVectorStore): The vector store the points are in
+        llama_node_ids (List[str]): The LLAMA node IDs the points were added with
+
+    Returns:
+        None
+    """
+    client.delete(
+        collection_name=vector_store.collection_name,
+        points_selector=PointIdsList(points=list(llama_node_ids)),
+    )
+    logging.info(f"Deleted {len(llama_node_ids)} points from Qdrant collection {vector_store.collection_name}.")
+
+
 def verify_qdrant(client, collection_name):
     """Verify that the Qdrant client is connected and the collection exists."""
     collections = client.get_collections()
@@ -1,7 +1,7 @@
 from llama_index.core.schema import Document, ImageNode, TextNode
 import logging
 from scripts.storage.graph_db_setup import Neo4jClient
-from scripts.storage.qdrant_setup import setup_qdrant_client, add_node_to_qdrant
+from scripts.storage.qdrant_setup import setup_qdrant_client, add_node_to_qdrant, delete_nodes_from_qdrant
 from llama_index.core import Settings
 import time
 
@@ -116,5 +116,30 @@ class StorageManager:
         # Add nodes with embeddings to Qdrant
         self.add_nodes_to_qdrant(nodes, id_map)
 
+    def link_nodes(self, nodes, related_node_ids):
+        """Create the relationships of stored nodes to the given nodes again.
+
+        Args:
+            nodes (List[Node]): The stored nodes whose relationships are created
+            related_node_ids (Set[str]): The llama node IDs of the related nodes to link to
+        """
+        for node in nodes:
+            for relationship, related_node_info in node.relationships.items():
+                if related_node_info.node_id in related_node_ids:
+                    self.neo4j_client.create_relationship(
+                        related_node_info.node_id, node.node_id, relationship.name
+                    )
+
+    def delete_nodes(self, llama_node_ids):
+        """Delete nodes from Neo4j and their embeddings from Qdrant.
+
+        Args:
+            llama_node_ids (List[str]): The llama node IDs of the nodes to delete
+        """
+        self.neo4j_client.delete_nodes(llama_node_ids)
+        # the node may be in either collection, deleting a missing point is a no-op
+        for vector_store in (self.text_vector_store, self.image_vector_store):
+            delete_nodes_from_qdrant(self.qdrant_client, vector_store, llama_node_ids)
+
     def close(self):
         self.neo4j_client.close()
@@ -0,0 +1,323 @@
+import re
+import logging
+from collections import namedtuple
+from urllib.parse import urljoin
+import pandas as pd
+from lxml import etree
+from lxml import html as lxml_html
+
+
+DEFAULT_BASE_URL = "https://en.wikipedia.org"
+
+# everything found in one walk over the page html
+PageAnalysis = namedtuple(
+    "PageAnalysis", ["tables", "links", "cite_notes", "references", "captions"]
+)
+
+LINK_COLUMNS = ["section", "text", "url"]
+CITE_NOTE_COLUMNS = ["section", "note_id", "label"]
+REFERENCE_COLUMNS = ["note_id", "number", "title", "url", "archived_urls", "text"]
+CAPTION_COLUMNS = ["section", "image_url", "file_url", "caption"]
+
+HEADING_TAGS = {"h2", "h3", "h4", "h5", "h6"}
+# containers whose links are not in-text links of the section
+SKIPPED_CLASSES = {"infobox", "navbox", "toc", "mw-editsection", "reflist", "references", "noprint", "metadata"}
+FILE_LINK_CLASSES = {"image", "mw-file-description"}
+WHITESPACE_PATTERN = re.compile(r"\s+")
+NUMBER_PATTERN = re.compile(r"^[-+]?\d[\d,]*(\.\d+)?$")
+
+
+def _classes(element):
+    return set((element.get("class") or "").split())
+
+
+def _clean_text(text):
+    return WHITESPACE_PATTERN.sub(" ", text).strip()
+
+
+def _visible_text(element):
+    """Text of an element without footnote markers and style blocks"""
+    parts = element.xpath(
+        ".//text()[not(ancestor::sup[contains(@class, 'reference')])"
+        " and not(ancestor::style) and not(ancestor::*[contains(@class, 'mw-editsection')])]"
+    )
+    return _clean_text("".join(parts))
+
+
+def _heading_title(element):
+    headline = element.find(".//span[@class='mw-headline']")
+    if headline is not None:
+        return _clean_text(headline.text_content())
+    return _visible_text(element)
+
+
+def _table_rows(table):
+    return table.xpath("./tr | ./thead/tr | ./tbody/tr | ./tfoot/tr")
+
+
+def _span(cell, name):
+    try:
+        return max(1, int(cell.get(name, 1)))
+    except ValueError:
+        return 1
+
+
+def expand_table(table):
+    """Lay the cells of an html table out on a grid honouring colspan and rowspan
+
+    Parameters
+        table : lxml.html.HtmlElement
+            the table element
+
+    Returns
+        tuple
+            list of rows of cell texts and list of flags telling which rows are header rows
+    """
+    grid = []
+    header_rows = []
+    # column index -> [rows left, text] for cells spanning down from earlier rows
+    spanning = {}
+
+    for row in _table_rows(table):
+        cells = row.xpath("./td | ./th")
+        values = []
+        col = 0
+
+        def fill_spanning():
+            nonlocal col
+            while col in spanning:
+                rows_left, text = spanning[col]
+                values.append(text)
+                if rows_left <= 1:
+                    del spanning[col]
+                else:
+                    spanning[col][0] = rows_left - 1
+                col += 1
+
+        for cell in cells:
+            fill_spanning()
+            text = _visible_text(cell)
+            rowspan = _span(cell, "rowspan")
+            for _ in range(_span(cell, "colspan")):
+                values.append(text)
+                if rowspan > 1:
+                    spanning[col] = [rowspan - 1, text]
+                col += 1
+        # cells spanning down past the end of a shorter row
+        while any(spanning_col >= col for spanning_col in spanning):
+            if col in spanning:
+                fill_spanning()
+            else:
+                values.append(None)
+                col += 1
+
+        if values:
+            grid.append(values)
+            header_rows.append(all(cell.tag == "th" for cell in cells) and bool(cells))
+
+    return grid, header_rows
+
+
+def _typed_column(values):
+    """Convert a column to numbers if every non-empty value is a number"""
+    non_empty = [value for value in values if value not in (None, "")]
+    if non_empty and all(NUMBER_PATTERN.match(value) for value in non_empty):
+        numbers = [
+            float(value.replace(",", "")) if value not in (None, "") else None
+            for value in values
+        ]
+        if all(number is None or number.is_integer() for number in numbers) and None not in numbers:
+            return pd.array([int(number) for number in numbers], dtype="int64")
+        return pd.array(numbers, dtype="float64")
+    return pd.array(values, dtype="string")
+
+
+def table_to_dataframe(table):
+    """Convert a wikitable element to a typed DataFrame
+
+    Parameters
+        table : lxml.html.HtmlElement
+            the table element
+
+    Returns
+        df : pd.DataFrame
+            the table with the leading header row as columns and numeric columns as numbers
+    """
+    grid, header_rows = expand_table(table)
+    if not grid:
+        return pd.DataFrame()
+
+    width = max(len(row) for row in grid)
+    grid = [row + [None] * (width - len(row)) for row in grid]
+
+    columns = list(range(width))
+    if header_rows[0] and len(grid) > 1:
+        columns = []
+        for idx, name in enumerate(grid[0]):
+            name = name or f"column_{idx}"
+            columns.append(name if name not in columns else f"{name}_{idx}")
+        grid = grid[1:]
+
+    # drop empty rows and columns before building the frame
+    grid = [row for row in grid if any(value is not None for value in row)]
+    kept_columns = [
+        idx for idx in range(width) if any(row[idx] is not None for row in grid)
+    ]
+    return pd.DataFrame(
+        {columns[idx]: _typed_column([row[idx] for row in grid]) for idx in kept_columns}
+    )
+
+
+def _parse_reference_item(item, base_url):
+    """Get the note id, title and links of an entry in the reference list"""
+    note_id = item.get("id", "")
+    links = []
+    title = None
+    for link in item.iter("a"):
+        href = link.get("href", "")
+        if not href or href.startswith("#"):
+            continue
+        links.append(urljoin(base_url, href) if href.startswith("/") else href)
+        if title is None:
+            title = _clean_text(link.text_content())
+    text_parts = item.xpath(".//text()[not(ancestor::*[contains(@class, 'mw-cite-backlink')])]")
+    return {
+        "note_id": note_id,
+        "number": note_id.split("-")[-1] if note_id else "",
+        "title": title or "",
+        "url": links[0] if links else "",
+        "archived_urls": links[1:],
+        "text": _clean_text("".join(text_parts)),
+    }
+
+
+def _caption_record(element, section, base_url):
+    caption = element.find(".//figcaption")
+    if caption is None:
+        caption = element.find(".//div[@class='thumbcaption']")
+    image = element.find(".//img")
+    file_link = element.find(".//a[@href]")
+    if caption is None or image is None:
+        return None
+    return {
+        "section": section,
+        "image_url": urljoin("https:", image.get("src", "")),
+        "file_url": urljoin(base_url, file_link.get("href")) if file_link is not None else "",
+        "caption": _visible_text(caption),
+    }
+
+
+def analyse_page_html(page_html, base_url=DEFAULT_BASE_URL, page_url=""):
+    """Walk the page html once and collect everything the crawler needs from it
+
+    Parameters
+        page_html : str
+            the html content of the page
+        base_url : str, optional
+            base url of the wiki used for relative links
+        page_url : str, optional
+            url of the page used for links to anchors on the page
+
+    Returns
+        PageAnalysis
+            tables : list of typed DataFrames of the wikitables
+            links : DataFrame of in-text links (section, text, url)
+            cite_notes : DataFrame of citation markers (section, note_id, label)
+            references : DataFrame of reference list entries
+                (note_id, number, title, url, archived_urls, text)
+            captions : DataFrame of image captions (section, image_url, file_url, caption)
+
+    Note
+        section is None for content before the first heading
+    """
+    tables, links, cite_notes, references, captions = [], [], [], [], []
+
+    if page_html and page_html.strip():
+        try:
+            root = lxml_html.fromstring(page_html)
+        except (etree.ParserError, ValueError) as e:
+            logging.error(f"Failed to parse page HTML: {e}")
+            root = None
+    else:
+        root = None
+
+    section = None
+    skipped = []
+
+    if root is not None:
+        for event, element in etree.iterwalk(root, events=("start", "end")):
+            if not isinstance(element.tag, str):
+                continue
+            if event == "end":
+                if skipped and skipped[-1] is element:
+                    skipped.pop()
+                continue
+
+            tag = element.tag
+            classes = _classes(element)
+
+            if tag in HEADING_TAGS:
+                section = _heading_title(element) or section
+                skipped.append(element)
+                continue
+
+            if tag == "ol" and "references" in classes:
+                for item in element.xpath("./li"):
+                    references.append(_parse_reference_item(item, base_url))
+                skipped.append(element)
+                continue
+
+            if tag == "table" and "wikitable" in classes:
+                tables.append(table_to_dataframe(element))
+
+            if tag == "figure" or (tag == "div" and "thumb" in classes):
+                record = _caption_record(element, section, base_url)
+                if record:
+                    captions.append(record)
+
+            if tag == "sup" and "reference" in classes:
+                for link in element.iter("a"):
+                    href = link.get("href", "")
+                    if href.startswith("#cite_note"):
+                        cite_notes.append({
+                            "section": section,
+                            "note_id": href[1:],
+                            "label": _clean_text(link.text_content()).strip("[]"),
+                        })
+                skipped.append(element)
+                continue
+
+            if skipped:
+                continue
+
+            if classes & SKIPPED_CLASSES or element.get("role") == "navigation":
+                skipped.append(element)
+                continue
+
+            if tag == "a":
+                href = element.get("href", "")
+                if not href or classes & FILE_LINK_CLASSES or "/wiki/File:" in href:
+                    continue
+                if href.startswith("#"):
+                    url = f"{page_url}{href}"
+                elif href.startswith("//"):
+                    url = f"https:{href}"
+                else:
+                    url = urljoin(base_url, href)
+                links.append({
+                    "section": section,
+                    "text": _clean_text(element.text_content()) or href,
+                    "url": url,
+                })
+
+    return PageAnalysis(
+        tables=tables,
+        links=pd.DataFrame(links, columns=LINK_COLUMNS).astype({"text": "string", "url": "string"}),
+        cite_notes=pd.DataFrame(cite_notes, columns=CITE_NOTE_COLUMNS).astype({"note_id": "string", "label": "string"}),
+        references=pd.DataFrame(references, columns=REFERENCE_COLUMNS).astype(
+            {"note_id": "string", "number": "string", "title": "string", "url": "string", "text": "string"}
+        ),
+        captions=pd.DataFrame(captions, columns=CAPTION_COLUMNS).astype(
+            {"image_url": "string", "file_url": "string", "caption": "string"}
+        ),
+    )
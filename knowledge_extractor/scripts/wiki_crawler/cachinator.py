@@ -0,0 +1,226 @@
+from mediawiki import MediaWiki
+import os
+import json
+import time
+import threading
+from dotenv import load_dotenv
+from scripts.cache_store import SQLiteCache, make_cache_key
+
+
+# get env variables
+load_dotenv()
+WIKI_CACHE_ENABLED = os.getenv("WIKI_CACHE_ENABLED", "true").lower() not in ("0", "false", "no")
+WIKI_CACHE_PATH = os.getenv("WIKI_CACHE_PATH") or "./data/cache/wiki_responses.sqlite"
+WIKI_CACHE_MAX_MB = int(os.getenv("WIKI_CACHE_MAX_MB") or 512)
+# how long a checked revision id is trusted before asking the API again
+WIKI_CACHE_REVALIDATE_SECONDS = int(os.getenv("WIKI_CACHE_REVALIDATE_SECONDS") or 6 * 3600)
+# how long responses that are not tied to a page (search, site info) are kept
+WIKI_CACHE_TTL_SECONDS = int(os.getenv("WIKI_CACHE_TTL_SECONDS") or 24 * 3600)
+
+# request parameters that tie a response to specific pages
+PAGE_SCOPE_PARAMS = ("titles", "pageids", "page", "pageid")
+
+_wiki_cache = None
+_wiki_cache_lock = threading.Lock()
+
+
+def get_wiki_cache():
+    """Get the process wide wiki response cache
+
+    Returns
+        cache : SQLiteCache | None
+            the shared cache, None if caching is disabled
+    """
+    global _wiki_cache
+    if not WIKI_CACHE_ENABLED:
+        return None
+    with _wiki_cache_lock:
+        if _wiki_cache is None:
+            _wiki_cache = SQLiteCache(
+                WIKI_CACHE_PATH, max_bytes=WIKI_CACHE_MAX_MB * 1024 * 1024
+            )
+        return _wiki_cache
+
+
+def get_page_scope(params):
+    """Get the page parameter a request is scoped to
+
+    Parameters
+        params : dict
+            the request parameters
+
+    Returns
+        scope : tuple | None
+            (parameter name, value) or None if the request is not about a page
+    """
+    for name in PAGE_SCOPE_PARAMS:
+        if params.get(name) not in (None, ""):
+            return name, str(params[name])
+    return None
+
+
+def get_revision_signature(response):
+    """Get the revision ids of all pages in an API response
+
+    Parameters
+        response : dict
+            the parsed API response
+
+    Returns
+        signature : str | None
+            the revision ids joined by "|" or None if any page lacks one
+    """
+    if not isinstance(response, dict):
+        return None
+    pages = response.get("query", {}).get("pages")
+    if not isinstance(pages, dict) or not pages:
+        return None
+    revisions = []
+    for page in pages.values():
+        revid = page.get("lastrevid")
+        if revid is None and page.get("revisions"):
+            revid = page["revisions"][0].get("revid")
+        if revid is None:
+            return None
+        revisions.append(str(revid))
+    return "|".join(sorted(revisions))
+
+
+class PooledMediaWiki(MediaWiki):
+    """MediaWiki client that sends its requests through a given session.
+
+    The session is shared with other clients and is never closed or replaced
+    by the client, so its pooled connections are kept across clients. It
+    carries the client's user agent, as the session it replaces would have.
+    """
+
+    def __init__(self, *args, session=None, **kwargs):
+        self._shared_session = session
+        super().__init__(*args, **kwargs)
+
+    def _reset_session(self):
+        if self._shared_session is None:
+            return super()._reset_session()
+        self._session = self._shared_session
+        self._session.headers["User-Agent"] = self.user_agent
+        self._is_logged_in = False
+
+
+class CachedMediaWiki(PooledMediaWiki):
+    """MediaWiki client that keeps API responses in a persistent cache.
+
+    Responses about pages are stored with the revision ids of those pages and
+    are only served again while the revision is unchanged. Revision ids come
+    for free from responses that already carry them (the page load asks for
+    `info`) and otherwise from a light `prop=info` query; a checked revision is
+    trusted for `revalidate_after` seconds. Responses that are not about a page
+    (search, site info) simply expire after `ttl` seconds.
+    """
+
+    def __init__(
+        self,
+        *args,
+        cache=None,
+        revalidate_after=WIKI_CACHE_REVALIDATE_SECONDS,
+        ttl=WIKI_CACHE_TTL_SECONDS,
+        **kwargs,
+    ):
+        self.response_cache = cache
+        self.revalidate_after = revalidate_after
+        self.ttl = ttl
+        self.revalidations = 0
+        self.stale = 0
+        super().__init__(*args, **kwargs)
+
+    def _get_response(self, params):
+        """Serve the request from the cache if still valid, else from the API"""
+        if self.response_cache is None or params.get("action") not in (None, "query", "parse"):
+            return super()._get_response(params)
+
+        key = make_cache_key("response", self._api_url, json.dumps(params, sort_keys=True))
+        scope = get_page_scope(params)
+        cached = self.response_cache.get(key)
+        if cached is not None:
+            entry = json.loads(cached)
+            if self._is_valid(entry, scope):
+                return entry["body"]
+            self.stale += 1
+
+        response = super()._get_response(params)
+        if not response or "error" in response:
+            return response
+
+        revision = get_revision_signature(response) if scope else None
+        if scope and revision is not None:
+            self._remember_revision(scope, revision)
+        elif scope:
+            revision = self._current_revision(scope)
+        entry = {"body": response, "revision": revision, "stored_at": time.time()}
+        self.response_cache.set(key, json.dumps(entry).encode("utf-8"))
+        return response
+
+    def _is_valid(self, entry, scope):
+        if scope is None:
+            return time.time() - entry["stored_at"] < self.ttl
+        revision = entry.get("revision")
+        return revision is not None and revision == self._current_revision(scope)
+
+    def _revision_key(self, scope):
+        return make_cache_key("revision", self._api_url, *scope)
+
+    def _remember_revision(self, scope, revision):
+        value = {"revision": revision, "checked_at": time.time()}
+        self.response_cache.set(self._revision_key(scope), json.dumps(value).encode("utf-8"))
+
+    def _current_revision(self, scope):
+        """Get the current revision signature of the pages a request is about"""
+        cached = self.response_cache.get(self._revision_key(scope), record_stats=False)
+        if cached is not None:
+            value = json.loads(cached)
+            if time.time() - value["checked_at"] < self.revalidate_after:
+                return value["revision"]
+
+        name, value = scope
+        title_param = "pageids" if name in ("pageids", "pageid") else "titles"
+        info_params = {
+            "action": "query",
+            "format": "json",
+            "prop": "info",
+            "redirects": "",
+            title_param: value,
+        }
+        self.revalidations += 1
+        revision = get_revision_signature(super()._get_response(info_params))
+        if revision is not None:
+            self._remember_revision(scope, revision)
+        return revision
+
+    def cache_stats(self):
+        """Get the cache counters of this client
+
+        Returns
+            dict
+                the response cache statistics plus revision checks and stale entries
+        """
+        stats = self.response_cache.stats() if self.response_cache is not None else {}
+        stats.update({"revalidations": self.revalidations, "stale": self.stale})
+        return stats
+
+
+def create_wiki_client(session=None, **kwargs):
+    """Create a MediaWiki client backed by the shared response cache
+
+    Parameters
+        session : requests.Session, optional
+            session the client sends its requests through, a new one if not given
+        kwargs : dict
+            arguments passed on to the MediaWiki constructor
+
+    Returns
+        wikipedia : MediaWiki
+            a CachedMediaWiki, or a PooledMediaWiki if caching is disabled
+    """
+    cache = get_wiki_cache()
+    if cache is None:
+        return PooledMediaWiki(session=session, **kwargs)
+    return CachedMediaWiki(cache=cache, session=session, **kwargs)
@@ -0,0 +1,140 @@
+import os
+import logging
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from dotenv import load_dotenv
+from scripts.wiki_crawler.cachinator import create_wiki_client
+
+
+# get env variables
+load_dotenv()
+WIKI_API_URL = os.getenv("WIKI_API_URL")
+WIKI_USER_AGENT = os.getenv("WIKI_USER_AGENT")
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT") or 5)
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT") or 30)
+HTTP_MAX_RETRIES = int(os.getenv("HTTP_MAX_RETRIES") or 5)
+# retries wait backoff * 2 ** (retry - 1) seconds, or as long as Retry-After asks
+HTTP_BACKOFF_FACTOR = float(os.getenv("HTTP_BACKOFF_FACTOR") or 0.5)
+# connections kept open per host, shared by all crawler threads
+HTTP_POOL_SIZE = int(os.getenv("HTTP_POOL_SIZE") or 16)
+
+DEFAULT_API_URL = "https://en.wikipedia.org/w/api.php"
+# sent when WIKI_USER_AGENT is not set, Wikimedia throttles or blocks generic user agents
+DEFAULT_USER_AGENT = "knowledge-extractor/1.0 (Wikimedia knowledge extraction crawler)"
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+_wiki_clients = {}
+_wiki_clients_lock = threading.Lock()
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """HTTP adapter that applies a default timeout to requests made without one"""
+
+    def __init__(self, *args, timeout=None, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, timeout=None, **kwargs):
+        return super().send(request, timeout=timeout or self.timeout, **kwargs)
+
+
+def create_http_session(
+    pool_size=HTTP_POOL_SIZE,
+    max_retries=HTTP_MAX_RETRIES,
+    backoff_factor=HTTP_BACKOFF_FACTOR,
+    timeout=(HTTP_CONNECT_TIMEOUT, HTTP_READ_TIMEOUT),
+    user_agent=WIKI_USER_AGENT or DEFAULT_USER_AGENT,
+):
+    """Create a keep-alive session that retries throttled and failed requests
+
+    Parameters
+        pool_size : int, optional
+            connections kept open per host
+        max_retries : int, optional
+            retries of a request answered with 429 or 5xx, or failing to connect
+        backoff_factor : float, optional
+            base of the exponential wait between retries
+        timeout : tuple, optional
+            default (connect, read) timeout in seconds
+        user_agent : str, optional
+            User-Agent header sent with every request
+
+    Returns
+        session : requests.Session
+            the configured session
+    """
+    retry = Retry(
+        total=max_retries,
+        backoff_factor=backoff_factor,
+        status_forcelist=RETRY_STATUSES,
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        # the last response is returned, callers check its status
+        raise_on_status=False,
+    )
+    adapter = TimeoutHTTPAdapter(
+        pool_connections=pool_size,
+        pool_maxsize=pool_size,
+        max_retries=retry,
+        timeout=timeout,
+    )
+    session = requests.Session()
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    if user_agent:
+        session.headers.update({"User-Agent": user_agent})
+    return session
+
+
+def get_http_session():
+    """Get the process wide HTTP session of the crawler
+
+    Returns
+        session : requests.Session
+            the shared pooled session, created on first use
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_http_session()
+        return _session
+
+
+def get_wiki_client(url=None):
+    """Get the process wide MediaWiki client of an API url
+
+    The client is created on first use, so the API site is probed once per
+    process and url, and it sends its requests through the shared session.
+
+    Parameters
+        url : str, optional
+            custom wiki API url, defaults to WIKI_API_URL or English Wikipedia
+
+    Returns
+        wikipedia : MediaWiki
+            the shared cached client
+    """
+    api_url = (url or WIKI_API_URL or "").strip() or DEFAULT_API_URL
+    with _wiki_clients_lock:
+        if api_url not in _wiki_clients:
+            _wiki_clients[api_url] = _create_client(api_url)
+        return _wiki_clients[api_url]
+
+
+def _create_client(api_url):
+    kwargs = {
+        "session": get_http_session(),
+        "timeout": HTTP_READ_TIMEOUT,
+        "user_agent": WIKI_USER_AGENT or DEFAULT_USER_AGENT,
+    }
+    try:
+        return create_wiki_client(url=api_url, **kwargs)
+    except Exception as e:
+        if api_url == DEFAULT_API_URL:
+            raise
+        logging.error(f"Error setting API URL: {e}. Defaulting to Wikipedia.")
+        return create_wiki_client(url=DEFAULT_API_URL, **kwargs)
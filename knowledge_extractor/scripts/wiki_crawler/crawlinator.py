@@ -0,0 +1,221 @@
+import time
+import heapq
+import logging
+from collections import namedtuple, defaultdict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from urllib.parse import urlparse, unquote
+from scripts.wiki_crawler.clientifier import get_wiki_client
+from scripts.wiki_crawler.analysinator import analyse_page_html, DEFAULT_BASE_URL
+from scripts.wiki_crawler.throttlinator import HostThrottle, get_api_host
+
+
+# links into these namespaces are not articles
+NON_ARTICLE_NAMESPACES = {
+    "file", "image", "category", "template", "help", "wikipedia", "portal",
+    "special", "talk", "user", "draft", "module", "mediawiki", "wp", "wikt",
+}
+
+# a crawled page with the depth it was found at and the page that linked to it first
+CrawledPage = namedtuple("CrawledPage", ["title", "depth", "parent", "links"])
+
+
+def normalise_title(title):
+    """Normalise a page title the way MediaWiki does: spaces, capital first letter"""
+    title = title.replace("_", " ").strip()
+    return title[:1].upper() + title[1:]
+
+
+def get_article_title(url, base_url=DEFAULT_BASE_URL):
+    """Get the article title a wiki link points to
+
+    Parameters
+        url : str
+            the absolute url of the link
+        base_url : str, optional
+            base url of the wiki
+
+    Returns
+        title : str | None
+            the normalised title, None if the link is not to an article of this wiki
+    """
+    parsed = urlparse(url)
+    if parsed.netloc and parsed.netloc != urlparse(base_url).netloc:
+        return None
+    if not parsed.path.startswith("/wiki/"):
+        return None
+    title = normalise_title(unquote(parsed.path[len("/wiki/"):]))
+    if not title:
+        return None
+    namespace = title.split(":", 1)[0].lower() if ":" in title else None
+    if namespace and (namespace in NON_ARTICLE_NAMESPACES or namespace.endswith(" talk")):
+        return None
+    return title
+
+
+def fetch_article_links(title, wikipedia):
+    """Get the in-article links of a page
+
+    The rendered page is analysed like any other page, so links in infoboxes,
+    navboxes and the reference list are not followed.
+
+    Parameters
+        title : str
+            the title of the page
+        wikipedia : MediaWiki
+            the client used for the request
+
+    Returns
+        tuple
+            the title after redirects and the list of distinct article titles linked, in page order
+    """
+    response = wikipedia.wiki_request(
+        {"action": "parse", "page": title, "prop": "text", "redirects": "", "formatversion": "2"}
+    )
+    if "error" in response or "parse" not in response:
+        raise ValueError(f"Failed to parse page {title}: {response.get('error')}")
+
+    base_url = getattr(wikipedia, "base_url", None) or DEFAULT_BASE_URL
+    analysis = analyse_page_html(response["parse"]["text"], base_url=base_url)
+    resolved_title = response["parse"].get("title", title)
+    links = []
+    seen = {resolved_title}
+    for url in analysis.links["url"]:
+        linked_title = get_article_title(url, base_url)
+        if linked_title and linked_title not in seen:
+            seen.add(linked_title)
+            links.append(linked_title)
+    return resolved_title, links
+
+
+def default_link_score(title, depth, inlinks):
+    """Prefer pages many crawled pages link to, and pages close to the seeds"""
+    return inlinks - depth
+
+
+def crawl_link_graph(
+    seeds,
+    max_depth=1,
+    max_pages=100,
+    max_workers=4,
+    time_budget=None,
+    wiki_url=None,
+    throttle=None,
+    host=None,
+    link_fetcher=None,
+    score_link=default_link_score,
+):
+    """Crawl outwards from seed pages along in-article links
+
+    The frontier is a priority queue: a page linked from more of the pages
+    crawled so far is fetched earlier, and every page is fetched at most once.
+    Pages up to `max_depth` links away from a seed are crawled until
+    `max_pages` pages or `time_budget` seconds are used up.
+
+    Parameters
+        seeds : list
+            titles to start from, crawled first
+        max_depth : int, optional
+            how many links away from the seeds to go
+        max_pages : int, optional
+            maximum number of pages crawled, seeds included
+        max_workers : int, optional
+            number of pages fetched at once
+        time_budget : float, optional
+            seconds after which no new page is started
+        wiki_url : str, optional
+            custom wiki API url
+        throttle : HostThrottle, optional
+            per host limit shared with other crawl work
+        host : str, optional
+            the API host the throttle slots are taken for
+        link_fetcher : callable, optional
+            function(title) returning (resolved title, linked titles), defaults to the wiki API
+        score_link : callable, optional
+            function(title, depth, inlinks) giving the priority of a frontier page
+
+    Returns
+        list
+            CrawledPage for every crawled page in crawl order
+    """
+    if link_fetcher is None:
+        wikipedia = get_wiki_client(wiki_url)
+        link_fetcher = lambda title: fetch_article_links(title, wikipedia)
+    throttle = throttle or HostThrottle(max_per_host=max_workers, delay=0)
+    host = host or get_api_host(wiki_url)
+    deadline = time.monotonic() + time_budget if time_budget else None
+
+    frontier = []
+    sequence = 0
+    visited = set()
+    inlinks = defaultdict(int)
+    crawled = []
+    crawled_titles = set()
+    scheduled = 0
+
+    def push(title, depth, parent, score):
+        nonlocal sequence
+        heapq.heappush(frontier, (-score, depth, sequence, title, parent))
+        sequence += 1
+
+    for seed in seeds:
+        push(normalise_title(seed), 0, None, float("inf"))
+
+    def fetch(title):
+        with throttle.slot(host):
+            return link_fetcher(title)
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        running = {}
+        while frontier or running:
+            out_of_time = deadline is not None and time.monotonic() >= deadline
+            while (
+                frontier
+                and len(running) < max_workers
+                and scheduled < max_pages
+                and not out_of_time
+            ):
+                _, depth, _, title, parent = heapq.heappop(frontier)
+                # a page is pushed again when it gains inlinks, the stale entries are skipped
+                if title in visited:
+                    continue
+                visited.add(title)
+                scheduled += 1
+                running[executor.submit(fetch, title)] = (title, depth, parent)
+
+            if not running:
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                title, depth, parent = running.pop(future)
+                try:
+                    resolved_title, links = future.result()
+                except Exception as e:
+                    logging.error(f"Failed to crawl page {title}: {e}")
+                    continue
+
+                # two titles redirecting to the same page
+                if resolved_title in crawled_titles:
+                    continue
+                visited.add(resolved_title)
+                crawled_titles.add(resolved_title)
+                crawled.append(CrawledPage(resolved_title, depth, parent, links))
+
+                if depth >= max_depth:
+                    continue
+                for linked_title in links:
+                    if linked_title in visited:
+                        continue
+                    inlinks[linked_title] += 1
+                    push(
+                        linked_title,
+                        depth + 1,
+                        resolved_title,
+                        score_link(linked_title, depth + 1, inlinks[linked_title]),
+                    )
+
+            logging.info(
+                f"Crawled {len(crawled)} pages, {len(running)} running, {len(frontier)} in frontier"
+            )
+
+    return crawled
@@ -1,59 +1,93 @@
+import os
+import logging
+from dotenv import load_dotenv
 from scripts.wiki_crawler.navigifier import (
     get_wiki_page,
     get_intro_content,
-    extract_section_titles,
+    index_sections,
     get_page_content,
     get_page_categories,
     get_page_html,
+    get_record_html,
+    PageRecord,
 )
-from scripts.wiki_crawler.tablifier import extract_tables
+from scripts.wiki_crawler.analysinator import analyse_page_html, DEFAULT_BASE_URL
 from scripts.wiki_crawler.referenciator import (
     get_external_links_by_section,
     get_all_citations,
 )
 from scripts.wiki_crawler.imagifier import convert_images_to_png
+from scripts.wiki_crawler.dumpifier import DumpPage, wikitext_tables_to_html
+
+load_dotenv()
+# in-text links to other wiki pages become wiki-ref nodes only when enabled, a page has hundreds of them
+WIKI_LINK_NODES = os.getenv("WIKI_LINK_NODES", "false").lower() in ("1", "true", "yes")
 
 
 def fetch_wiki_data(page_title):
     """Fetch all the data from a wiki page and preprocess it.
+
+    A DumpPage read from a local dump can be passed instead of a title, in
+    which case nothing is fetched from the API: the text, categories and
+    tables come from its wikitext and the page has no images. A PageRecord
+    from fetch_page_records already holds the summary and categories, so only
+    the plain text, the html and the images are requested for it.
     
     Args:
-        page_title (str): the title of the wiki page
+        page_title (str | DumpPage | PageRecord): the title of the wiki page, a page from a dump or a prefetched page record
 
     Returns:
         tuple: a tuple containing the following data:
             - page: the MediaWikiPage object
             - page_content: the content of the page
             - intro_content: the introduction content of the page
-            - sections: the sections of the page
+            - sections: the indexed sections of the page with their subsections
             - categories: the categories of the page
             - images: the images of the page
             - tables: the tables of the page
             - reference_dict: the references of the page
-            - wiki_links_dict: the external links of the page
+            - wiki_links_dict: the external links of the page, empty unless WIKI_LINK_NODES is set
             - table_of_contents: the table of contents of the page
     """
-    page = get_wiki_page(page_title)
+    if isinstance(page_title, (DumpPage, PageRecord)):
+        page = page_title
+    else:
+        page = get_wiki_page(page_title)
     if not page:
-        print(f"Failed to retrieve the page: {page_title}")
+        logging.error(f"Failed to retrieve the page: {page_title}")
         return []
 
-    page_content = get_page_content(page)
+    if isinstance(page, DumpPage):
+        page_content = page.content
+        categories = page.categories
+        images = []
+        page_html = wikitext_tables_to_html(page.wikitext)
+    elif isinstance(page, PageRecord):
+        page_content = page.content
+        categories = page.categories
+        images = convert_images_to_png(page)
+        page_html = get_record_html(page)
+    else:
+        page_content = get_page_content(page)
+        categories = get_page_categories(page)
+        images = convert_images_to_png(page)
+        page_html = get_page_html(page)
     intro_content = get_intro_content(page_content)
-    sections = extract_section_titles(page_content)
-    categories = get_page_categories(page)
-    images = convert_images_to_png(page)
-    page_html = get_page_html(page)
-    tables = extract_tables(page_html)
-    # TODO - fix these links with new API call
-    # reference_dict = get_all_citations(page)
-    # wiki_links_dict = get_external_links_by_section(page)
-    reference_dict = {}
-    wiki_links_dict = {}
+    sections = index_sections(page_content)
+    # tables, links and citations all come from one walk over the html
+    page_analysis = analyse_page_html(
+        page_html,
+        base_url=getattr(page.mediawiki, "base_url", None) or DEFAULT_BASE_URL,
+        page_url=page.url or "",
+    )
+    tables = page_analysis.tables
+    reference_dict = get_all_citations(page_analysis)
+    wiki_links_dict = get_external_links_by_section(page_analysis, page.url or "") if WIKI_LINK_NODES else {}
 
     table_of_contents = [
-        (section, subsections) for section, subsections in sections
-    ] 
+        (section.title, [subsection.title for subsection in subsections])
+        for section, subsections in sections
+    ]
 
     return (
         page,
@@ -0,0 +1,413 @@
+import re
+import io
+import bz2
+import html
+import logging
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from lxml import etree
+
+
+WIKIPEDIA_BASE_URL = "https://en.wikipedia.org/wiki/"
+
+CATEGORY_PATTERN = re.compile(r"\[\[\s*Category\s*:\s*([^\]|]+?)\s*(?:\|[^\]]*)?\]\]", re.IGNORECASE)
+COMMENT_PATTERN = re.compile(r"<!--.*?-->", re.DOTALL)
+REF_PATTERN = re.compile(r"<ref[^>/]*/>|<ref[^>]*>.*?</ref>", re.DOTALL | re.IGNORECASE)
+BLOCK_TAG_PATTERN = re.compile(
+    r"<(gallery|math|timeline|score|syntaxhighlight|source)[^>]*>.*?</\1>", re.DOTALL | re.IGNORECASE
+)
+HTML_TAG_PATTERN = re.compile(r"</?[a-zA-Z][^>]*>")
+FILE_LINK_PREFIX = re.compile(r"^\s*(File|Image|Category)\s*:", re.IGNORECASE)
+EXTERNAL_LINK_PATTERN = re.compile(r"\[(?:https?:)?//[^\s\]]+\s*([^\]]*)\]")
+HEADING_PATTERN = re.compile(r"^(={2,6})\s*(.*?)\s*\1\s*$", re.MULTILINE)
+EMPHASIS_PATTERN = re.compile(r"'{2,}")
+LIST_PREFIX_PATTERN = re.compile(r"^[*#:;]+\s*", re.MULTILINE)
+BLANK_LINES_PATTERN = re.compile(r"\n{3,}")
+
+# inline templates whose text is part of the sentence, with the positional parameters kept
+INLINE_TEMPLATES = {
+    "convert": (0, 1),
+    "cvt": (0, 1),
+    "lang": (1,),
+    "nowrap": (0,),
+    "nobr": (0,),
+    "small": (0,),
+    "sic": (0,),
+    "abbr": (0,),
+    "ill": (0,),
+    "visible anchor": (0,),
+}
+
+
+class DumpPage:
+    """A page read from a local XML dump.
+
+    Offers the attributes of MediaWikiPage the ingestion uses, filled from the
+    wikitext instead of API calls. Pages from a dump have no images or html.
+    """
+
+    def __init__(self, title, pageid, revision_id, wikitext, categories):
+        self.title = title
+        self.pageid = pageid
+        self.revision_id = revision_id
+        self.wikitext = wikitext
+        self.categories = categories
+        self.images = []
+        self.mediawiki = None
+        self._content = None
+
+    @property
+    def url(self):
+        return f"{WIKIPEDIA_BASE_URL}{self.title.replace(' ', '_')}"
+
+    @property
+    def content(self):
+        """Plain text of the page with == section == headings, as returned by the API"""
+        if self._content is None:
+            self._content = wikitext_to_text(self.wikitext)
+        return self._content
+
+    @property
+    def summary(self):
+        """Text before the first section heading"""
+        return HEADING_PATTERN.split(self.content, maxsplit=1)[0].strip()
+
+    def __reduce__(self):
+        return (DumpPage, (self.title, self.pageid, self.revision_id, self.wikitext, self.categories))
+
+    def __repr__(self):
+        return f"DumpPage(title={self.title!r}, revision_id={self.revision_id!r})"
+
+
+def _local_name(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _remove_nested(text, opening, closing, keep=None):
+    """Remove nested blocks such as {{templates}} or [[links]], optionally keeping some
+
+    Parameters
+        text : str
+            the wikitext
+        opening, closing : str
+            the block delimiters
+        keep : callable, optional
+            function(inner_text) returning the replacement for a block, None removes it
+
+    Returns
+        str
+            the text with the outermost blocks replaced
+    """
+    output = []
+    depth = 0
+    start = 0
+    block_start = 0
+    idx = 0
+    while idx < len(text):
+        if text.startswith(opening, idx):
+            if depth == 0:
+                output.append(text[start:idx])
+                block_start = idx + len(opening)
+            depth += 1
+            idx += len(opening)
+        elif depth and text.startswith(closing, idx):
+            depth -= 1
+            idx += len(closing)
+            if depth == 0:
+                replacement = keep(text[block_start:idx - len(closing)]) if keep else None
+                if replacement:
+                    output.append(replacement)
+                start = idx
+        else:
+            idx += 1
+    output.append(text[start:] if depth == 0 else text[start:block_start - len(opening)])
+    return "".join(output)
+
+
+def _split_template_params(inner):
+    """Split the inside of a template on the | that are not inside nested templates or links"""
+    parts = []
+    depth = 0
+    start = 0
+    for idx, char in enumerate(inner):
+        if char in "{[" and inner[idx:idx + 2] in ("{{", "[["):
+            depth += 1
+        elif char in "}]" and inner[idx - 1:idx + 1] in ("}}", "]]") and depth:
+            depth -= 1
+        elif char == "|" and depth == 0:
+            parts.append(inner[start:idx].strip())
+            start = idx + 1
+    parts.append(inner[start:].strip())
+    return parts
+
+
+def _template_text(inner):
+    """Text shown for an inline {{template}}, nothing for other templates"""
+    parts = _split_template_params(inner)
+    kept = INLINE_TEMPLATES.get(parts[0].lower())
+    if not kept:
+        return None
+    positional = [part for part in parts[1:] if "=" not in part]
+    text = " ".join(positional[idx] for idx in kept if idx < len(positional))
+    return _remove_nested(text, "{{", "}}", keep=_template_text)
+
+
+def _link_text(inner):
+    """Text shown for an internal [[link]], nothing for files and categories"""
+    if FILE_LINK_PREFIX.match(inner):
+        return None
+    return inner.rsplit("|", 1)[-1].strip() if "|" in inner else inner.strip()
+
+
+def get_wikitext_categories(wikitext):
+    """Get the categories a page is in from its wikitext
+
+    Parameters
+        wikitext : str
+            the wikitext of the page
+
+    Returns
+        list
+            the category names without the Category: prefix
+    """
+    return [match.group(1).strip() for match in CATEGORY_PATTERN.finditer(wikitext or "")]
+
+
+def wikitext_to_text(wikitext):
+    """Convert wikitext to plain text, keeping == section == headings
+
+    Templates other than a few inline ones (convert, lang, nowrap...),
+    references, tables, files and categories are dropped and links are
+    replaced by their label, which is close to the plain text extract the API
+    returns.
+
+    Parameters
+        wikitext : str
+            the wikitext of the page
+
+    Returns
+        str
+            the plain text of the page
+    """
+    text = COMMENT_PATTERN.sub("", wikitext or "")
+    text = REF_PATTERN.sub("", text)
+    text = BLOCK_TAG_PATTERN.sub("", text)
+    text = _remove_nested(text, "{{", "}}", keep=_template_text)
+    text = _remove_nested(text, "{|", "|}")
+    text = _remove_nested(text, "[[", "]]", keep=_link_text)
+    text = EXTERNAL_LINK_PATTERN.sub(lambda match: match.group(1), text)
+    text = HTML_TAG_PATTERN.sub("", text)
+    text = html.unescape(EMPHASIS_PATTERN.sub("", text))
+    text = HEADING_PATTERN.sub(lambda match: f"\n{match.group(1)} {match.group(2)} {match.group(1)}\n", text)
+    text = LIST_PREFIX_PATTERN.sub("", text)
+    return BLANK_LINES_PATTERN.sub("\n\n", text).strip()
+
+
+def _split_cells(line, separator):
+    """Split a table row line into (attributes, content) cells"""
+    cells = []
+    for cell in line.split(separator):
+        head = cell.split("|", 1)[0]
+        if "|" in cell and "[[" not in head and "{{" not in head:
+            attributes, content = cell.split("|", 1)
+        else:
+            attributes, content = "", cell
+        cells.append((attributes.strip(), content.strip()))
+    return cells
+
+
+def wikitext_tables_to_html(wikitext):
+    """Convert the wikitables of a page to html tables
+
+    Parameters
+        wikitext : str
+            the wikitext of the page
+
+    Returns
+        str
+            html with one <table> per {| class="wikitable" |} block, readable by analyse_page_html
+    """
+    tables = []
+    current = None
+    for raw_line in (wikitext or "").splitlines():
+        line = raw_line.strip()
+        if line.startswith("{|"):
+            current = [f"<table {html.escape(line[2:], quote=False)}>", "<tr>"]
+        elif current is None:
+            continue
+        elif line.startswith("|}"):
+            current.append("</tr></table>")
+            if "wikitable" in current[0]:
+                tables.append("".join(current))
+            current = None
+        elif line.startswith("|-"):
+            current.append("</tr><tr>")
+        elif line.startswith("|+"):
+            continue
+        elif line.startswith("!") or line.startswith("|"):
+            tag = "th" if line.startswith("!") else "td"
+            separator = "!!" if tag == "th" else "||"
+            for attributes, content in _split_cells(line[1:], separator):
+                cell_text = html.escape(wikitext_to_text(content))
+                current.append(f"<{tag} {attributes}>{cell_text}</{tag}>")
+    return "\n".join(tables)
+
+
+def _page_from_element(element, namespaces):
+    """Build a DumpPage from a <page> element, None if it is filtered out"""
+    values = {"title": None, "ns": None, "id": None, "redirect": False}
+    revision_id = None
+    wikitext = ""
+    for child in element:
+        name = _local_name(child.tag)
+        if name in ("title", "ns", "id"):
+            values[name] = child.text
+        elif name == "redirect":
+            values["redirect"] = True
+        elif name == "revision":
+            for field in child:
+                field_name = _local_name(field.tag)
+                if field_name == "id":
+                    revision_id = field.text
+                elif field_name == "text":
+                    wikitext = field.text or ""
+
+    if values["redirect"]:
+        return None
+    if namespaces is not None and int(values["ns"] or 0) not in namespaces:
+        return None
+    return DumpPage(
+        title=values["title"],
+        pageid=int(values["id"]) if values["id"] else None,
+        revision_id=int(revision_id) if revision_id else None,
+        wikitext=wikitext,
+        categories=get_wikitext_categories(wikitext),
+    )
+
+
+def _parse_pages(source, namespaces):
+    """Stream DumpPages out of a file like object of dump xml, clearing parsed elements"""
+    for _, element in etree.iterparse(source, events=("end",), huge_tree=True):
+        if _local_name(element.tag) != "page":
+            continue
+        page = _page_from_element(element, namespaces)
+        # drop the parsed page and the siblings before it to keep memory flat
+        element.clear()
+        parent = element.getparent()
+        while parent is not None and element.getprevious() is not None:
+            del parent[0]
+        if page is not None:
+            yield page
+
+
+def _matches(page, titles, categories):
+    if titles is not None and page.title not in titles:
+        return False
+    if categories is not None and not categories.intersection(page.categories):
+        return False
+    return True
+
+
+def iter_dump_pages(dump_path, titles=None, categories=None, namespaces=(0,)):
+    """Stream the pages of a pages-articles.xml(.bz2) dump
+
+    Parameters
+        dump_path : str
+            path to the dump, bz2 compressed or plain xml
+        titles : iterable, optional
+            only yield pages with these titles
+        categories : iterable, optional
+            only yield pages in at least one of these categories
+        namespaces : tuple, optional
+            namespaces to keep, None keeps all, articles only by default
+
+    Yields
+        DumpPage
+            the pages of the dump in file order, redirects skipped
+    """
+    titles = set(titles) if titles is not None else None
+    categories = set(categories) if categories is not None else None
+    opener = bz2.open if dump_path.endswith(".bz2") else open
+    with opener(dump_path, "rb") as source:
+        for page in _parse_pages(source, namespaces):
+            if _matches(page, titles, categories):
+                yield page
+
+
+def read_stream_offsets(index_path):
+    """Get the byte offsets of the bz2 streams of a multistream dump
+
+    Parameters
+        index_path : str
+            path to the multistream index (offset:page_id:title per line)
+
+    Returns
+        list
+            sorted distinct stream start offsets
+    """
+    offsets = set()
+    opener = bz2.open if index_path.endswith(".bz2") else open
+    with opener(index_path, "rt", encoding="utf-8") as index:
+        for line in index:
+            offset = line.split(":", 1)[0]
+            if offset.isdigit():
+                offsets.add(int(offset))
+    return sorted(offsets)
+
+
+def _read_stream(dump_path, start, end, namespaces, titles, categories):
+    """Decompress one stream of a multistream dump and parse its pages"""
+    with open(dump_path, "rb") as f:
+        f.seek(start)
+        data = f.read(end - start) if end is not None else f.read()
+    xml = bz2.BZ2Decompressor().decompress(data)
+    # a stream holds a run of <page> elements; the first also has the header, the last the footer
+    first_page = xml.find(b"<page>")
+    last_page = xml.rfind(b"</page>")
+    if first_page < 0 or last_page < 0:
+        return []
+    body = b"<pages>" + xml[first_page:last_page + len(b"</page>")] + b"</pages>"
+    return [
+        page for page in _parse_pages(io.BytesIO(body), namespaces)
+        if _matches(page, titles, categories)
+    ]
+
+
+def iter_multistream_pages(
+    dump_path, index_path, titles=None, categories=None, namespaces=(0,), max_workers=4
+):
+    """Stream the pages of a multistream dump, decompressing streams in parallel
+
+    Streams are handed to a process pool a few at a time, so only
+    2 * max_workers streams are held in memory however large the dump is.
+
+    Parameters
+        dump_path : str
+            path to the pages-articles-multistream.xml.bz2 dump
+        index_path : str
+            path to the matching multistream index
+        titles, categories, namespaces
+            filters, as for iter_dump_pages
+        max_workers : int, optional
+            number of decompression processes
+
+    Yields
+        DumpPage
+            the pages of the dump in file order
+    """
+    titles = set(titles) if titles is not None else None
+    categories = set(categories) if categories is not None else None
+    offsets = read_stream_offsets(index_path)
+    ranges = list(zip(offsets, offsets[1:] + [None]))
+    logging.info(f"Reading {len(ranges)} streams of {dump_path} with {max_workers} workers")
+
+    with ProcessPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        pending = deque()
+        for start, end in ranges:
+            pending.append(
+                executor.submit(_read_stream, dump_path, start, end, namespaces, titles, categories)
+            )
+            if len(pending) >= 2 * max(1, max_workers):
+                yield from pending.popleft().result()
+        while pending:
+            yield from pending.popleft().result()
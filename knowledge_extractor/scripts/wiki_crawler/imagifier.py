@@ -1,160 +1,466 @@
 import requests
 from PIL import Image
 from PIL import UnidentifiedImageError
+from PIL import ImageFile
 import os
 import io
-from bs4 import BeautifulSoup
 import re
-import base64
-import ctypes
 from dotenv import load_dotenv
-import logging
-import gc
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from scripts.helper import log_duration
-import cairosvg
 import logging
 from scripts.helper import sanitise_filename
+from scripts.storage.blob_store import get_blob_store
+from scripts.wiki_crawler.rasterinator import rasterise_svg
+from scripts.wiki_crawler.clientifier import get_http_session
 
 load_dotenv()
 USER_AGENT = os.getenv("USER_AGENT")
-
-
-try:
-    # Attempt to load the Cairo library for Linux
-    # The Cairo library should be installed in the Docker container using a package manager
-    ctypes.CDLL("libcairo.so.2")
-except OSError as e:
-    print(f"Error loading libcairo.so.2: {e}")
+IMAGE_DOWNLOAD_WORKERS = int(os.getenv("IMAGE_DOWNLOAD_WORKERS") or 8)
+IMAGE_CONVERT_WORKERS = int(os.getenv("IMAGE_CONVERT_WORKERS") or os.cpu_count() or 2)
+IMAGE_MAX_INFLIGHT_BYTES = int(os.getenv("IMAGE_MAX_INFLIGHT_BYTES") or 256 * 1024 * 1024)
+# width of the Commons thumbnails fetched instead of the originals, 0 fetches originals
+IMAGE_THUMBNAIL_WIDTH = int(os.getenv("IMAGE_THUMBNAIL_WIDTH") or 1024)
+# reserved for a download whose size is not announced by the server
+UNKNOWN_IMAGE_SIZE = 4 * 1024 * 1024
+# how much of a file is read to find its dimensions before giving up
+IMAGE_HEADER_BYTES = 64 * 1024
+HEADER_CHUNK_SIZE = 8 * 1024
+MAX_IMAGE_PIXELS = 178956970
 
 
 Image.MAX_IMAGE_PIXELS = None
 
 
-def preprocess_svg(svg_content):
-    """Preprocess SVG content by adding width and height attributes if missing."""
-    try:
-        soup = BeautifulSoup(svg_content, "xml")
-        svg_tag = soup.find("svg")
-        if "width" not in svg_tag.attrs or "height" not in svg_tag.attrs:
-            svg_tag["width"] = "1000"
-            svg_tag["height"] = "1000"
-        return str(soup)
-    except Exception as e:
-        logging.error(f"Error preprocessing SVG: {e}")
-        return svg_content
+def is_size_too_small(size, min_size=(50, 50)):
+    """Check if width and height are below the minimum size."""
+    return size[0] < min_size[0] or size[1] < min_size[1]
 
 
-def is_image_too_small(image_data, min_size=(50, 50)):
-    """Check if the image is too small."""
-    try:
-        image = Image.open(io.BytesIO(image_data))
-        return image.size[0] < min_size[0] or image.size[1] < min_size[1]
-    except UnidentifiedImageError:
+def resize_image_if_large(image, max_pixels=MAX_IMAGE_PIXELS):
+    """Resize an opened image in place if it exceeds the max_pixels limit.
+
+    Returns
+        bool
+            whether the image was resized
+    """
+    if image.size[0] * image.size[1] <= max_pixels:
         return False
+    ratio = (max_pixels / float(image.size[0] * image.size[1])) ** 0.5
+    new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
+    image.thumbnail(new_size, Image.Resampling.LANCZOS)
+    return True
+
+
+def read_image_size(chunks):
+    """Read chunks until the image header gives away the dimensions.
+
+    Parameters
+        chunks : iterator of bytes
+            the start of the image body
+
+    Returns
+        tuple
+            (width, height) or None if unknown, and the bytes read so far
+    """
+    parser = ImageFile.Parser()
+    head = []
+    read = 0
+    for chunk in chunks:
+        head.append(chunk)
+        read += len(chunk)
+        try:
+            parser.feed(chunk)
+        except Exception:
+            break
+        if parser.image is not None:
+            return parser.image.size, head
+        if read >= IMAGE_HEADER_BYTES:
+            break
+    return None, head
+
+
+class ImageStats:
+    """Thread safe counters of the image work done for one page."""
+
+    FIELDS = (
+        "images",
+        "bytes_downloaded",
+        "decodes",
+        "skipped_preflight",
+        "skipped_header",
+        "thumbnails",
+        "failed",
+        "converted",
+    )
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        for field in self.FIELDS:
+            setattr(self, field, 0)
+        # image url -> reason, for images dropped after download
+        self.skipped = {}
+
+    def add(self, **counts):
+        with self._lock:
+            for field, value in counts.items():
+                setattr(self, field, getattr(self, field) + value)
+
+    def skip(self, image_url, reason):
+        with self._lock:
+            self.skipped[image_url] = reason
+
+    def as_dict(self):
+        with self._lock:
+            stats = {field: getattr(self, field) for field in self.FIELDS}
+            stats["skipped"] = dict(self.skipped)
+            return stats
 
 
-def resize_image_if_large(image_data, max_pixels=178956970):
-    """Resize the image if it exceeds the max_pixels limit."""
+class ByteBudget:
+    """Cap the number of image bytes held in memory at once.
+
+    A download reserves its size before the body is read and the reservation is
+    released once the image is converted. A single image larger than the whole
+    budget is let through on its own so the pipeline never stalls.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max(1, int(max_bytes))
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, nbytes):
+        nbytes = min(nbytes, self.max_bytes)
+        with self._condition:
+            while self.in_flight and self.in_flight + nbytes > self.max_bytes:
+                self._condition.wait()
+            self.in_flight += nbytes
+        return nbytes
+
+    def release(self, nbytes):
+        with self._condition:
+            self.in_flight -= nbytes
+            self._condition.notify_all()
+
+
+def get_image_session():
+    """Get the shared requests session used for image downloads
+
+    Returns
+        session : requests.Session
+            the crawler's keep-alive session, retrying throttled and failed requests
+    """
+    return get_http_session()
+
+
+def fetch_image_info(page, thumbnail_width=IMAGE_THUMBNAIL_WIDTH):
+    """Get the size of every image on a page with one imageinfo query
+
+    Parameters
+        page : MediaWikiPage
+            the page whose images are looked up
+        thumbnail_width : int, optional
+            also ask for thumbnail urls of this width, 0 to skip
+
+    Returns
+        dict
+            image url -> {"width", "height", "size", "mime", "thumb_url",
+            "thumb_width", "thumb_height"}, empty if the lookup fails
+    """
+    params = {
+        "action": "query",
+        "generator": "images",
+        "gimlimit": "max",
+        "prop": "imageinfo",
+        "iiprop": "url|size|mime",
+    }
+    if thumbnail_width:
+        params["iiurlwidth"] = thumbnail_width
+    if getattr(page, "pageid", None):
+        params["pageids"] = page.pageid
+    else:
+        params["titles"] = page.title
+
+    image_info = {}
+    last_continue = {}
     try:
-        image = Image.open(io.BytesIO(image_data))
-        if image.size[0] * image.size[1] > max_pixels:
-            ratio = (max_pixels / float(image.size[0] * image.size[1])) ** 0.5
-            new_size = (int(image.size[0] * ratio), int(image.size[1] * ratio))
-            image.thumbnail(new_size, Image.Resampling.LANCZOS)
-            output = io.BytesIO()
-            image.save(output, format="PNG")
-            return output.getvalue()
+        while True:
+            response = page.mediawiki.wiki_request({**params, **last_continue})
+            if not isinstance(response, dict) or "query" not in response:
+                break
+            for image_page in response["query"].get("pages", {}).values():
+                for info in image_page.get("imageinfo", [])[:1]:
+                    if "url" in info:
+                        image_info[info["url"]] = {
+                            "width": info.get("width"),
+                            "height": info.get("height"),
+                            "size": info.get("size"),
+                            "mime": info.get("mime"),
+                            "thumb_url": info.get("thumburl"),
+                            "thumb_width": info.get("thumbwidth"),
+                            "thumb_height": info.get("thumbheight"),
+                        }
+            if "continue" not in response or response["continue"] == last_continue:
+                break
+            last_continue = response["continue"]
     except Exception as e:
-        logging.error(f"Error resizing image: {e}")
-    return image_data
+        logging.error(f"Error fetching image info for page {getattr(page, 'title', '')}: {e}")
+    return image_info
 
 
-@log_duration
-def process_image(image_url, headers, min_size):
-    """Download and process the image to convert it to PNG format."""
+def get_download_url(image_url, info):
+    """Pick the url to download an image from
+
+    Commons thumbnails are used when they are smaller than the original, and
+    always for SVGs since those thumbnails come already rasterised to PNG.
+
+    Parameters
+        image_url : str
+            url of the original file
+        info : dict | None
+            the imageinfo entry of the image
+
+    Returns
+        str
+            the thumbnail url or the original url
+    """
+    if not info or not info.get("thumb_url") or info["thumb_url"] == image_url:
+        return image_url
+    if image_url.endswith(".svg"):
+        return info["thumb_url"]
+    if info.get("width") and info.get("thumb_width") and info["thumb_width"] < info["width"]:
+        return info["thumb_url"]
+    return image_url
+
+
+def download_image(image_url, headers, budget=None, session=None, info=None, min_size=None, stats=None):
+    """Download the raw image bytes, reserving their size from the byte budget.
+
+    When the dimensions are not known from the imageinfo lookup, the start of the
+    body is read first and the download is dropped if the header shows an image
+    smaller than `min_size`. SVGs are always downloaded.
+
+    Returns
+        tuple
+            image bytes (None on failure or skip) and the number of bytes reserved
+    """
+    session = session or get_image_session()
+    stats = stats or ImageStats()
+    reserved = 0
     try:
-        response = requests.get(image_url, headers=headers, stream=True)
+        response = session.get(image_url, headers=headers, stream=True)
         response.raise_for_status()
-        image_data = response.content
-        image_name = os.path.basename(image_url)
-        image_name = sanitise_filename(image_name)
-        image_name_without_ext = os.path.splitext(image_name)[0]
-
-        if is_image_too_small(image_data, min_size):
-            logging.info(f"Skipping image {image_name} as it is too small.")
-            return None
+        chunks = response.iter_content(chunk_size=HEADER_CHUNK_SIZE)
 
-        if image_url.endswith(".svg"):
-            preprocessed_svg = preprocess_svg(image_data.decode("utf-8"))
-            try:
-                png_data = cairosvg.svg2png(bytestring=preprocessed_svg.encode("utf-8"))
-                logging.info(f"Converted SVG to PNG: {image_name_without_ext}")
-                return {
-                    # "raw_image_data": png_data,
-                    "image_data": base64.b64encode(png_data).decode("utf-8"),
-                    "image_name": image_name_without_ext,
-                    "image_url": image_url,
-                }
-            except Exception as e:
-                logging.error(
-                    f"Error converting SVG to PNG for URL: {image_url}. Error: {e}"
-                )
-        else:
-            try:
-                image_data = resize_image_if_large(image_data)
-                image = Image.open(io.BytesIO(image_data))
-                png_buffer = io.BytesIO()
-                if image.format != "PNG":
-                    if image.mode == "CMYK":
-                        image = image.convert("RGB")
-                    image.save(png_buffer, format="PNG")
-                    png_data = png_buffer.getvalue()
-                    logging.info(f"Converted image to PNG: {image_name_without_ext}")
-                    return {
-                        "image_data": base64.b64encode(png_data).decode("utf-8"),
-                        "image_name": image_name_without_ext,
-                        "image_url": image_url,
-                    }
-                else:
-                    logging.info(f"Saved PNG image: {image_name_without_ext}")
-                    return {
-                        "image_data": base64.b64encode(image_data).decode("utf-8"),
-                        "image_name": image_name_without_ext,
-                        "image_url": image_url,
-                    }
-            except UnidentifiedImageError:
-                logging.error(f"Unable to identify image at URL: {image_url}")
+        head = []
+        if min_size and not image_url.endswith(".svg") and not (info and info.get("width")):
+            size, head = read_image_size(chunks)
+            if size is not None and is_size_too_small(size, min_size):
+                response.close()
+                stats.add(bytes_downloaded=sum(len(chunk) for chunk in head), skipped_header=1)
+                logging.info(f"Skipping image {os.path.basename(image_url)} as it is too small.")
+                return None, reserved
 
+        if budget is not None:
+            declared_size = response.headers.get("Content-Length")
+            if not declared_size and info and image_url != info.get("thumb_url"):
+                declared_size = info.get("size")
+            reserved = budget.acquire(
+                int(declared_size) if declared_size else UNKNOWN_IMAGE_SIZE
+            )
+        image_data = b"".join(head) + b"".join(chunks)
+        stats.add(bytes_downloaded=len(image_data))
+        return image_data, reserved
     except requests.exceptions.RequestException as e:
         logging.error(f"Error downloading image from URL: {image_url}. Error: {e}")
+        stats.add(failed=1)
+        return None, reserved
+    except Exception as e:
+        # e.g. a malformed Content-Length, the caller still releases what was reserved
+        logging.error(f"Unexpected error downloading image from URL: {image_url}. Error: {e}")
+        stats.add(failed=1)
+        return None, reserved
+
 
-    return None
+def convert_image(image_url, image_data, min_size, stats=None, download_url=None, blob_store=None):
+    """Convert downloaded image bytes to PNG format and store them in the blob store.
 
+    The image is opened once: the header gives the size check, PNGs within the
+    pixel limit are passed through untouched and everything else is decoded a
+    single time for resizing and re-encoding. `download_url` is the url the
+    bytes came from when a thumbnail was fetched instead of `image_url`.
 
-def convert_images_to_png(page, min_size=(50, 50)):
+    Returns
+        dict | None
+            image_hash of the stored PNG, image_name and image_url
+    """
+    stats = stats or ImageStats()
+    image_name = os.path.basename(image_url)
+    image_name = sanitise_filename(image_name)
+    image_name_without_ext = os.path.splitext(image_name)[0]
+    png_data = None
+
+    if (download_url or image_url).endswith(".svg"):
+        result = rasterise_svg(image_data)
+        if result.skipped_reason:
+            logging.warning(f"Skipping SVG {image_url}: {result.skipped_reason}")
+            stats.skip(image_url, result.skipped_reason)
+            return None
+        png_data = result.png_data
+        stats.add(decodes=1)
+        logging.info(f"Converted SVG to PNG: {image_name_without_ext}")
+    else:
+        try:
+            image = Image.open(io.BytesIO(image_data))
+            if is_size_too_small(image.size, min_size):
+                logging.info(f"Skipping image {image_name} as it is too small.")
+                stats.add(skipped_header=1)
+                return None
+            if image.format == "PNG" and image.size[0] * image.size[1] <= MAX_IMAGE_PIXELS:
+                logging.info(f"Saved PNG image: {image_name_without_ext}")
+                png_data = image_data
+            else:
+                image.load()
+                stats.add(decodes=1)
+                resize_image_if_large(image)
+                if image.mode == "CMYK":
+                    image = image.convert("RGB")
+                png_buffer = io.BytesIO()
+                image.save(png_buffer, format="PNG")
+                png_data = png_buffer.getvalue()
+                logging.info(f"Converted image to PNG: {image_name_without_ext}")
+        except UnidentifiedImageError:
+            logging.error(f"Unable to identify image at URL: {image_url}")
+        except Exception as e:
+            logging.error(f"Error converting image from URL: {image_url}. Error: {e}")
+
+    if png_data is None:
+        stats.add(failed=1)
+        return None
+
+    return {
+        "image_hash": (blob_store or get_blob_store()).put(png_data),
+        "image_name": image_name_without_ext,
+        "image_url": image_url,
+    }
+
+
+@log_duration
+def process_image(image_url, headers, min_size):
+    """Download and process the image to convert it to PNG format."""
+    image_data, _ = download_image(image_url, headers, min_size=min_size)
+    if image_data is None:
+        return None
+    return convert_image(image_url, image_data, min_size)
+
+
+def convert_images_to_png(
+    page,
+    min_size=(50, 50),
+    max_workers=IMAGE_DOWNLOAD_WORKERS,
+    convert_workers=IMAGE_CONVERT_WORKERS,
+    max_inflight_bytes=IMAGE_MAX_INFLIGHT_BYTES,
+    thumbnail_width=IMAGE_THUMBNAIL_WIDTH,
+    blob_store=None,
+):
     """
     Download all images from a wiki page and convert them to PNG format.
 
+    The sizes of the page's images are looked up in one imageinfo query first,
+    so icons and flags below `min_size` are never downloaded; images the lookup
+    does not cover are checked from the start of the download instead. The
+    same query returns Commons thumbnails of `thumbnail_width`, which are
+    downloaded in place of larger originals, falling back to the original if
+    the thumbnail fails. The returned image_url is always the original.
+    Downloads run on a bounded thread pool sharing one pooled session, and
+    every finished download is handed to a separate conversion pool. The bytes
+    held between the two stages are capped by `max_inflight_bytes`.
+
     Parameters:
         page : MediaWikiPage
             The MediaWiki page object.
         min_size : tuple
             Minimum size of the image to be downloaded.
+        max_workers : int
+            Number of concurrent downloads.
+        convert_workers : int
+            Number of concurrent PNG/SVG conversions.
+        max_inflight_bytes : int
+            Maximum number of downloaded bytes waiting for or in conversion.
+        thumbnail_width : int
+            Width of the thumbnails fetched instead of originals, 0 for originals.
+        blob_store : BlobStore
+            Store the PNGs are saved to, defaults to the shared image store.
 
     Returns:
         list
-        List of dictionaries containing image data and image name.
+        List of dictionaries containing the blob hash, name and url of each image.
     """
-    images = page.images
+    image_info = fetch_image_info(page, thumbnail_width)
+    # images the imageinfo query missed are kept and checked from their header instead
+    images = list(dict.fromkeys([*page.images, *sorted(image_info)]))
     headers = {"User-Agent": USER_AGENT}
-    png_images = []
+    session = get_image_session()
+    budget = ByteBudget(max_inflight_bytes)
+    blob_store = blob_store or get_blob_store()
+    stats = ImageStats()
+    stats.add(images=len(images))
 
+    kept_images = []
     for image_url in images:
-        png_image = process_image(image_url, headers, min_size)
-        if png_image:
-            png_images.append(png_image)
-        # Clear memory after each image
-        gc.collect()
+        info = image_info.get(image_url)
+        if (
+            info
+            and info.get("width")
+            and not image_url.endswith(".svg")
+            and is_size_too_small((info["width"], info["height"] or 0), min_size)
+        ):
+            stats.add(skipped_preflight=1)
+            continue
+        kept_images.append(image_url)
+
+    with ThreadPoolExecutor(max_workers=max(1, convert_workers)) as convert_pool:
+
+        def convert_and_release(image_url, image_data, reserved, download_url):
+            try:
+                return convert_image(
+                    image_url, image_data, min_size, stats, download_url, blob_store
+                )
+            finally:
+                budget.release(reserved)
+
+        def download_and_submit(image_url):
+            info = image_info.get(image_url)
+            download_url = get_download_url(image_url, info)
+            image_data, reserved = download_image(
+                download_url, headers, budget, session, info=info, min_size=min_size, stats=stats
+            )
+            if image_data is None and download_url != image_url:
+                logging.info(f"Thumbnail failed, downloading original: {image_url}")
+                budget.release(reserved)
+                download_url = image_url
+                image_data, reserved = download_image(
+                    image_url, headers, budget, session, info=info, min_size=min_size, stats=stats
+                )
+            if image_data is None:
+                budget.release(reserved)
+                return None
+            if download_url != image_url:
+                stats.add(thumbnails=1)
+            return convert_pool.submit(
+                convert_and_release, image_url, image_data, reserved, download_url
+            )
+
+        with ThreadPoolExecutor(max_workers=max(1, max_workers)) as download_pool:
+            conversions = list(download_pool.map(download_and_submit, kept_images))
+
+        png_images = [
+            conversion.result() for conversion in conversions if conversion is not None
+        ]
 
-    logging.info(f"Total images converted: {len(png_images)}")
+    png_images = [png_image for png_image in png_images if png_image]
+    stats.add(converted=len(png_images))
+    logging.info(f"Images for page {getattr(page, 'title', '')}: {stats.as_dict()}")
     return png_images
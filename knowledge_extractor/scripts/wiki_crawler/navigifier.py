@@ -1,28 +1,14 @@
-from mediawiki import MediaWiki
 import re
-import os
 import logging
-from dotenv import load_dotenv
+from collections import namedtuple
+from scripts.wiki_crawler.clientifier import get_wiki_client
 
 
-# get env variables
-load_dotenv()
-url = os.getenv("WIKI_API_URL")
-user_agent = os.getenv("WIKI_USER_AGENT")
+# a section of the page content - page_content[start:end] is its text
+Section = namedtuple("Section", ["title", "level", "start", "end", "text"])
 
-# initialise the mediawiki object
-wikipedia = MediaWiki(user_agent=user_agent)
-
-# set the api url if exists, otherwise use default wikipedia
-if url and url.strip():
-        try:
-            wikipedia.set_api_url(url)
-        except Exception as e:
-            logging.error(f"Error setting API URL: {e}. Defaulting to Wikipedia.")
-            wikipedia.set_api_url("https://en.wikipedia.org/w/api.php")
-else:
-        logging.warning("Empty or invalid API URL. Defaulting to Wikipedia.")
-        wikipedia.set_api_url("https://en.wikipedia.org/w/api.php")
+# the API accepts at most 50 titles per query
+MAX_TITLES_PER_QUERY = 50
 
 
 def get_wiki_page(title):
@@ -39,7 +25,7 @@ def get_wiki_page(title):
     """
 
     try:
-        page = wikipedia.page(title)
+        page = get_wiki_client().page(title)
         return page
     except Exception as e:
         logging.error(f"Error retrieving page {title}: {e}")
@@ -165,27 +151,66 @@ def get_intro_content(page_content):
 
 # splitting the sectins and subsections to see the hierarchical structure of the page - contents
 def extract_section_titles(page_content):
+    """get the titles of sections and their subsections
+
+    Parameters
+        page_content : str
+            the full content of the page
+
+    Returns
+        sections : list
+            list of tuples of section title and list of its subsection titles
+    """
+    return [
+        (section.title, [subsection.title for subsection in subsections])
+        for section, subsections in index_sections(page_content)
+    ]
+
+
+def index_sections(page_content):
+    """Index all sections and subsections of the page content in one pass
+
+    Every header is found once with the same pattern as extract_section_titles,
+    and the text of a section is everything between its header and the next
+    header of any level, so repeated titles such as "History" each keep their
+    own text.
+
+    Parameters
+        page_content : str
+            the full content of the page
+
+    Returns
+        sections : list
+            list of tuples of a Section and the list of its subsection Sections
+    """
     # identify pattern with == section == or === subsection ===
     section_pattern = re.compile(r"(^==[^=].*?==)|(^===.*?===)", re.MULTILINE)
-
-    # find all
-    titles = section_pattern.findall(page_content)
+    headers = list(section_pattern.finditer(page_content))
 
     sections = []
     current_section = None
     current_subsections = []
 
-    for title in titles:
-        section_title = title[0].strip("= ").strip() if title[0] else None
-        subsection_title = title[1].strip("= ").strip() if title[1] else None
-
-        if section_title:
+    for idx, header in enumerate(headers):
+        next_header = headers[idx + 1].start() if idx + 1 < len(headers) else len(page_content)
+        raw_text = page_content[header.end():next_header]
+        text = raw_text.lstrip("=").strip()
+        start = header.end() + len(raw_text) - len(raw_text.lstrip("=").lstrip())
+        end = start + len(text)
+
+        if header.group(1):
+            section = Section(
+                header.group(1).strip("= ").strip(), 2, start, end, text
+            )
             if current_section:
                 sections.append((current_section, current_subsections))
-            current_section = section_title
+            current_section = section
             current_subsections = []
-        elif subsection_title:
-            current_subsections.append(subsection_title)
+        else:
+            subsection = Section(
+                header.group(2).strip("= ").strip(), 3, start, end, text
+            )
+            current_subsections.append(subsection)
 
     if current_section:
         sections.append((current_section, current_subsections))
@@ -193,7 +218,181 @@ def extract_section_titles(page_content):
     return sections
 
 
+class PageRecord:
+    """Light page record filled by fetch_page_records.
+
+    Holds what the bulk query returns for a page and offers the attributes of
+    MediaWikiPage the ingestion uses. Only the full plain text and the html are
+    requested per page, since the API returns whole page extracts one page at
+    a time.
+    """
+
+    def __init__(self, title, pageid, revision_id, summary, categories, wikitext, mediawiki):
+        self.title = title
+        self.pageid = pageid
+        self.revision_id = revision_id
+        self.summary = summary
+        self.categories = categories
+        self.wikitext = wikitext
+        self.mediawiki = mediawiki
+        self.images = []
+        self._content = None
+
+    @property
+    def url(self):
+        base_url = getattr(self.mediawiki, "base_url", None) or "https://en.wikipedia.org"
+        return f"{base_url}/wiki/{self.title.replace(' ', '_')}"
+
+    @property
+    def content(self):
+        """Plain text of the page as the extracts API renders it, fetched on first use"""
+        if self._content is None:
+            self._content = get_record_content(self)
+        return self._content
+
+    def __repr__(self):
+        return f"PageRecord(title={self.title!r}, revision_id={self.revision_id!r})"
+
+
+def _strip_namespace(title):
+    return title.split(":", 1)[1] if ":" in title else title
+
 
+def _query_page_batch(titles, client):
+    """Run the combined property query for up to 50 titles, following continuation
 
+    Returns
+        tuple
+            dict of page id -> merged page data and dict of requested title -> final title
+    """
+    params = {
+        "action": "query",
+        "titles": "|".join(titles),
+        "prop": "extracts|categories|revisions|info",
+        "redirects": "",
+        # summary - only intro extracts can be returned for several pages at once
+        "explaintext": "",
+        "exintro": "",
+        "exlimit": "max",
+        # categories
+        "cllimit": "max",
+        "clshow": "!hidden",
+        # latest revision with its wikitext
+        "rvprop": "ids|content",
+        "rvslots": "main",
+    }
+    pages = {}
+    resolved = {title: title for title in titles}
+    last_continue = {}
+    while True:
+        response = client.wiki_request({**params, **last_continue})
+        query = response.get("query", {})
+        for mapping in query.get("normalized", []) + query.get("redirects", []):
+            for title, target in resolved.items():
+                if target == mapping["from"]:
+                    resolved[title] = mapping["to"]
+        for page_id, page in query.get("pages", {}).items():
+            merged = pages.setdefault(page_id, {"categories": []})
+            for key, value in page.items():
+                if key == "categories":
+                    merged[key].extend(value)
+                elif key not in merged or not merged[key]:
+                    merged[key] = value
+        if "continue" not in response or response["continue"] == last_continue:
+            break
+        last_continue = response["continue"]
+    return pages, resolved
+
+
+def fetch_page_records(titles, batch_size=MAX_TITLES_PER_QUERY, client=None):
+    """Fetch summary, categories, revision id and wikitext of many pages at once
+
+    Titles are sent 50 per query with the properties combined, so N pages
+    take about N/50 round trips (a few more when a batch needs continuation)
+    instead of one request per property per page.
+
+    Parameters
+        titles : list
+            titles of the pages
+        batch_size : int, optional
+            titles per query, at most 50
+        client : MediaWiki, optional
+            the client used, defaults to the shared one
+
+    Returns
+        records : dict
+            requested title -> PageRecord, missing pages are left out
+    """
+    client = client or get_wiki_client()
+    batch_size = max(1, min(batch_size, MAX_TITLES_PER_QUERY))
+    records = {}
+    for idx in range(0, len(titles), batch_size):
+        batch = list(dict.fromkeys(titles[idx:idx + batch_size]))
+        try:
+            pages, resolved = _query_page_batch(batch, client)
+        except Exception as e:
+            logging.error(f"Failed to fetch page records for {batch}: {e}")
+            continue
+
+        by_title = {page.get("title"): page for page in pages.values() if "missing" not in page}
+        for title in batch:
+            page = by_title.get(resolved[title])
+            if page is None:
+                logging.warning(f"Page not found: {title}")
+                continue
+            revision = (page.get("revisions") or [{}])[0]
+            wikitext = revision.get("slots", {}).get("main", {}).get("*", revision.get("*", ""))
+            records[title] = PageRecord(
+                title=page["title"],
+                pageid=page.get("pageid"),
+                revision_id=revision.get("revid", page.get("lastrevid")),
+                summary=page.get("extract", ""),
+                categories=[_strip_namespace(category["title"]) for category in page["categories"]],
+                wikitext=wikitext,
+                mediawiki=client,
+            )
+    logging.info(f"Fetched {len(records)} page records for {len(titles)} titles")
+    return records
+
+
+def get_record_content(record):
+    """get full content of a page record
 
+    Parameters
+        record : PageRecord
+            the page record
 
+    Returns:
+        content : str
+            text content of the page with sections and subsections separated by === section ===
+    """
+    try:
+        response = record.mediawiki.wiki_request(
+            {"action": "query", "titles": record.title, "prop": "extracts", "explaintext": "", "redirects": ""}
+        )
+        page = next(iter(response["query"]["pages"].values()))
+        return page.get("extract", "")
+    except Exception as e:
+        logging.error(f"Failed to retrieve page content: {e}")
+        return ""
+
+
+def get_record_html(record):
+    """get html of a page record
+
+    Parameters
+        record : PageRecord
+            the page record
+
+    Returns:
+        html : str
+            html content of the page
+    """
+    try:
+        response = record.mediawiki.wiki_request(
+            {"action": "parse", "page": record.title, "prop": "text", "redirects": "", "formatversion": "2"}
+        )
+        return response["parse"]["text"]
+    except Exception as e:
+        logging.error(f"Failed to retrieve page HTML: {e}")
+        return ""
@@ -0,0 +1,191 @@
+import os
+import re
+import signal
+import ctypes
+import logging
+import resource
+import threading
+import multiprocessing
+from collections import namedtuple
+from bs4 import BeautifulSoup
+from dotenv import load_dotenv
+import cairosvg
+
+
+# get env variables
+load_dotenv()
+# longest side of the PNG an SVG is rendered to
+SVG_RASTER_SIZE = int(os.getenv("SVG_RASTER_SIZE") or 1000)
+SVG_RASTER_WORKERS = int(os.getenv("SVG_RASTER_WORKERS") or 2)
+SVG_CPU_SECONDS = int(os.getenv("SVG_CPU_SECONDS") or 10)
+SVG_MEMORY_MB = int(os.getenv("SVG_MEMORY_MB") or 1024)
+# wall clock limit, catches renders stuck waiting rather than computing
+SVG_TIMEOUT_SECONDS = float(os.getenv("SVG_TIMEOUT_SECONDS") or 30)
+
+try:
+    # Attempt to load the Cairo library for Linux
+    # The Cairo library should be installed in the Docker container using a package manager
+    ctypes.CDLL("libcairo.so.2")
+except OSError as e:
+    print(f"Error loading libcairo.so.2: {e}")
+
+
+RasterResult = namedtuple("RasterResult", ["png_data", "skipped_reason"])
+
+LENGTH_PATTERN = re.compile(r"^\s*([\d.]+)\s*(px)?\s*$")
+
+_raster_slots = threading.BoundedSemaphore(max(1, SVG_RASTER_WORKERS))
+_context = None
+_context_lock = threading.Lock()
+
+
+class CpuLimitExceeded(Exception):
+    pass
+
+
+def _parse_length(value):
+    """Get a length in pixels from an svg attribute, None for relative or other units"""
+    match = LENGTH_PATTERN.match(value or "")
+    if not match:
+        return None
+    try:
+        return float(match.group(1))
+    except ValueError:
+        return None
+
+
+def preprocess_svg(svg_content, raster_size=SVG_RASTER_SIZE):
+    """Give the SVG a pixel size whose longest side is at most raster_size.
+
+    Missing or relative width and height are filled in from the viewBox, keeping
+    its aspect ratio, and SVGs larger than raster_size are scaled down.
+
+    Returns
+        str
+            the svg content with width and height set
+    """
+    try:
+        soup = BeautifulSoup(svg_content, "xml")
+        svg_tag = soup.find("svg")
+        width = _parse_length(svg_tag.get("width"))
+        height = _parse_length(svg_tag.get("height"))
+
+        if not width or not height:
+            view_box = (svg_tag.get("viewBox") or "").replace(",", " ").split()
+            if len(view_box) == 4 and float(view_box[2]) > 0 and float(view_box[3]) > 0:
+                width, height = float(view_box[2]), float(view_box[3])
+            else:
+                width, height = raster_size, raster_size
+
+        scale = min(1.0, raster_size / max(width, height))
+        if not svg_tag.get("viewBox"):
+            svg_tag["viewBox"] = f"0 0 {width:g} {height:g}"
+        svg_tag["width"] = f"{max(1, round(width * scale))}"
+        svg_tag["height"] = f"{max(1, round(height * scale))}"
+        return str(soup)
+    except Exception as e:
+        logging.error(f"Error preprocessing SVG: {e}")
+        return svg_content
+
+
+def render_svg(svg_data, raster_size):
+    """Render SVG bytes to PNG bytes"""
+    preprocessed_svg = preprocess_svg(svg_data.decode("utf-8"), raster_size)
+    return cairosvg.svg2png(bytestring=preprocessed_svg.encode("utf-8"))
+
+
+def _raise_cpu_limit(signum, frame):
+    raise CpuLimitExceeded()
+
+
+def _rasterise_in_child(conn, svg_data, raster_size, cpu_seconds, memory_bytes, renderer):
+    """Render one SVG under CPU and memory limits and send the outcome back"""
+    # SIGXCPU at the soft limit lets the render stop cleanly, the hard limit kills it
+    signal.signal(signal.SIGXCPU, _raise_cpu_limit)
+    resource.setrlimit(resource.RLIMIT_CPU, (cpu_seconds, cpu_seconds + 2))
+    if memory_bytes:
+        resource.setrlimit(resource.RLIMIT_AS, (memory_bytes, memory_bytes))
+    try:
+        conn.send(("ok", renderer(svg_data, raster_size)))
+    except CpuLimitExceeded:
+        conn.send(("skipped", f"cpu limit of {cpu_seconds}s exceeded"))
+    except MemoryError:
+        conn.send(("skipped", f"memory limit of {memory_bytes // (1024 * 1024)}MB exceeded"))
+    except Exception as e:
+        conn.send(("skipped", f"render error: {e}"))
+    finally:
+        conn.close()
+
+
+def _get_context():
+    global _context
+    with _context_lock:
+        if _context is None:
+            # forking the threaded crawler is unsafe, a fork server starts from a clean process
+            _context = multiprocessing.get_context("forkserver")
+            _context.set_forkserver_preload([__name__])
+        return _context
+
+
+def rasterise_svg(
+    svg_data,
+    raster_size=SVG_RASTER_SIZE,
+    cpu_seconds=SVG_CPU_SECONDS,
+    memory_mb=SVG_MEMORY_MB,
+    timeout=SVG_TIMEOUT_SECONDS,
+    renderer=render_svg,
+):
+    """Render an SVG to PNG in a separate process with resource limits.
+
+    Every SVG gets its own short lived process so a render that hangs or blows
+    its limits can be killed without affecting the others; at most
+    SVG_RASTER_WORKERS renders run at once.
+
+    Parameters
+        svg_data : bytes
+            the svg file content
+        raster_size : int, optional
+            longest side of the rendered PNG
+        cpu_seconds : int, optional
+            CPU time allowed for the render
+        memory_mb : int, optional
+            address space allowed for the render process, 0 for no limit
+        timeout : float, optional
+            wall clock time allowed for the render
+        renderer : callable, optional
+            function(svg_data, raster_size) returning PNG bytes
+
+    Returns
+        RasterResult
+            png_data, or None with the reason the SVG was skipped
+    """
+    context = _get_context()
+    with _raster_slots:
+        parent_conn, child_conn = context.Pipe(duplex=False)
+        process = context.Process(
+            target=_rasterise_in_child,
+            args=(child_conn, svg_data, raster_size, cpu_seconds, memory_mb * 1024 * 1024, renderer),
+            daemon=True,
+        )
+        process.start()
+        child_conn.close()
+        try:
+            if not parent_conn.poll(timeout):
+                process.terminate()
+                return RasterResult(None, f"timed out after {timeout:g}s")
+            status, value = parent_conn.recv()
+        except EOFError:
+            process.join()
+            if process.exitcode in (-signal.SIGKILL, -signal.SIGXCPU):
+                return RasterResult(None, f"cpu limit of {cpu_seconds}s exceeded")
+            return RasterResult(None, f"render process exited with code {process.exitcode}")
+        finally:
+            parent_conn.close()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.kill()
+                process.join()
+
+    if status == "ok":
+        return RasterResult(value, None)
+    return RasterResult(None, value)
@@ -1,11 +1,5 @@
-from mediawiki import MediaWiki
 import logging
-import os
-from dotenv import load_dotenv
-
-# get env variables
-load_dotenv()
-user_agent = os.getenv("WIKI_USER_AGENT")
+from scripts.wiki_crawler.clientifier import get_wiki_client
 
 def search_wiki(query, url=None, results=2, suggestions=False):
     """
@@ -25,15 +19,8 @@ def search_wiki(query, url=None, results=2, suggestions=False):
         list
             list of top 10 relevant of Wikipedia page titles matching the query
     """
-    wikipedia = MediaWiki(user_agent=user_agent)
-    if url:
-        try:
-            wikipedia.set_api_url(url)
-        except Exception as e:
-            logging.error(f"Error setting API URL: {e}. Defaulting to Wikipedia.")
-            wikipedia.set_api_url("https://en.wikipedia.org/w/api.php")
-
     try:
+        wikipedia = get_wiki_client(url)
         results = wikipedia.search(query, results=results, suggestion=suggestions)
         return results
     except Exception as e:
@@ -0,0 +1,71 @@
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import urlparse
+
+
+DEFAULT_API_HOST = "en.wikipedia.org"
+
+
+def get_api_host(url=None):
+    """Get the host name of a wiki API url
+
+    Parameters
+        url : str, optional
+            the wiki API url, defaults to english wikipedia
+
+    Returns
+        host : str
+            the host name used to group requests
+    """
+    if not url or not url.strip():
+        return DEFAULT_API_HOST
+    return urlparse(url).netloc or DEFAULT_API_HOST
+
+
+class HostThrottle:
+    """Per-host concurrency limit with a politeness delay between request starts.
+
+    Every host gets its own semaphore, so at most `max_per_host` workers talk to
+    the same host at once, and consecutive starts on a host are spaced by at
+    least `delay` seconds as asked by the MediaWiki API etiquette.
+    """
+
+    def __init__(self, max_per_host=2, delay=1.0):
+        self.max_per_host = max(1, int(max_per_host))
+        self.delay = max(0.0, float(delay))
+        self._lock = threading.Lock()
+        self._semaphores = {}
+        self._next_start = {}
+
+    def _get_semaphore(self, host):
+        with self._lock:
+            if host not in self._semaphores:
+                self._semaphores[host] = threading.BoundedSemaphore(self.max_per_host)
+            return self._semaphores[host]
+
+    def _wait_for_turn(self, host):
+        """Reserve the next start time for the host and sleep until it comes."""
+        with self._lock:
+            now = time.monotonic()
+            start_at = max(now, self._next_start.get(host, now))
+            self._next_start[host] = start_at + self.delay
+        wait_time = start_at - time.monotonic()
+        if wait_time > 0:
+            time.sleep(wait_time)
+
+    @contextmanager
+    def slot(self, host):
+        """Hold one of the host's slots for the duration of the block
+
+        Parameters
+            host : str
+                the host the work inside the block talks to
+        """
+        semaphore = self._get_semaphore(host)
+        semaphore.acquire()
+        try:
+            self._wait_for_turn(host)
+            yield
+        finally:
+            semaphore.release()
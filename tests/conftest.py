@@ -0,0 +1,62 @@
+import base64
+import io
+import os
+import shutil
+import tempfile
+import numpy as np
+from PIL import Image, ImageDraw
+from llama_index.core.schema import ImageNode, NodeRelationship, RelatedNodeInfo
+
+# the caches and the blob store default to paths under the working directory,
+# point them at a scratch directory before any module reads its settings
+_data_dir = tempfile.mkdtemp(prefix="knowledge_extractor_tests_")
+os.environ["WIKI_CACHE_PATH"] = os.path.join(_data_dir, "cache", "wiki_responses.sqlite")
+os.environ["LLM_CACHE_PATH"] = os.path.join(_data_dir, "cache", "llm_responses.sqlite")
+os.environ["EMBEDDING_CACHE_PATH"] = os.path.join(_data_dir, "cache", "embeddings.sqlite")
+os.environ["IMAGE_BLOB_STORE_PATH"] = os.path.join(_data_dir, "blobs")
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_data_dir, ignore_errors=True)
+
+
+def to_bytes(image, format="PNG"):
+    buffer = io.BytesIO()
+    image.save(buffer, format=format)
+    return buffer.getvalue()
+
+
+def make_chart(size=(480, 320), background="white", mode="RGB"):
+    """A line chart with axes and a label"""
+    width, height = size
+    line_width = max(2, width // 400)
+    image = Image.new(mode, size, background)
+    draw = ImageDraw.Draw(image)
+    draw.line([(40, 20), (40, height - 30), (width - 20, height - 30)], fill="black", width=line_width)
+    step = (width - 80) / 19
+    draw.line(
+        [(40 + idx * step, height / 2 - 10 + (idx % 5) * height / 16) for idx in range(20)],
+        fill="blue", width=line_width,
+    )
+    draw.text((5, 10), "100", fill="black")
+    return to_bytes(image)
+
+
+def make_photo(size=(320, 240), format="JPEG"):
+    """A noisy colour gradient, as photos have many colours and hardly any flat areas"""
+    width, height = size
+    rng = np.random.default_rng(0)
+    y, x = np.mgrid[0:height, 0:width]
+    pixels = np.stack([x * 224 / width, y * 216 / height, (x / width + y / height) * 100], axis=2)
+    pixels += rng.normal(0, 10, (height, width, 3))
+    return to_bytes(Image.fromarray(np.clip(pixels, 0, 255).astype(np.uint8)), format)
+
+
+def make_image_node(title, size=(64, 48), color="grey", image_data=None):
+    """An image node of a page, a plain image of the colour unless image data is given"""
+    node = ImageNode(
+        image=base64.b64encode(image_data or to_bytes(Image.new("RGB", size, color))).decode(),
+        metadata={"type": "image", "title": title, "context": "Eiffel Tower"},
+    )
+    node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id="page")
+    return node
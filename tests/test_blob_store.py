@@ -0,0 +1,39 @@
+import base64
+import tempfile
+from llama_index.core.schema import ImageNode
+from scripts.storage.blob_store import BlobStore, load_node_image
+
+
+def test_identical_blobs_are_stored_once():
+    with tempfile.TemporaryDirectory() as root:
+        store = BlobStore(root)
+
+        first_hash = store.put(b"same image")
+        second_hash = store.put(b"same image")
+        other_hash = store.put(b"other image")
+
+        assert first_hash == second_hash
+        assert first_hash != other_hash
+        assert store.get(first_hash) == b"same image"
+        assert store.path(first_hash).startswith(f"{root}/{first_hash[:2]}/{first_hash[2:4]}/")
+
+
+def test_missing_and_empty_blobs():
+    with tempfile.TemporaryDirectory() as root:
+        store = BlobStore(root)
+
+        assert store.get("0" * 64) is None
+        assert store.get(store.put(b"")) == b""
+
+
+def test_image_node_loads_from_store_or_inline_image():
+    with tempfile.TemporaryDirectory() as root:
+        store = BlobStore(root)
+        image_hash = store.put(b"png bytes")
+
+        stored_node = ImageNode(image_path=store.path(image_hash), metadata={"image_hash": image_hash})
+        inline_node = ImageNode(image=base64.b64encode(b"inline bytes").decode("utf-8"))
+
+        assert load_node_image(stored_node, store) == b"png bytes"
+        assert load_node_image(inline_node, store) == b"inline bytes"
+        assert store.get_base64(image_hash) == base64.b64encode(b"png bytes").decode("utf-8")
@@ -0,0 +1,58 @@
+import time
+import threading
+from unittest.mock import patch
+from scripts.wiki_crawler.throttlinator import HostThrottle, get_api_host
+from scripts.data_processing import process_pages
+
+
+def test_host_throttle_limits_concurrency():
+    throttle = HostThrottle(max_per_host=2, delay=0)
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def work():
+        with throttle.slot("en.wikipedia.org"):
+            with lock:
+                active.append(1)
+                peak.append(len(active))
+            time.sleep(0.05)
+            with lock:
+                active.pop()
+
+    threads = [threading.Thread(target=work) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert max(peak) <= 2
+
+
+def test_host_throttle_politeness_delay():
+    throttle = HostThrottle(max_per_host=4, delay=0.05)
+    start = time.monotonic()
+    for _ in range(3):
+        with throttle.slot("en.wikipedia.org"):
+            pass
+    assert time.monotonic() - start >= 0.1
+
+
+def test_get_api_host():
+    assert get_api_host("https://commons.wikimedia.org/w/api.php") == "commons.wikimedia.org"
+    assert get_api_host(None) == "en.wikipedia.org"
+
+
+def test_process_pages_keeps_order_and_skips_failures():
+    def fake_process(title):
+        if title == "Broken":
+            raise ValueError("page failed")
+        time.sleep(0.05 if title == "First" else 0)
+        return [title]
+
+    crawl_config = {"max_workers": 3, "max_per_host": 3, "politeness_delay": 0}
+    with patch("scripts.data_processing.fetch_page_records", return_value={}), \
+            patch("scripts.data_processing.process_page_into_doc_and_nodes", side_effect=fake_process):
+        documents = process_pages(["First", "Broken", "Second", "Third"], crawl_config=crawl_config)
+
+    assert documents == [["First"], ["Second"], ["Third"]]
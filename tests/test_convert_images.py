@@ -5,12 +5,32 @@ import requests
 from PIL import Image
 from PIL import UnidentifiedImageError
 import io
+import threading
+import tempfile
+import shutil
 
-from scripts.wiki_crawler.imagifier import convert_images_to_png
+from scripts.wiki_crawler.imagifier import (
+    convert_images_to_png,
+    convert_image,
+    download_image,
+    fetch_image_info,
+    ByteBudget,
+    ImageStats,
+)
+from scripts.storage.blob_store import BlobStore
 
 
-class TestConvertImagesToPng(unittest.TestCase):
-    @patch("requests.get")
+class BlobStoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.blob_dir = tempfile.mkdtemp()
+        self.blob_store = BlobStore(self.blob_dir)
+
+    def tearDown(self):
+        shutil.rmtree(self.blob_dir)
+
+
+class TestConvertImagesToPng(BlobStoreTestCase):
+    @patch("requests.Session.get")
     @patch("mediawiki.MediaWiki")
     def test_convert_images_to_png(self, MockMediaWiki, mock_requests_get):
         # Mock MediaWiki page object
@@ -28,26 +48,26 @@ class TestConvertImagesToPng(unittest.TestCase):
             "https://example.com/image3.png": requests.Response(),
         }
 
-        mock_responses["https://example.com/image1.jpg"]._content = (
+        mock_responses["https://example.com/image1.jpg"].raw = io.BytesIO(
             self._create_sample_image_bytes(format="JPEG")
         )
         mock_responses["https://example.com/image1.jpg"].status_code = 200
-        mock_responses["https://example.com/image2.svg"]._content = (
+        mock_responses["https://example.com/image2.svg"].raw = io.BytesIO(
             b'<svg height="100" width="100"><circle cx="50" cy="50" r="40" stroke="black" stroke-width="3" fill="red" /></svg>'
         )
         mock_responses["https://example.com/image2.svg"].status_code = 200
-        mock_responses["https://example.com/image3.png"]._content = (
+        mock_responses["https://example.com/image3.png"].raw = io.BytesIO(
             self._create_sample_image_bytes(format="PNG")
         )
         mock_responses["https://example.com/image3.png"].status_code = 200
 
-        mock_requests_get.side_effect = lambda url, headers: mock_responses[url]
+        mock_requests_get.side_effect = lambda url, **kwargs: mock_responses[url]
 
-        png_images = convert_images_to_png(mock_page)
+        png_images = convert_images_to_png(mock_page, blob_store=self.blob_store)
 
         self.assertEqual(len(png_images), 3)  # Check if three images are processed
         for img_data in png_images:
-            self.assertTrue(self._is_png(img_data["image_data"]))
+            self.assertTrue(self._is_png(self.blob_store.get(img_data["image_hash"])))
             self.assertTrue(isinstance(img_data["image_name"], str))
 
     def _create_sample_image_bytes(self, format="PNG"):
@@ -65,5 +85,231 @@ class TestConvertImagesToPng(unittest.TestCase):
             return False
 
 
+def create_image_bytes(size, format="PNG", noise=False):
+    img = Image.new("RGB", size, color=(73, 109, 137))
+    if noise:
+        img = Image.effect_noise(size, 100).convert("RGB")
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format=format)
+    return img_byte_arr.getvalue()
+
+
+def create_response(content):
+    response = requests.Response()
+    response.raw = io.BytesIO(content)
+    response.status_code = 200
+    return response
+
+
+class TestImagePreflight(BlobStoreTestCase):
+    @patch("requests.Session.get")
+    def test_imageinfo_skips_small_images_before_download(self, mock_requests_get):
+        mock_page = Mock()
+        mock_page.title = "Test page"
+        mock_page.images = [
+            "https://example.com/flag.png",
+            "https://example.com/photo.jpg",
+        ]
+        mock_page.mediawiki.wiki_request.return_value = {
+            "query": {
+                "pages": {
+                    "-1": {"imageinfo": [{"url": "https://example.com/flag.png", "width": 20, "height": 12, "size": 300}]},
+                    "-2": {"imageinfo": [{"url": "https://example.com/photo.jpg", "width": 100, "height": 100, "size": 2000}]},
+                }
+            }
+        }
+        mock_requests_get.side_effect = lambda url, **kwargs: create_response(
+            create_image_bytes((100, 100), format="JPEG")
+        )
+
+        png_images = convert_images_to_png(mock_page, blob_store=self.blob_store)
+
+        requested_urls = [call.args[0] for call in mock_requests_get.call_args_list]
+        self.assertEqual(requested_urls, ["https://example.com/photo.jpg"])
+        self.assertEqual([img["image_name"] for img in png_images], ["photo"])
+
+    @patch("requests.Session.get")
+    def test_small_image_download_stops_after_header(self, mock_requests_get):
+        content = create_image_bytes((40, 2000), format="PNG", noise=True)
+        response = create_response(content)
+        mock_requests_get.return_value = response
+        stats = ImageStats()
+
+        image_data, _ = download_image(
+            "https://example.com/icon.png", {}, min_size=(50, 50), stats=stats
+        )
+
+        self.assertIsNone(image_data)
+        self.assertEqual(stats.skipped_header, 1)
+        self.assertLess(stats.bytes_downloaded, len(content))
+
+    def test_each_kept_image_is_decoded_at_most_once(self):
+        stats = ImageStats()
+
+        png_result = convert_image(
+            "https://example.com/a.png", create_image_bytes((100, 100)), (50, 50), stats, blob_store=self.blob_store
+        )
+        self.assertEqual(stats.decodes, 0)
+        jpeg_result = convert_image(
+            "https://example.com/b.jpg", create_image_bytes((100, 100), format="JPEG"), (50, 50), stats,
+            blob_store=self.blob_store,
+        )
+        self.assertEqual(stats.decodes, 1)
+
+        self.assertEqual(Image.open(io.BytesIO(self.blob_store.get(png_result["image_hash"]))).format, "PNG")
+        self.assertEqual(Image.open(io.BytesIO(self.blob_store.get(jpeg_result["image_hash"]))).format, "PNG")
+
+
+    @patch("requests.Session.get")
+    def test_images_missing_from_imageinfo_are_checked_from_the_header(self, mock_requests_get):
+        mock_page = Mock()
+        mock_page.title = "Test page"
+        mock_page.images = [
+            "https://example.com/photo.jpg",
+            "https://example.com/icon.png",
+            "https://example.com/map.png",
+        ]
+        mock_page.mediawiki.wiki_request.return_value = {
+            "query": {
+                "pages": {
+                    "-1": {"imageinfo": [{"url": "https://example.com/photo.jpg", "width": 100, "height": 100}]},
+                }
+            }
+        }
+        contents = {
+            "https://example.com/photo.jpg": create_image_bytes((100, 100), format="JPEG"),
+            "https://example.com/icon.png": create_image_bytes((20, 20), noise=True),
+            "https://example.com/map.png": create_image_bytes((120, 80)),
+        }
+        mock_requests_get.side_effect = lambda url, **kwargs: create_response(contents[url])
+
+        png_images = convert_images_to_png(mock_page, blob_store=self.blob_store)
+
+        self.assertEqual(sorted(img["image_name"] for img in png_images), ["map", "photo"])
+
+    @patch("requests.Session.get")
+    def test_failed_download_returns_its_reservation(self, mock_requests_get):
+        def broken_body(chunk_size):
+            raise ValueError("broken body")
+            yield b""
+
+        bad_length = create_response(create_image_bytes((100, 100)))
+        bad_length.headers["Content-Length"] = "not a number"
+        broken = create_response(b"")
+        broken.headers["Content-Length"] = "400"
+        broken.iter_content = broken_body
+        mock_requests_get.side_effect = [bad_length, broken]
+        budget = ByteBudget(1000)
+        stats = ImageStats()
+
+        for _ in range(2):
+            image_data, reserved = download_image("https://example.com/a.png", {}, budget, stats=stats)
+            self.assertIsNone(image_data)
+            budget.release(reserved)
+
+        self.assertEqual(reserved, 400)
+        self.assertEqual(stats.failed, 2)
+        self.assertEqual(budget.in_flight, 0)
+
+
+class TestThumbnails(BlobStoreTestCase):
+    def _mock_page(self):
+        mock_page = Mock()
+        mock_page.title = "Test page"
+        mock_page.images = [
+            "https://example.com/big.jpg",
+            "https://example.com/diagram.svg",
+        ]
+        mock_page.mediawiki.wiki_request.return_value = {
+            "query": {
+                "pages": {
+                    "-1": {"imageinfo": [{
+                        "url": "https://example.com/big.jpg", "width": 8000, "height": 6000,
+                        "thumburl": "https://example.com/thumb/1024px-big.jpg", "thumbwidth": 1024, "thumbheight": 768,
+                    }]},
+                    "-2": {"imageinfo": [{
+                        "url": "https://example.com/diagram.svg", "width": 400, "height": 400,
+                        "thumburl": "https://example.com/thumb/400px-diagram.svg.png", "thumbwidth": 400, "thumbheight": 400,
+                    }]},
+                }
+            }
+        }
+        return mock_page
+
+    @patch("requests.Session.get")
+    def test_thumbnails_are_fetched_instead_of_originals(self, mock_requests_get):
+        mock_page = self._mock_page()
+        mock_requests_get.side_effect = lambda url, **kwargs: create_response(
+            create_image_bytes((1024, 768), format="JPEG") if url.endswith(".jpg")
+            else create_image_bytes((400, 400), format="PNG")
+        )
+
+        png_images = convert_images_to_png(mock_page, blob_store=self.blob_store)
+
+        requested_urls = sorted(call.args[0] for call in mock_requests_get.call_args_list)
+        self.assertEqual(requested_urls, [
+            "https://example.com/thumb/1024px-big.jpg",
+            "https://example.com/thumb/400px-diagram.svg.png",
+        ])
+        self.assertEqual(
+            [img["image_url"] for img in png_images],
+            ["https://example.com/big.jpg", "https://example.com/diagram.svg"],
+        )
+        self.assertEqual(mock_page.mediawiki.wiki_request.call_args.args[0]["iiurlwidth"], 1024)
+
+    @patch("requests.Session.get")
+    def test_failed_thumbnail_falls_back_to_original(self, mock_requests_get):
+        mock_page = self._mock_page()
+        mock_page.images = ["https://example.com/big.jpg"]
+        del mock_page.mediawiki.wiki_request.return_value["query"]["pages"]["-2"]
+
+        def get(url, **kwargs):
+            if "thumb" in url:
+                response = create_response(b"")
+                response.status_code = 404
+                return response
+            return create_response(create_image_bytes((200, 150), format="JPEG"))
+
+        mock_requests_get.side_effect = get
+
+        png_images = convert_images_to_png(mock_page, blob_store=self.blob_store)
+
+        self.assertEqual(len(png_images), 1)
+        self.assertEqual(mock_requests_get.call_args.args[0], "https://example.com/big.jpg")
+
+    def test_originals_are_kept_when_thumbnails_are_disabled(self):
+        mock_page = self._mock_page()
+
+        fetch_image_info(mock_page, thumbnail_width=0)
+
+        self.assertNotIn("iiurlwidth", mock_page.mediawiki.wiki_request.call_args.args[0])
+
+
+class TestByteBudget(unittest.TestCase):
+    def test_budget_blocks_until_released(self):
+        budget = ByteBudget(100)
+        budget.acquire(80)
+        acquired = threading.Event()
+
+        def second_download():
+            budget.acquire(50)
+            acquired.set()
+
+        thread = threading.Thread(target=second_download)
+        thread.start()
+        self.assertFalse(acquired.wait(0.1))
+        budget.release(80)
+        self.assertTrue(acquired.wait(1))
+        thread.join()
+        self.assertEqual(budget.in_flight, 50)
+
+    def test_oversized_image_passes_alone(self):
+        budget = ByteBudget(100)
+        reserved = budget.acquire(500)
+        self.assertEqual(reserved, 100)
+        budget.release(reserved)
+        self.assertEqual(budget.in_flight, 0)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,126 @@
+import bz2
+import os
+import re
+import tempfile
+import pytest
+from scripts.wiki_crawler.dumpifier import (
+    DumpPage,
+    iter_dump_pages,
+    iter_multistream_pages,
+    wikitext_to_text,
+)
+from scripts.wiki_crawler.data_fetcher import fetch_wiki_data
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "wiki_dump.xml")
+
+
+@pytest.fixture
+def dump_files():
+    """Write the fixture as a plain bz2 dump and as a multistream dump with one page per stream"""
+    with open(FIXTURE_PATH, "rb") as f:
+        xml = f.read()
+    header = xml[: xml.index(b"<page>")]
+    pages = re.findall(rb"<page>.*?</page>", xml, re.DOTALL)
+    footer = b"</mediawiki>\n"
+
+    with tempfile.TemporaryDirectory() as root:
+        dump_path = os.path.join(root, "pages-articles.xml.bz2")
+        with open(dump_path, "wb") as f:
+            f.write(bz2.compress(xml))
+
+        multistream_path = os.path.join(root, "pages-articles-multistream.xml.bz2")
+        index_lines = []
+        with open(multistream_path, "wb") as f:
+            f.write(bz2.compress(header))
+            for page in pages:
+                offset = f.tell()
+                title = re.search(rb"<title>(.*?)</title>", page).group(1).decode("utf-8")
+                page_id = re.search(rb"<id>(\d+)</id>", page).group(1).decode("utf-8")
+                index_lines.append(f"{offset}:{page_id}:{title}\n")
+                f.write(bz2.compress(page))
+            f.write(bz2.compress(footer))
+
+        index_path = os.path.join(root, "pages-articles-multistream-index.txt.bz2")
+        with bz2.open(index_path, "wt", encoding="utf-8") as f:
+            f.writelines(index_lines)
+
+        yield dump_path, multistream_path, index_path
+
+
+def test_dump_pages_are_streamed_without_redirects_or_talk_pages(dump_files):
+    dump_path, _, _ = dump_files
+
+    pages = list(iter_dump_pages(dump_path))
+
+    assert [page.title for page in pages] == ["Eiffel Tower", "Montparnasse Tower", "Louvre"]
+    eiffel = pages[0]
+    assert eiffel.pageid == 9232
+    assert eiffel.revision_id == 1187654321
+    assert eiffel.categories == ["Towers in Paris", "Tourist attractions in Paris"]
+
+
+def test_multistream_dump_matches_plain_dump(dump_files):
+    dump_path, multistream_path, index_path = dump_files
+
+    plain = [(page.title, page.revision_id) for page in iter_dump_pages(dump_path)]
+    parallel = [
+        (page.title, page.revision_id)
+        for page in iter_multistream_pages(multistream_path, index_path, max_workers=2)
+    ]
+
+    assert parallel == plain
+
+
+def test_category_filter(dump_files):
+    dump_path, multistream_path, index_path = dump_files
+
+    titles = [page.title for page in iter_dump_pages(dump_path, categories=["Towers in Paris"])]
+    parallel_titles = [
+        page.title
+        for page in iter_multistream_pages(multistream_path, index_path, categories=["Towers in Paris"])
+    ]
+
+    assert titles == parallel_titles == ["Eiffel Tower", "Montparnasse Tower"]
+
+
+def test_wikitext_is_converted_to_plain_text_with_sections():
+    page = next(iter_dump_pages(FIXTURE_PATH))
+
+    text = page.content
+    assert text.startswith("The Eiffel Tower is a wrought-iron lattice tower on the Champ de Mars in the French capital.")
+    assert "== History ==" in text and "=== Construction ===" in text
+    assert "1889 World's Fair" in text
+    assert "the construction notes" in text
+    for markup in ("{{", "[[", "<ref", "Category:", "File:", "hidden comment", "wikitable"):
+        assert markup not in text
+    assert page.summary.endswith("It is named after Gustave Eiffel.")
+
+
+def test_wikitext_templates_nest():
+    assert wikitext_to_text("A {{outer|{{inner|x}}}} B [[Link|label]]") == "A  B label"
+
+
+def test_dump_page_is_ingested_without_the_api(dump_files):
+    dump_path, _, _ = dump_files
+    page = next(iter_dump_pages(dump_path, titles=["Eiffel Tower"]))
+
+    (
+        fetched_page,
+        page_content,
+        intro_content,
+        sections,
+        categories,
+        images,
+        tables,
+        reference_dict,
+        wiki_links_dict,
+        table_of_contents,
+    ) = fetch_wiki_data(page)
+
+    assert isinstance(fetched_page, DumpPage)
+    assert images == []
+    assert [title for title, _ in table_of_contents] == ["History", "Design"]
+    assert table_of_contents[0][1] == ["Construction"]
+    assert categories == ["Towers in Paris", "Tourist attractions in Paris"]
+    assert len(tables) == 1
+    assert tables[0]["Visitors"].tolist() == [1200000, 1200000, 276]
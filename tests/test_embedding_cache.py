@@ -0,0 +1,107 @@
+from unittest.mock import patch
+from llama_index.core import Settings
+from llama_index.core.base.embeddings.base import BaseEmbedding
+from llama_index.core.node_parser import SemanticSplitterNodeParser
+from llama_index.core.schema import Document, TextNode
+from scripts.cache_store import SQLiteCache
+from scripts.llama_ingestionator.embedding_cache import CachedEmbedding
+from scripts.llama_ingestionator.transformator import EmbeddingTransformation, EMBEDDING_BATCH_MAX_SIZE
+
+
+class CountingEmbedding(BaseEmbedding):
+    """Embeds a text as [words, characters, 0.5] and records the texts it is asked for"""
+
+    calls: list = []
+
+    def __init__(self, **kwargs):
+        super().__init__(model_name="counting", **kwargs)
+        self.calls = []
+
+    def _embed(self, text):
+        return [float(len(text.split())), float(len(text)), 0.5]
+
+    def _get_text_embedding(self, text):
+        self.calls.append(text)
+        return self._embed(text)
+
+    def _get_query_embedding(self, query):
+        self.calls.append(query)
+        return self._embed(query)
+
+    async def _aget_query_embedding(self, query):
+        return self._get_query_embedding(query)
+
+
+def test_vectors_are_embedded_once_across_models_sharing_the_cache(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "embeddings.sqlite"))
+    inner = CountingEmbedding()
+    texts = ["Eiffel Tower", "in Paris", "Eiffel Tower"]
+
+    first = CachedEmbedding(inner, cache).get_text_embedding_batch(texts)
+    assert inner.calls == ["Eiffel Tower", "in Paris"]
+
+    inner.calls = []
+    second = CachedEmbedding(inner, cache).get_text_embedding_batch(texts + ["new text"])
+    assert inner.calls == ["new text"]
+    assert second[:3] == first == [[2.0, 12.0, 0.5], [2.0, 8.0, 0.5], [2.0, 12.0, 0.5]]
+    assert cache.stats()["hits"] == 2
+
+
+def test_vectors_of_other_models_are_kept_apart(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "embeddings.sqlite"))
+    inner = CountingEmbedding()
+
+    CachedEmbedding(inner, cache).get_text_embedding("Eiffel Tower")
+    CachedEmbedding(inner, cache, model_id="other-model").get_text_embedding("Eiffel Tower")
+    CachedEmbedding(inner, cache).get_query_embedding("Eiffel Tower")
+
+    assert inner.calls == ["Eiffel Tower"] * 3
+
+
+def test_splitter_and_embedding_transformation_reuse_the_cache(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "embeddings.sqlite"))
+    inner = CountingEmbedding()
+    text = "The tower is in Paris. It was built in 1889. It is made of iron. Many people visit it."
+
+    def split_and_embed():
+        embed_model = CachedEmbedding(inner, cache)
+        splitter = SemanticSplitterNodeParser(buffer_size=1, embed_model=embed_model)
+        chunks = splitter.get_nodes_from_documents([Document(text=text)])
+        nodes = [TextNode(text=chunk.text, metadata={"needs_embedding": True, "title": "chunk"}) for chunk in chunks]
+        return EmbeddingTransformation()(nodes, text_embed_model=embed_model)
+
+    first = split_and_embed()
+    assert inner.calls
+
+    inner.calls = []
+    second = split_and_embed()
+    assert inner.calls == []
+    assert [node.embedding for node in second] == [node.embedding for node in first]
+
+
+def test_main_runs_the_pipeline_with_the_cached_embed_model(monkeypatch):
+    import main
+
+    monkeypatch.setattr(Settings, "embed_model", Settings.embed_model)
+    env_vars = {
+        "EMBEDDING_DEPLOYMENT_ID": "embeddings",
+        "AZURE_OPENAI_API_KEY": "key",
+        "OPENAI_ENDPOINT": "https://example.openai.azure.com",
+        "EMBEDDING_API_VERSION": "2024-02-01",
+        "DOMAIN_TOPIC": "Eiffel Tower",
+        "NUM_WIKI_PAGES": "1",
+    }
+    with patch.object(main, "setup_logging"), \
+            patch.object(main, "get_env_vars", return_value=env_vars), \
+            patch.object(main, "get_neo4j_config"), patch.object(main, "get_qdrant_config"), \
+            patch.object(main, "get_crawl_config", return_value={"wiki_url": None}), \
+            patch.object(main, "initialise_llm"), patch.object(main, "StorageManager"), \
+            patch.object(main, "get_initial_nodes", return_value=[]), \
+            patch.object(main, "create_pipeline"), patch.object(main, "store_page_nodes"), \
+            patch.object(main, "create_transformed_nodes", return_value=[]) as create_transformed_nodes:
+        main.main()
+
+    embed_model = create_transformed_nodes.call_args.args[3]
+    assert isinstance(embed_model, CachedEmbedding)
+    assert Settings.embed_model is embed_model
+    assert embed_model.embed_model.embed_batch_size == EMBEDDING_BATCH_MAX_SIZE
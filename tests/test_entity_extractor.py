@@ -1,17 +1,30 @@
-from knowledge_extractor.scripts.llama_ingestionator.transformator import EntityExtractorTransformation
-from llama_index.core.schema import TextNode
+import json
+from knowledge_extractor.scripts.llama_ingestionator.transformator import SectionEnrichmentTransformation
+from llama_index.core.schema import TextNode, NodeRelationship, RelatedNodeInfo
 
 def test_entity_extraction():
     text_node = TextNode(text="John works at OpenAI in San Francisco.", metadata={"type": "section", "title": "Test Node"})
+    text_node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id="page")
     documents = [text_node]
 
-    # Mocked entity extraction response
-    class MockEntityExtractor(EntityExtractorTransformation):
+    # Mocked section enrichment response
+    class MockEntityExtractor(SectionEnrichmentTransformation):
         def openai_request(self, prompt, text=None, **kwargs):
-            return {"choices": [{"message": {"content": '{"persons": [{"name": "John"}], "organizations": [{"name": "OpenAI"}], "locations": [{"name": "San Francisco"}], "dates": []}'}}]}
+            arguments = {
+                "entities": [
+                    {"type": "person", "name": "John", "context": "works at OpenAI"},
+                    {"type": "organization", "name": "OpenAI", "context": "employer"},
+                    {"type": "location", "name": "San Francisco", "context": "city"},
+                ],
+                "summary": "John works at OpenAI.",
+                "key_takeaways": [],
+            }
+            return {"choices": [{"message": {"function_call": {"name": "enrich_section", "arguments": json.dumps(arguments)}}}], "usage": {"total_tokens": 10}}
 
     entity_extractor = MockEntityExtractor()
     extracted_nodes = entity_extractor(documents)
 
     # check
     assert len(extracted_nodes) > len(documents), "No entity nodes were added"
+    entities = next(node for node in extracted_nodes if node.metadata["type"] == "entities")
+    assert [entity["name"] for entity in json.loads(entities.text)["persons"]] == ["John"]
@@ -0,0 +1,124 @@
+import os
+import subprocess
+import sys
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import Mock
+import pytest
+import scripts.wiki_crawler.clientifier as clientifier
+from scripts.wiki_crawler.cachinator import PooledMediaWiki
+
+
+@pytest.fixture
+def flaky_server():
+    """Local server answering 429 and 503 before the request succeeds"""
+    statuses = [429, 503, 200]
+    requests_seen = []
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            status = statuses[min(len(requests_seen), len(statuses)) - 1]
+            self.send_response(status)
+            if status == 429:
+                self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "2")
+            self.end_headers()
+            self.wfile.write(b"ok")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_port}", requests_seen
+    server.shutdown()
+    server.server_close()
+
+
+def test_throttled_and_failed_requests_are_retried(flaky_server):
+    url, requests_seen = flaky_server
+    session = clientifier.create_http_session(backoff_factor=0, timeout=(1, 1))
+
+    response = session.get(f"{url}/w/api.php")
+
+    assert response.status_code == 200
+    assert len(requests_seen) == 3
+
+
+def test_last_response_is_returned_when_retries_run_out(flaky_server):
+    url, requests_seen = flaky_server
+    session = clientifier.create_http_session(max_retries=1, backoff_factor=0, timeout=(1, 1))
+
+    response = session.get(url)
+
+    assert response.status_code == 503
+    assert len(requests_seen) == 2
+
+
+def test_wiki_clients_are_created_once_on_first_use(monkeypatch):
+    create_wiki_client = Mock(side_effect=lambda **kwargs: Mock(api_url=kwargs["url"]))
+    monkeypatch.setattr(clientifier, "create_wiki_client", create_wiki_client)
+    monkeypatch.setattr(clientifier, "_wiki_clients", {})
+
+    import scripts.wiki_crawler.navigifier  # noqa: F401 - importing makes no client
+    create_wiki_client.assert_not_called()
+
+    first = clientifier.get_wiki_client()
+    assert clientifier.get_wiki_client(None) is first
+    other = clientifier.get_wiki_client("https://commons.wikimedia.org/w/api.php")
+
+    assert other is not first
+    assert create_wiki_client.call_count == 2
+    assert create_wiki_client.call_args.kwargs["session"] is clientifier.get_http_session()
+
+
+def test_pooled_client_keeps_the_shared_session(monkeypatch):
+    monkeypatch.setattr(PooledMediaWiki, "_get_site_info", lambda self: None)
+    session = clientifier.create_http_session()
+
+    wikipedia = PooledMediaWiki(session=session, user_agent="test-agent")
+    # changing the user agent resets the session of a plain client
+    wikipedia.user_agent = "other-agent"
+
+    assert wikipedia._session is session
+    assert session.headers["User-Agent"] == "other-agent"
+
+
+def test_wiki_requests_carry_a_descriptive_user_agent(monkeypatch):
+    monkeypatch.setattr(PooledMediaWiki, "_get_site_info", lambda self: None)
+    monkeypatch.setattr(clientifier, "WIKI_USER_AGENT", None)
+    monkeypatch.setattr(clientifier, "_session", None)
+    monkeypatch.setattr(clientifier, "create_wiki_client", lambda **kwargs: PooledMediaWiki(**kwargs))
+
+    wikipedia = clientifier._create_client(clientifier.DEFAULT_API_URL)
+
+    assert wikipedia._session is clientifier.get_http_session()
+    assert wikipedia._session.headers["User-Agent"] == clientifier.DEFAULT_USER_AGENT
+    assert clientifier.create_http_session().headers["User-Agent"] == clientifier.DEFAULT_USER_AGENT
+
+
+def test_crawler_modules_import_without_network(tmp_path):
+    """The crawler test modules are collected offline, no client may connect at import time"""
+    script = tmp_path / "import_offline.py"
+    script.write_text(
+        "import socket\n"
+        "def refuse(*args, **kwargs):\n"
+        "    raise OSError('network access at import time')\n"
+        "socket.socket.connect = refuse\n"
+        "socket.create_connection = refuse\n"
+        "import scripts.wiki_crawler.navigifier\n"
+        "import scripts.wiki_crawler.data_fetcher\n"
+        "import scripts.wiki_crawler.dumpifier\n"
+        "import scripts.data_processing\n"
+    )
+    result = subprocess.run(
+        [sys.executable, str(script)],
+        cwd=tmp_path,
+        env={**os.environ, "PYTHONPATH": os.pathsep.join(sys.path)},
+        capture_output=True,
+        text=True,
+        timeout=120,
+    )
+    assert result.returncode == 0, result.stderr
@@ -0,0 +1,89 @@
+import json
+from llama_index.core.schema import ImageNode, TextNode, NodeRelationship
+from scripts.llama_ingestionator.transformator import ImageAnalysisTransformation
+from tests.conftest import make_chart, make_image_node
+
+
+def function_response(**analysis):
+    return {
+        "choices": [{"message": {"content": None, "function_call": {
+            "name": "analyse_image", "arguments": json.dumps(analysis),
+        }}}],
+        "usage": {"total_tokens": 100},
+    }
+
+
+def record_requests(responses):
+    """Image analysis answering the requests of each image title, recording the requests"""
+
+    class Recording(ImageAnalysisTransformation):
+        def openai_request(self, prompt, image=None, text=None, function=None, max_tokens=800):
+            requests.append((prompt, image, function))
+            return responses[prompt.split("context for the image: ")[1].split(".")[0]]
+
+    requests = []
+    return Recording(), requests
+
+
+def test_one_request_per_image_adds_the_image_and_plot_nodes():
+    photo = make_image_node("Tower.jpg")
+    plot = make_image_node("Visitors.png", color="white")
+    plot.metadata["context"] = "Visitors"
+    reference = ImageNode(text="https://example.org", metadata={"type": "reference", "title": "ref"})
+    analysis, requests = record_requests({
+        "Eiffel Tower": function_response(
+            classification="image", description="An iron tower.", entities="Eiffel Tower: landmark", plot_insights="",
+        ),
+        "Visitors": function_response(
+            classification="plot", description="A line chart.", entities="", plot_insights="Visitors doubled.",
+        ),
+    })
+
+    nodes = analysis([photo, plot, reference])
+
+    assert len(requests) == 2
+    assert all(image and function["name"] == "analyse_image" for _, image, function in requests)
+    assert (photo.metadata["type"], plot.metadata["type"]) == ("image", "plot")
+    derived = nodes[3:]
+    assert [(node.metadata["title"], node.metadata["type"], node.text) for node in derived] == [
+        ("Tower.jpg_image_description", "image_description", "An iron tower."),
+        ("Visitors.png_image_description", "image_description", "A line chart."),
+        ("Tower.jpg_image_entities", "image_entities", "Eiffel Tower: landmark"),
+        ("Visitors.png_plot_insights", "plot_insights", "Visitors doubled."),
+    ]
+    assert all(node.metadata["needs_embedding"] for node in derived)
+    assert derived[3].metadata["context"] == "Visitors"
+    assert derived[3].relationships[NodeRelationship.PARENT].node_id == plot.node_id
+    assert derived[3].relationships[NodeRelationship.SOURCE].node_id == "page"
+
+
+def test_unanswerable_parts_add_no_nodes():
+    photo = make_image_node("Tower.jpg")
+    analysis, _ = record_requests({
+        "Eiffel Tower": function_response(
+            classification="image",
+            description="The image is blurred. error: unable to provide an answer",
+            entities="Eiffel Tower: landmark",
+            plot_insights="",
+        ),
+    })
+    table = TextNode(text="a,b", metadata={"type": "table", "title": "table"})
+
+    nodes = analysis([photo, table])
+
+    assert [node.metadata["type"] for node in nodes[2:]] == ["image_entities"]
+
+
+def test_locally_classified_images_skip_the_classification_step():
+    plot = make_image_node("Visitors.png", image_data=make_chart())
+    analysis, requests = record_requests({
+        "Eiffel Tower": function_response(description="A line chart.", plot_insights="Visitors doubled."),
+    })
+
+    nodes = analysis([plot])
+
+    prompt, _, function = requests[0]
+    assert "classify" not in prompt and "For an image" not in prompt
+    assert function["parameters"]["required"] == ["description", "plot_insights"]
+    assert plot.metadata["type"] == "plot"
+    assert [node.metadata["type"] for node in nodes[1:]] == ["image_description", "plot_insights"]
@@ -0,0 +1,22 @@
+import io
+from PIL import Image
+from scripts.llama_ingestionator.image_classifier import classify_image_locally
+from tests.conftest import make_chart, make_photo, to_bytes
+
+
+def test_confident_images_are_classified_locally():
+    assert classify_image_locally(make_chart()) == "plot"
+    assert classify_image_locally(make_photo()) == "image"
+
+
+def test_ambiguous_images_are_left_to_the_model():
+    # a dark chart, a blank image and a wide banner
+    assert classify_image_locally(make_chart(background="black")) is None
+    assert classify_image_locally(to_bytes(Image.new("RGB", (200, 200), "white"))) is None
+    banner = Image.open(io.BytesIO(make_photo())).resize((960, 120))
+    assert classify_image_locally(to_bytes(banner)) is None
+    assert classify_image_locally(b"not an image") is None
+
+
+def test_svgs_are_never_classified_as_photos():
+    assert classify_image_locally(make_photo(), "https://upload.wikimedia.org/map.svg") is None
@@ -0,0 +1,161 @@
+import base64
+import io
+import json
+from PIL import Image
+import scripts.llama_ingestionator.image_payloads as image_payloads
+import scripts.llama_ingestionator.transformator as transformator
+from scripts.llama_ingestionator.image_payloads import (
+    ImagePayloadCache,
+    encode_image_payload,
+    get_image_payload,
+)
+from scripts.llama_ingestionator.transformator import (
+    ImageAnalysisTransformation,
+    ImagePreprocessingTransformation,
+)
+from tests.conftest import make_chart, make_image_node, make_photo
+
+# large enough to be resized for the model
+SIZE = (1600, 1200)
+
+
+def make_large_photo():
+    return make_photo(SIZE, "PNG")
+
+
+def make_transparent_chart():
+    return make_chart((1200, 800), (255, 255, 255, 0), "RGBA")
+
+
+def decode_payload(payload):
+    mime_type, data = payload[len("data:"):].split(";base64,")
+    return mime_type, Image.open(io.BytesIO(base64.b64decode(data)))
+
+
+def record_payloads(transformation_class, arguments):
+    """Transformation recording the image payloads it sends"""
+
+    class Recording(transformation_class):
+        def openai_request(self, prompt, image=None, text=None, function=None, max_tokens=800):
+            payloads.append(image)
+            return {
+                "choices": [{"message": {"content": "An image.", "function_call": {
+                    "name": "analyse_image", "arguments": json.dumps(arguments),
+                }}}],
+                "usage": {"total_tokens": 100},
+            }
+
+    payloads = []
+    return Recording(), payloads
+
+
+def test_images_are_encoded_once_for_every_vision_request(monkeypatch):
+    cache = ImagePayloadCache()
+    monkeypatch.setattr(image_payloads, "_payload_cache", cache)
+    nodes = [make_image_node("Tower.jpg", SIZE), make_image_node("Night.jpg", (800, 600))]
+    arguments = {"classification": "image", "description": "An image.", "entities": "", "plot_insights": ""}
+    analysis, analysis_payloads = record_payloads(ImageAnalysisTransformation, arguments)
+    # the same images analysed again, as after a changed page
+    reanalysis, reanalysis_payloads = record_payloads(ImageAnalysisTransformation, arguments)
+
+    ImagePreprocessingTransformation()(nodes)
+    assert cache.stats()["misses"] == 2
+    analysis(nodes)
+    reanalysis(nodes)
+
+    stats = cache.stats()
+    assert (stats["misses"], stats["hits"], stats["entries"]) == (2, 4, 2)
+    assert stats["stages"]["ImagePreprocessingTransformation"]["encodes"] == 2
+    assert stats["stages"]["ImagePreprocessingTransformation"]["encode_seconds"] > 0
+    assert sorted(analysis_payloads) == sorted(reanalysis_payloads)
+    sizes = {Image.open(io.BytesIO(base64.b64decode(payload.split(',')[1]))).size for payload in analysis_payloads}
+    assert sizes == {(1024, 768), (800, 600)}
+
+
+def test_images_are_classified_from_the_decoded_payload_image(monkeypatch):
+    monkeypatch.setattr(image_payloads, "_payload_cache", ImagePayloadCache())
+    loads = []
+    load_node_image = image_payloads.load_node_image
+    monkeypatch.setattr(image_payloads, "load_node_image", lambda node: loads.append(node) or load_node_image(node))
+    photo = make_image_node("Tower.jpg", image_data=make_large_photo())
+    chart = make_image_node("Visitors.png", image_data=make_transparent_chart())
+    arguments = {"description": "An image.", "entities": "", "plot_insights": ""}
+    analysis, _ = record_payloads(ImageAnalysisTransformation, arguments)
+
+    ImagePreprocessingTransformation()([photo, chart])
+    analysis([photo, chart])
+
+    assert len(loads) == 2
+    assert (photo.metadata["type"], chart.metadata["type"]) == ("image", "plot")
+
+
+def test_least_recently_used_payloads_are_evicted():
+    cache = ImagePayloadCache(max_bytes=10)
+    cache.set("a", "x" * 4)
+    cache.set("b", "x" * 4)
+    cache.get("a")
+    cache.set("c", "x" * 4)
+
+    assert cache.get("b") is None
+    assert cache.get("a") and cache.get("c")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_payloads_are_keyed_on_the_size(monkeypatch):
+    monkeypatch.setattr(image_payloads, "_payload_cache", ImagePayloadCache())
+    node = make_image_node("Tower.jpg", SIZE)
+
+    small = get_image_payload(node, max_size=(256, 256))
+    large = get_image_payload(node)
+
+    assert Image.open(io.BytesIO(base64.b64decode(small.split(',')[1]))).size == (256, 192)
+    assert Image.open(io.BytesIO(base64.b64decode(large.split(',')[1]))).size == (1024, 768)
+
+
+def test_photos_are_sent_lossy_and_line_art_as_png(monkeypatch):
+    photo_type, photo = decode_payload(encode_image_payload(make_large_photo())[0])
+    chart_type, chart = decode_payload(encode_image_payload(make_transparent_chart())[0])
+
+    assert (photo_type, photo.size) == ("image/jpeg", (1024, 768))
+    assert (chart_type, chart.size, chart.mode) == ("image/png", (1024, 683), "RGBA")
+
+    monkeypatch.setattr(image_payloads, "IMAGE_PAYLOAD_LOSSY_FORMAT", "WEBP")
+    assert decode_payload(encode_image_payload(make_large_photo())[0])[0] == "image/webp"
+
+
+def test_the_format_follows_the_local_classification():
+    photo_payload, photo_type = encode_image_payload(make_photo())
+    chart_payload, chart_type = encode_image_payload(make_chart())
+    assert (decode_payload(photo_payload)[0], photo_type) == ("image/jpeg", "image")
+    assert (decode_payload(chart_payload)[0], chart_type) == ("image/png", "plot")
+
+    # ambiguous images are sent as PNG if they are drawn
+    dark_chart_payload, dark_chart_type = encode_image_payload(make_chart(background="black"))
+    banner_payload, banner_type = encode_image_payload(make_photo((960, 120)))
+    assert (decode_payload(dark_chart_payload)[0], dark_chart_type) == ("image/png", None)
+    assert (decode_payload(banner_payload)[0], banner_type) == ("image/jpeg", None)
+
+
+def test_payloads_over_the_byte_budget_are_scaled_down():
+    payload, _ = encode_image_payload(make_large_photo(), max_bytes=40 * 1024)
+    _, photo = decode_payload(payload)
+
+    assert photo.size[0] < 1024
+    assert len(base64.b64decode(payload.split(",")[1])) <= 40 * 1024
+
+    # never below the smallest payload size
+    _, photo = decode_payload(encode_image_payload(make_large_photo(), max_bytes=100)[0])
+    assert min(photo.size) >= 256
+
+
+def test_uploads_are_counted_per_stage(monkeypatch):
+    cache = ImagePayloadCache()
+    monkeypatch.setattr(image_payloads, "_payload_cache", cache)
+    monkeypatch.setattr(transformator, "get_chat_completion", lambda payload: {"choices": []})
+    nodes = [make_image_node("Tower.jpg", SIZE), make_image_node("Night.jpg", (800, 600))]
+
+    ImageAnalysisTransformation()(nodes)
+
+    stage = cache.stats()["stages"]["ImageAnalysisTransformation"]
+    assert (stage["encodes"], stage["uploads"]) == (2, 2)
+    assert stage["upload_bytes"] == sum(len(get_image_payload(node)) for node in nodes)
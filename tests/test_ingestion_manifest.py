@@ -0,0 +1,155 @@
+import json
+from unittest.mock import Mock
+from llama_index.core.schema import Document, TextNode, NodeRelationship, RelatedNodeInfo
+import scripts.data_processing as data_processing
+import scripts.llama_ingestionator.pipeline as pipeline
+from scripts.llama_ingestionator.node_creator import assign_stable_node_ids
+from scripts.storage.ingestion_manifest import IngestionManifest, get_page_revision
+from scripts.wiki_crawler.dumpifier import DumpPage
+
+
+def make_page(title, revision_id, wikitext):
+    return DumpPage(title=title, pageid=1, revision_id=revision_id, wikitext=wikitext, categories=[])
+
+
+def build_nodes(page):
+    """One section node per paragraph of the wikitext"""
+    document = Document(text=page.wikitext, metadata={"title": page.title, "type": "page"})
+    nodes = [document]
+    for idx, paragraph in enumerate(page.wikitext.split("\n\n")):
+        section = TextNode(text=paragraph, metadata={"title": f"section_{idx}", "type": "section"})
+        section.relationships[NodeRelationship.PARENT] = RelatedNodeInfo(node_id=document.doc_id)
+        section.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id=document.doc_id)
+        nodes.append(section)
+    return assign_stable_node_ids(nodes, page.title)
+
+
+def summarise(nodes, pipeline_, embed_model):
+    """Stands in for the pipeline, adding a summary node to every section"""
+    summaries = []
+    for node in nodes:
+        if node.metadata["type"] == "section":
+            summary = TextNode(text=f"summary of {node.text}", metadata={"title": "summary", "type": "summary"})
+            summary.relationships[NodeRelationship.PARENT] = RelatedNodeInfo(node_id=node.node_id)
+            summaries.append(summary)
+    return nodes + summaries
+
+
+def run_ingestion(monkeypatch, pages):
+    processed = []
+    transformed = []
+
+    def process_pages(changed_pages, wiki_url, crawl_config):
+        processed.extend(page.title for page in changed_pages)
+        return [build_nodes(page) for page in changed_pages]
+
+    def run_pipeline(nodes, pipeline_, embed_model):
+        transformed.extend(node.text for node in nodes if node.metadata["type"] == "section")
+        return summarise(nodes, pipeline_, embed_model)
+
+    monkeypatch.setattr(data_processing, "find_pages", lambda *args: pages)
+    monkeypatch.setattr(data_processing, "process_pages", process_pages)
+    monkeypatch.setattr(pipeline, "run_pipeline", run_pipeline)
+
+    storage_manager = Mock()
+    documents = data_processing.get_initial_nodes("Towers", len(pages))
+    nodes = data_processing.create_transformed_nodes(documents, "Towers", None, None)
+    data_processing.store_page_nodes(storage_manager, documents, nodes, "Towers")
+    return nodes, processed, transformed, storage_manager
+
+
+def test_revision_of_a_bare_title_is_unknown():
+    assert get_page_revision("Eiffel Tower") == (None, None)
+    revision_id, content_hash = get_page_revision(make_page("Eiffel Tower", 5, "text"))
+    assert revision_id == 5
+    assert len(content_hash) == 64
+
+
+def test_node_ids_are_stable_across_builds():
+    page = make_page("Eiffel-Tower", 1, "A tower.\n\nIn Paris.")
+    first, second = build_nodes(page), build_nodes(page)
+
+    assert [node.node_id for node in first] == [node.node_id for node in second]
+    assert first[1].relationships[NodeRelationship.PARENT].node_id == first[0].node_id
+    assert first[1].metadata["content_hash"] == second[1].metadata["content_hash"]
+    assert "content_hash" not in first[0].metadata
+    assert "content_hash" in first[1].excluded_llm_metadata_keys
+
+
+def test_only_changed_pages_are_processed_again(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pages = [make_page("Eiffel-Tower", 1, "A tower."), make_page("Big-Ben", 7, "A clock.")]
+
+    nodes, processed, transformed, storage_manager = run_ingestion(monkeypatch, pages)
+    assert processed == ["Eiffel-Tower", "Big-Ben"]
+    assert transformed == ["A tower.", "A clock."]
+    assert storage_manager.store_nodes.call_count == 2
+    storage_manager.delete_nodes.assert_not_called()
+
+    # nothing changed
+    nodes, processed, transformed, storage_manager = run_ingestion(monkeypatch, pages)
+    assert processed == transformed == []
+    storage_manager.store_nodes.assert_not_called()
+    storage_manager.delete_nodes.assert_not_called()
+
+
+def test_only_changed_sections_are_transformed_and_stored(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    pages = [make_page("Eiffel-Tower", 1, "A tower.\n\nIn Paris.")]
+    first_nodes, _, _, _ = run_ingestion(monkeypatch, pages)
+    first_ids = {node.text: node.node_id for node in first_nodes[0]}
+
+    pages[0] = make_page("Eiffel-Tower", 2, "A tower.\n\nIn central Paris.")
+    nodes, processed, transformed, storage_manager = run_ingestion(monkeypatch, pages)
+
+    assert processed == ["Eiffel-Tower"]
+    assert transformed == ["In central Paris."]
+    ids = {node.text: node.node_id for node in nodes[0]}
+    # the unchanged section keeps its summary, the changed one keeps its id
+    assert ids["summary of A tower."] == first_ids["summary of A tower."]
+    assert ids["In central Paris."] == first_ids["In Paris."]
+
+    stored = [node.text for node in storage_manager.store_nodes.call_args.args[0]]
+    assert sorted(stored) == ["A tower.\n\nIn central Paris.", "In central Paris.", "summary of In central Paris."]
+    deleted = set(storage_manager.delete_nodes.call_args.args[0])
+    assert deleted == {first_ids["A tower.\n\nIn Paris."], first_ids["In Paris."], first_ids["summary of In Paris."]}
+    # the unchanged section is linked again to the replaced page document
+    linked_nodes, replaced_ids = storage_manager.link_nodes.call_args.args
+    assert first_ids["A tower.\n\nIn Paris."] in replaced_ids
+    assert ids["A tower."] in [node.node_id for node in linked_nodes]
+
+
+def test_interrupted_run_resumes_at_the_unfinished_stage(tmp_path):
+    manifest = IngestionManifest(str(tmp_path))
+    manifest.record_initial("Eiffel-Tower", 1, "hash")
+    manifest.record_transformed("Eiffel-Tower")
+    manifest.save()
+
+    manifest = IngestionManifest(str(tmp_path))
+    # the transformed nodes file was never written
+    assert not manifest.is_transformed("Eiffel-Tower")
+    assert not manifest.is_stored("Eiffel-Tower")
+    assert not manifest.is_current("Eiffel-Tower", 1, "hash")
+
+
+def test_pages_without_a_revision_are_always_processed(tmp_path):
+    manifest = IngestionManifest(str(tmp_path))
+    manifest.record_initial("Eiffel-Tower", None, None)
+    assert not manifest.is_current("Eiffel-Tower", None, None)
+
+
+def test_pages_of_an_older_manifest_version_are_built_again(tmp_path):
+    (tmp_path / "pages").mkdir()
+    (tmp_path / "pages" / "Eiffel-Tower_initial").write_text("[]")
+    (tmp_path / "manifest.json").write_text(json.dumps({"pages": {"Eiffel-Tower": {
+        "revision_id": 1, "content_hash": "hash", "version": "a", "stored_version": "a", "nodes": {"id": "fp"},
+    }}}))
+
+    manifest = IngestionManifest(str(tmp_path))
+    assert not manifest.is_current("Eiffel-Tower", 1, "hash")
+    # the stored nodes are still known, so they are replaced
+    assert manifest.stored_nodes("Eiffel-Tower") == {"id": "fp"}
+
+    manifest.record_initial("Eiffel-Tower", 1, "hash")
+    manifest.save()
+    assert IngestionManifest(str(tmp_path)).is_current("Eiffel-Tower", 1, "hash")
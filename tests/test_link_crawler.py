@@ -0,0 +1,106 @@
+import os
+import time
+import threading
+from scripts.wiki_crawler.crawlinator import (
+    crawl_link_graph,
+    fetch_article_links,
+    get_article_title,
+)
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "wiki_page.html")
+
+LINK_GRAPH = {
+    "Seed A": ["Shared", "Only A", "Seed B"],
+    "Seed B": ["Shared", "Only B"],
+    "Shared": ["Deep"],
+    "Only A": ["Deep"],
+    "Only B": [],
+    "Deep": ["Deeper"],
+    "Deeper": [],
+}
+
+
+def fake_fetcher(title):
+    return title, LINK_GRAPH[title]
+
+
+def test_pages_are_crawled_once_within_depth():
+    crawled = crawl_link_graph(["Seed A", "Seed B"], max_depth=1, max_workers=1, link_fetcher=fake_fetcher)
+
+    titles = [page.title for page in crawled]
+    assert sorted(titles) == ["Only A", "Only B", "Seed A", "Seed B", "Shared"]
+    assert len(titles) == len(set(titles))
+    assert {page.title: page.depth for page in crawled}["Shared"] == 1
+
+
+def test_pages_linked_from_more_pages_come_first():
+    crawled = crawl_link_graph(["Seed A", "Seed B"], max_depth=1, max_workers=1, link_fetcher=fake_fetcher)
+
+    assert [page.title for page in crawled][:3] == ["Seed A", "Seed B", "Shared"]
+
+
+def test_page_budget_and_depth_budget():
+    crawled = crawl_link_graph(["Seed A"], max_depth=5, max_pages=3, max_workers=1, link_fetcher=fake_fetcher)
+    assert len(crawled) == 3
+
+    crawled = crawl_link_graph(["Seed A"], max_depth=2, max_workers=1, link_fetcher=fake_fetcher)
+    assert "Deep" in [page.title for page in crawled]
+    assert "Deeper" not in [page.title for page in crawled]
+
+
+def test_redirects_and_failures():
+    def fetcher(title):
+        if title == "Broken":
+            raise ValueError("missing page")
+        if title == "Alias":
+            return "Target", []
+        return title, {"Start": ["Alias", "Target", "Broken"]}.get(title, [])
+
+    crawled = crawl_link_graph(["Start"], max_depth=1, max_workers=1, link_fetcher=fetcher)
+
+    assert sorted(page.title for page in crawled) == ["Start", "Target"]
+
+
+def test_pages_are_fetched_concurrently():
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def slow_fetcher(title):
+        with lock:
+            active.append(title)
+            peak.append(len(active))
+        time.sleep(0.05)
+        with lock:
+            active.remove(title)
+        return fake_fetcher(title)
+
+    crawled = crawl_link_graph(["Seed A", "Seed B"], max_depth=2, max_workers=3, link_fetcher=slow_fetcher)
+
+    assert len(crawled) == 6
+    assert 1 < max(peak) <= 3
+
+
+def test_article_links_come_from_page_text():
+    class FakeWiki:
+        base_url = "https://en.wikipedia.org"
+
+        def wiki_request(self, params):
+            with open(FIXTURE_PATH, encoding="utf-8") as f:
+                return {"parse": {"title": "Eiffel Tower", "text": f.read()}}
+
+    title, links = fetch_article_links("Eiffel tower", FakeWiki())
+
+    assert title == "Eiffel Tower"
+    assert links[:3] == ["Champ de Mars", "Paris", "Gustave Eiffel"]
+    assert "Landmarks of Paris" not in links
+    assert not any(link.startswith("File:") for link in links)
+    assert "Émile Nouguier" in links
+
+
+def test_get_article_title():
+    assert get_article_title("https://en.wikipedia.org/wiki/Star_Wars:_A_New_Hope") == "Star Wars: A New Hope"
+    assert get_article_title("https://en.wikipedia.org/wiki/Category:Towers") is None
+    assert get_article_title("https://en.wikipedia.org/wiki/Talk:Paris") is None
+    assert get_article_title("https://fr.wikipedia.org/wiki/Paris") is None
+    assert get_article_title("https://en.wikipedia.org/w/index.php?title=Paris&action=edit") is None
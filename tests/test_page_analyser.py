@@ -0,0 +1,87 @@
+import os
+from scripts.wiki_crawler.analysinator import analyse_page_html
+from scripts.wiki_crawler.tablifier import extract_tables
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "wiki_page.html")
+PAGE_URL = "https://en.wikipedia.org/wiki/Eiffel_Tower"
+
+
+def load_page():
+    with open(FIXTURE_PATH, encoding="utf-8") as f:
+        return f.read()
+
+
+def test_table_spans_are_expanded_and_typed():
+    tables = analyse_page_html(load_page()).tables
+
+    assert len(tables) == 1
+    table = tables[0]
+    assert list(table.columns) == ["Level", "Height (m)", "Visitors"]
+    assert str(table["Visitors"].dtype) == "int64"
+    assert table["Visitors"].tolist() == [1200000, 1200000, 276]
+    assert table.iloc[2]["Level"] == "Top"
+    assert table.iloc[2]["Height (m)"] == "Top"
+
+
+def test_extract_tables_uses_the_analyser():
+    tables = extract_tables(load_page())
+
+    assert len(tables) == 1
+    assert tables[0]["Visitors"].tolist() == [1200000, 1200000, 276]
+
+
+def test_links_are_grouped_by_section_and_skip_boilerplate():
+    links = analyse_page_html(load_page(), page_url=PAGE_URL).links
+
+    urls = links["url"].tolist()
+    assert "https://en.wikipedia.org/wiki/Champ_de_Mars" in urls
+    # infobox, navbox, toc, edit links and file links are not in-text links
+    assert "https://en.wikipedia.org/wiki/Landmarks_of_Paris" not in urls
+    assert not any("action=edit" in url or "/wiki/File:" in url for url in urls)
+    assert urls.count("https://en.wikipedia.org/wiki/Paris") == 1
+
+    sections = dict(zip(links["url"], links["section"]))
+    assert sections["https://en.wikipedia.org/wiki/Champ_de_Mars"] is None
+    assert sections["https://en.wikipedia.org/wiki/Compagnie_des_Etablissements_Eiffel"] == "Construction"
+    assert sections["https://en.wikipedia.org/wiki/Maurice_Koechlin"] == "Design"
+    assert sections[f"{PAGE_URL}#History"] == "Design"
+
+
+def test_cite_notes_and_references():
+    analysis = analyse_page_html(load_page())
+
+    notes = analysis.cite_notes
+    assert notes[notes["section"] == "History"]["note_id"].tolist() == [
+        "cite_note-2",
+        "cite_note-2",
+        "cite_note-3",
+    ]
+    assert notes[notes["section"] == "Design"]["label"].tolist() == ["3"]
+
+    references = analysis.references.set_index("note_id")
+    assert len(references) == 4
+    assert references.loc["cite_note-1", "url"] == "https://www.toureiffel.paris/en/the-monument"
+    assert references.loc["cite_note-1", "archived_urls"] == [
+        "https://web.archive.org/web/2019/https://www.toureiffel.paris/en/the-monument"
+    ]
+    assert references.loc["cite_note-3", "title"] == '"Eiffel Tower"'
+    assert references.loc["cite_note-4", "url"] == ""
+    assert "Rizzoli" in references.loc["cite_note-4", "text"]
+
+
+def test_captions_are_found_in_both_markups():
+    captions = analyse_page_html(load_page()).captions
+
+    assert captions["section"].tolist() == ["History", "Design"]
+    assert captions.iloc[0]["caption"] == "The tower during the 1889 Exposition"
+    assert captions.iloc[1]["caption"] == "Plan of the tower base"
+    assert captions.iloc[1]["file_url"] == "https://en.wikipedia.org/wiki/File:Eiffel_Tower_plan.svg"
+    assert captions.iloc[1]["image_url"].startswith("https://upload.wikimedia.org/")
+
+
+def test_empty_page():
+    analysis = analyse_page_html("")
+
+    assert analysis.tables == []
+    assert analysis.links.empty
+    assert analysis.references.empty
@@ -0,0 +1,112 @@
+from scripts.wiki_crawler.navigifier import fetch_page_records, PageRecord
+
+
+def make_page(pageid, title, revid=None, **props):
+    page = {"pageid": pageid, "ns": 0, "title": title}
+    if revid:
+        page["revisions"] = [{"revid": revid, "slots": {"main": {"*": f"'''{title}''' is a page."}}}]
+    page.update(props)
+    return page
+
+
+class FakeClient:
+    """Answers property queries from a dict of title -> page, recording the requests"""
+
+    base_url = "https://en.wikipedia.org"
+
+    def __init__(self, pages, normalized=(), redirects=()):
+        self.pages = pages
+        self.normalized = list(normalized)
+        self.redirects = list(redirects)
+        self.requests = []
+
+    def wiki_request(self, params):
+        self.requests.append(params)
+        titles = params["titles"].split("|")
+        query = {"pages": {}}
+        query["normalized"] = [m for m in self.normalized if m["from"] in titles]
+        targets = [next((m["to"] for m in query["normalized"] if m["from"] == t), t) for t in titles]
+        query["redirects"] = [m for m in self.redirects if m["from"] in targets]
+        for idx, title in enumerate(targets):
+            title = next((m["to"] for m in query["redirects"] if m["from"] == title), title)
+            if title in self.pages:
+                page = self.pages[title]
+                query["pages"][str(page["pageid"])] = page
+            else:
+                query["pages"][str(-idx - 1)] = {"ns": 0, "title": title, "missing": ""}
+        return {"query": query}
+
+
+def test_titles_are_fetched_fifty_per_request():
+    titles = [f"Page {idx}" for idx in range(120)]
+    client = FakeClient({title: make_page(idx + 1, title, revid=1000 + idx) for idx, title in enumerate(titles)})
+
+    records = fetch_page_records(titles, client=client)
+
+    assert len(client.requests) == 3
+    assert [len(request["titles"].split("|")) for request in client.requests] == [50, 50, 20]
+    assert list(records) == titles
+    record = records["Page 7"]
+    assert isinstance(record, PageRecord)
+    assert record.revision_id == 1007
+    assert record.wikitext == "'''Page 7''' is a page."
+    assert record.url == "https://en.wikipedia.org/wiki/Page_7"
+
+
+def test_continuation_is_merged():
+    first = make_page(
+        1, "Eiffel Tower", revid=5,
+        extract="A tower in Paris.",
+        categories=[{"ns": 14, "title": "Category:Towers in Paris"}],
+    )
+    # the continuation carries the rest of the lists and repeats the page without them
+    rest = {
+        "query": {"pages": {"1": {
+            "pageid": 1, "ns": 0, "title": "Eiffel Tower",
+            "categories": [{"ns": 14, "title": "Category:World's fairs"}],
+        }}}
+    }
+    client = FakeClient({})
+
+    def wiki_request(params):
+        client.requests.append(params)
+        if "clcontinue" in params:
+            return rest
+        return {"continue": {"clcontinue": "1|World", "continue": "||"}, "query": {"pages": {"1": first}}}
+
+    client.wiki_request = wiki_request
+
+    record = fetch_page_records(["Eiffel Tower"], client=client)["Eiffel Tower"]
+
+    assert len(client.requests) == 2
+    assert client.requests[1]["clcontinue"] == "1|World"
+    assert record.summary == "A tower in Paris."
+    assert record.categories == ["Towers in Paris", "World's fairs"]
+    assert record.revision_id == 5
+
+
+def test_redirects_and_missing_pages():
+    client = FakeClient(
+        {"Eiffel Tower": make_page(1, "Eiffel Tower", revid=5)},
+        normalized=[{"from": "eiffel tower", "to": "Eiffel tower"}],
+        redirects=[{"from": "Eiffel tower", "to": "Eiffel Tower"}],
+    )
+
+    records = fetch_page_records(["eiffel tower", "Eiffel Tower", "No such page"], client=client)
+
+    assert set(records) == {"eiffel tower", "Eiffel Tower"}
+    assert records["eiffel tower"].title == "Eiffel Tower"
+    assert records["eiffel tower"].pageid == 1
+
+
+def test_content_is_the_plain_text_extract_fetched_on_first_use():
+    client = FakeClient({"Eiffel Tower": make_page(
+        1, "Eiffel Tower", revid=5, extract="A tower in Paris.\n\n== History ==\nBuilt for the fair.",
+    )})
+    record = fetch_page_records(["Eiffel Tower"], client=client)["Eiffel Tower"]
+    assert len(client.requests) == 1
+
+    assert record.content == "A tower in Paris.\n\n== History ==\nBuilt for the fair."
+    assert record.content == "A tower in Paris.\n\n== History ==\nBuilt for the fair."
+    assert len(client.requests) == 2
+    assert client.requests[1]["prop"] == "extracts" and "exintro" not in client.requests[1]
@@ -0,0 +1,70 @@
+import io
+import time
+from bs4 import BeautifulSoup
+from PIL import Image
+from scripts.wiki_crawler.rasterinator import preprocess_svg, rasterise_svg
+
+SVG = b'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 400 200"><rect width="400" height="200" fill="red"/></svg>'
+
+
+def svg_size(svg_content):
+    svg_tag = BeautifulSoup(svg_content, "xml").find("svg")
+    return int(svg_tag["width"]), int(svg_tag["height"])
+
+
+def sleeping_renderer(svg_data, raster_size):
+    time.sleep(30)
+
+
+def spinning_renderer(svg_data, raster_size):
+    while True:
+        pass
+
+
+def failing_renderer(svg_data, raster_size):
+    raise ValueError("broken path data")
+
+
+def png_renderer(svg_data, raster_size):
+    buffer = io.BytesIO()
+    Image.new("RGB", (raster_size, raster_size // 2)).save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+def test_missing_size_is_taken_from_view_box():
+    assert svg_size(preprocess_svg(SVG.decode("utf-8"), raster_size=1000)) == (400, 200)
+
+
+def test_large_svg_is_scaled_to_raster_size():
+    svg = '<svg xmlns="http://www.w3.org/2000/svg" width="8000" height="2000"></svg>'
+    assert svg_size(preprocess_svg(svg, raster_size=1000)) == (1000, 250)
+
+
+def test_svg_is_rendered_in_child_process():
+    result = rasterise_svg(SVG, raster_size=300, renderer=png_renderer)
+
+    assert result.skipped_reason is None
+    assert Image.open(io.BytesIO(result.png_data)).size == (300, 150)
+
+
+def test_hanging_render_is_timed_out():
+    start = time.monotonic()
+    result = rasterise_svg(SVG, timeout=1, renderer=sleeping_renderer)
+
+    assert result.png_data is None
+    assert "timed out" in result.skipped_reason
+    assert time.monotonic() - start < 10
+
+
+def test_cpu_bound_render_hits_cpu_limit():
+    result = rasterise_svg(SVG, cpu_seconds=1, timeout=20, renderer=spinning_renderer)
+
+    assert result.png_data is None
+    assert "cpu limit" in result.skipped_reason
+
+
+def test_render_error_is_recorded():
+    result = rasterise_svg(SVG, renderer=failing_renderer)
+
+    assert result.png_data is None
+    assert "broken path data" in result.skipped_reason
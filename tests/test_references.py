@@ -0,0 +1,99 @@
+import os
+from llama_index.core.schema import NodeRelationship
+import scripts.wiki_crawler.data_fetcher as data_fetcher
+from scripts.llama_ingestionator.documentifier import process_page_into_doc_and_nodes
+from scripts.wiki_crawler.analysinator import analyse_page_html
+from scripts.wiki_crawler.navigifier import PageRecord
+from scripts.wiki_crawler.referenciator import (
+    get_all_citations,
+    get_cite_note_links_by_section,
+    get_external_links_by_section,
+)
+
+FIXTURE_PATH = os.path.join(os.path.dirname(__file__), "fixtures", "wiki_page.html")
+PAGE_URL = "https://en.wikipedia.org/wiki/Eiffel_Tower"
+
+
+def analyse_page():
+    with open(FIXTURE_PATH, encoding="utf-8") as f:
+        return analyse_page_html(f.read(), page_url=PAGE_URL)
+
+
+def test_cite_notes_are_grouped_by_section():
+    cite_notes = get_cite_note_links_by_section(analyse_page())
+
+    assert cite_notes == {
+        "History": ["cite_note-2", "cite_note-3"],
+        "Construction": ["cite_note-4"],
+        "Design": ["cite_note-3"],
+    }
+
+
+def test_citations_have_the_section_links_structure():
+    citations = get_all_citations(analyse_page())
+
+    assert list(citations) == ["Introduction", "History", "Construction", "Design"]
+    assert citations["History"]["actual_links"] == [
+        ('"The Eiffel Tower"', "https://archive.org/details/eiffeltower"),
+        ('"Eiffel Tower"', "https://www.britannica.com/topic/Eiffel-Tower-Paris-France"),
+    ]
+    assert citations["Design"]["archived_links"] == [(
+        '"Eiffel Tower"',
+        ("https://web.archive.org/web/2020/https://www.britannica.com/topic/Eiffel-Tower-Paris-France",),
+    )]
+    # the reference only cited in the lead goes to the introduction
+    assert citations["Introduction"]["actual_links"] == [
+        ('"The Monument"', "https://www.toureiffel.paris/en/the-monument")
+    ]
+    # a reference without a link gives no citation
+    assert citations["Construction"]["actual_links"] == []
+
+
+def test_external_links_skip_anchors_and_duplicates():
+    links = get_external_links_by_section(analyse_page(), PAGE_URL)
+
+    assert links["Introduction"][0] == ("Champ de Mars", "https://en.wikipedia.org/wiki/Champ_de_Mars")
+    assert links["Design"] == [
+        ("Maurice Koechlin", "https://en.wikipedia.org/wiki/Maurice_Koechlin"),
+        ("Émile Nouguier", "https://en.wikipedia.org/wiki/%C3%89mile_Nouguier"),
+    ]
+    all_urls = [url for section_links in links.values() for _, url in section_links]
+    assert not any(url.startswith(f"{PAGE_URL}#") for url in all_urls)
+    assert len(all_urls) == len(set((text, url) for section_links in links.values() for text, url in section_links))
+
+
+class FixtureClient:
+    """Answers the text, html and image requests of the fixture page"""
+
+    base_url = "https://en.wikipedia.org"
+
+    def wiki_request(self, params):
+        if params.get("action") == "parse":
+            with open(FIXTURE_PATH, encoding="utf-8") as f:
+                return {"parse": {"text": f.read()}}
+        if params.get("prop") == "extracts":
+            extract = "The Eiffel Tower is a tower in Paris.\n\n== History ==\nBuilt for the fair.\n\n== Design ==\nBy Koechlin."
+            return {"query": {"pages": {"1": {"extract": extract}}}}
+        return {}
+
+
+def build_page_nodes():
+    record = PageRecord("Eiffel Tower", 1, 5, "A tower.", [], "", FixtureClient())
+    return process_page_into_doc_and_nodes(record)
+
+
+def test_wiki_link_nodes_are_off_by_default():
+    nodes = build_page_nodes()
+
+    assert not [node for node in nodes if node.metadata.get("type") == "wiki-ref"]
+    assert [node for node in nodes if node.metadata.get("type") == "citation"]
+
+
+def test_introduction_links_belong_to_the_intro_node(monkeypatch):
+    monkeypatch.setattr(data_fetcher, "WIKI_LINK_NODES", True)
+    nodes = build_page_nodes()
+
+    intro = next(node for node in nodes if node.metadata.get("title") == "Eiffel-Tower_intro")
+    intro_nodes = [node for node in nodes if node.metadata.get("parent_section") == "Introduction"]
+    assert {node.metadata["type"] for node in intro_nodes} == {"citation", "archive-citation", "wiki-ref"}
+    assert all(node.relationships[NodeRelationship.PARENT].node_id == intro.node_id for node in intro_nodes)
@@ -0,0 +1,163 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import pytest
+from llama_index.core.schema import TextNode, NodeRelationship, RelatedNodeInfo
+import scripts.llama_ingestionator.request_executor as request_executor
+from scripts.cache_store import SQLiteCache
+from scripts.llama_ingestionator.request_executor import (
+    IMAGE_TOKENS,
+    RateLimiter,
+    estimate_request_tokens,
+    get_chat_completion,
+    llm_cache_stats,
+)
+from scripts.llama_ingestionator.transformator import SectionEnrichmentTransformation
+
+
+@pytest.fixture
+def chat_server(monkeypatch, tmp_path):
+    """Fake chat completions endpoint, answering the first `throttled` requests with a 429"""
+    stats = {"requests": 0, "in_flight": 0, "max_in_flight": 0, "throttled": 0}
+    lock = threading.Lock()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+            with lock:
+                stats["requests"] += 1
+                throttle = stats["requests"] <= stats["throttled"]
+                stats["in_flight"] += 1
+                stats["max_in_flight"] = max(stats["max_in_flight"], stats["in_flight"])
+            time.sleep(0.1)
+            with lock:
+                stats["in_flight"] -= 1
+
+            if throttle:
+                self.send_response(429)
+                self.send_header("retry-after-ms", "200")
+                payload = b"{}"
+            else:
+                self.send_response(200)
+                text = body["messages"][1]["content"][1]["text"]
+                message = {"content": f"summary of {text}"}
+                if body.get("functions"):
+                    arguments = {"entities": [], "summary": f"summary of {text}", "key_takeaways": []}
+                    message = {"content": None, "function_call": {
+                        "name": body["functions"][0]["name"], "arguments": json.dumps(arguments),
+                    }}
+                payload = json.dumps({"choices": [{"message": message}], "usage": {"total_tokens": 10}}).encode()
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(request_executor, "GPT4_ENDPOINT", f"http://127.0.0.1:{server.server_port}/chat")
+    monkeypatch.setattr(request_executor, "_rate_limiter", RateLimiter(6000, 10_000_000))
+    monkeypatch.setattr(request_executor, "_llm_cache", SQLiteCache(str(tmp_path / "llm.sqlite")))
+    monkeypatch.setattr(request_executor, "_tokens_saved", 0)
+    yield stats
+    server.shutdown()
+    server.server_close()
+
+
+def make_section(idx):
+    node = TextNode(text=f"section {idx}", metadata={"type": "section", "title": f"section {idx}"})
+    node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id="page")
+    return node
+
+
+def test_requests_wait_for_the_request_and_token_limits():
+    # 1200 requests a minute is 20 a second, with up to half a second of them at once
+    limiter = RateLimiter(requests_per_minute=1200, tokens_per_minute=10_000_000, burst_seconds=0.5)
+    start = time.monotonic()
+    for _ in range(20):
+        limiter.acquire()
+    assert time.monotonic() - start >= 0.45
+
+    limiter = RateLimiter(requests_per_minute=10_000, tokens_per_minute=60_000, burst_seconds=0.5)
+    start = time.monotonic()
+    for _ in range(4):
+        limiter.acquire(tokens=250)
+    assert time.monotonic() - start >= 0.45
+
+
+def test_paused_limiter_holds_back_requests():
+    limiter = RateLimiter(requests_per_minute=10_000, tokens_per_minute=10_000_000)
+    limiter.pause(0.3)
+    start = time.monotonic()
+    limiter.acquire()
+    assert time.monotonic() - start >= 0.25
+
+
+def test_request_tokens_count_images_and_completion():
+    text_payload = {
+        "messages": [{"role": "user", "content": [{"type": "text", "text": "hello world"}]}],
+        "max_tokens": 800,
+    }
+    image_payload = {
+        "messages": [{"role": "user", "content": [
+            {"type": "text", "text": "hello world"},
+            {"type": "image_url", "image_url": {"url": "data:image/png;base64,AAAA"}},
+        ]}],
+        "max_tokens": 800,
+    }
+
+    assert estimate_request_tokens(text_payload) == 802
+    assert estimate_request_tokens(image_payload) == 802 + IMAGE_TOKENS
+
+
+def test_enrichment_requests_overlap_and_honour_retry_after(chat_server):
+    chat_server["throttled"] = 1
+    nodes = [make_section(idx) for idx in range(6)]
+
+    start = time.monotonic()
+    transformed = SectionEnrichmentTransformation()(nodes)
+    duration = time.monotonic() - start
+
+    summaries = [node.text for node in transformed if node.metadata["type"] == "summary"]
+    assert summaries == [f"summary of section {idx}" for idx in range(6)]
+    # one request was throttled and sent again after the Retry-After
+    assert chat_server["requests"] == 7
+    assert chat_server["max_in_flight"] > 1
+    # serial requests would take at least 0.7 seconds plus the retry wait
+    assert duration < 0.7
+
+
+def make_payload(text, image=None):
+    content = [{"type": "text", "text": "Summarise"}, {"type": "text", "text": text}]
+    if image:
+        content.append({"type": "image_url", "image_url": {"url": f"data:image/png;base64,{image}"}})
+    return {"messages": [{"role": "system", "content": "You are an AI assistant."}, {"role": "user", "content": content}]}
+
+
+def test_repeated_requests_are_served_from_the_cache(chat_server):
+    nodes = [make_section(idx) for idx in range(3)]
+    first = SectionEnrichmentTransformation()(nodes)
+    assert chat_server["requests"] == 3
+
+    second = SectionEnrichmentTransformation()(nodes)
+    assert chat_server["requests"] == 3
+    assert [node.text for node in second] == [node.text for node in first]
+
+    stats = llm_cache_stats()
+    assert stats["hits"] == 3
+    assert stats["entries"] == 3
+    assert stats["tokens_saved"] == 30
+
+
+def test_cache_key_covers_the_image_and_can_be_bypassed(chat_server, monkeypatch):
+    get_chat_completion(make_payload("tower", image="AAAA"))
+    get_chat_completion(make_payload("tower", image="AAAA"))
+    get_chat_completion(make_payload("tower", image="BBBB"))
+    assert chat_server["requests"] == 2
+
+    get_chat_completion(make_payload("tower", image="AAAA"), use_cache=False)
+    monkeypatch.setattr(request_executor, "LLM_CACHE_BYPASS", True)
+    get_chat_completion(make_payload("tower", image="AAAA"))
+    assert chat_server["requests"] == 4
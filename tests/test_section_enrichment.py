@@ -0,0 +1,91 @@
+import json
+from llama_index.core.schema import TextNode, NodeRelationship, RelatedNodeInfo
+from scripts.llama_ingestionator.request_executor import estimate_request_tokens
+from scripts.llama_ingestionator.transformator import SectionEnrichmentTransformation
+
+SECTION_TEXT = " ".join(
+    f"The Eiffel Tower was built by the company of Gustave Eiffel for the 1889 World's Fair in Paris, step {idx}."
+    for idx in range(40)
+)
+ENRICHMENT = {
+    "entities": [
+        {"type": "person", "name": "Gustave Eiffel", "context": "engineer"},
+        {"type": "location", "name": "Paris", "context": "city of the tower"},
+        {"type": "date", "name": "1889", "context": "World's Fair"},
+    ],
+    "summary": "The tower was built for the World's Fair.",
+    "key_takeaways": ["Built for the 1889 World's Fair", "Designed by Eiffel's company"],
+}
+
+
+def make_section(title, text=SECTION_TEXT):
+    node = TextNode(text=text, metadata={"type": "section", "title": title, "context": "Eiffel Tower"})
+    node.relationships[NodeRelationship.SOURCE] = RelatedNodeInfo(node_id="page")
+    return node
+
+
+def record_prompt_tokens(transformation_class, response):
+    """Transformation answering every request with response, recording the prompt tokens sent"""
+
+    class Recording(transformation_class):
+        def openai_request(self, prompt, image=None, text=None, function=None, max_tokens=800):
+            payload = self.create_payload(prompt, image=image, text=text, function=function, max_tokens=max_tokens)
+            prompt_tokens.append(estimate_request_tokens(payload) - max_tokens)
+            return response
+
+    prompt_tokens = []
+    return Recording(), prompt_tokens
+
+
+def test_fused_enrichment_adds_the_three_node_types():
+    function_response = {
+        "choices": [{"message": {"content": None, "function_call": {
+            "name": "enrich_section", "arguments": json.dumps(ENRICHMENT),
+        }}}],
+        "usage": {"total_tokens": 100},
+    }
+    enrichment, prompt_tokens = record_prompt_tokens(SectionEnrichmentTransformation, function_response)
+    sections = [make_section("History"), make_section("Design")]
+    table = TextNode(text="a,b", metadata={"type": "table", "title": "table"})
+
+    nodes = enrichment(sections + [table])
+
+    assert len(prompt_tokens) == 2
+    derived = nodes[3:]
+    assert [(node.metadata["title"], node.metadata["type"]) for node in derived] == [
+        ("History_entities", "entities"),
+        ("Design_entities", "entities"),
+        ("History_summary", "summary"),
+        ("Design_summary", "summary"),
+        ("History_takeaways", "key_takeaways"),
+        ("Design_takeaways", "key_takeaways"),
+    ]
+    assert json.loads(derived[0].text) == {
+        "persons": [ENRICHMENT["entities"][0]],
+        "organizations": [],
+        "locations": [ENRICHMENT["entities"][1]],
+        "dates": [ENRICHMENT["entities"][2]],
+    }
+    assert derived[2].text == ENRICHMENT["summary"]
+    assert derived[4].text == "- Built for the 1889 World's Fair\n- Designed by Eiffel's company"
+    assert derived[2].metadata["context"] == "Eiffel Tower"
+    assert all(node.metadata["needs_embedding"] for node in derived)
+    assert derived[1].relationships[NodeRelationship.PARENT].node_id == sections[1].node_id
+    assert derived[1].relationships[NodeRelationship.SOURCE].node_id == "page"
+
+
+def test_unreadable_enrichment_adds_no_nodes():
+    enrichment, _ = record_prompt_tokens(SectionEnrichmentTransformation, {"choices": [{"message": {"content": "no call"}}]})
+    sections = [make_section("History")]
+
+    assert enrichment(sections) == sections
+
+
+def test_fused_enrichment_sends_the_section_once():
+    enrichment, prompt_tokens = record_prompt_tokens(SectionEnrichmentTransformation, None)
+    enrichment([make_section("History")])
+
+    section_tokens = estimate_request_tokens({"messages": [{"role": "user", "content": SECTION_TEXT}]})
+    assert len(prompt_tokens) == 1
+    # the prompt and the function schema add a fraction of the section, not copies of it
+    assert prompt_tokens[0] < 1.5 * section_tokens
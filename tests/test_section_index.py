@@ -0,0 +1,44 @@
+from scripts.wiki_crawler.navigifier import index_sections, extract_section_titles
+
+PAGE_CONTENT = """Intro text.
+
+== Early life ==
+Born in a small town.
+
+=== History ===
+Family history.
+
+== Career ==
+Worked as an engineer.
+
+=== History ===
+Career history.
+
+==== Details ====
+More details.
+"""
+
+
+def test_duplicate_subsection_titles_keep_their_own_text():
+    sections = index_sections(PAGE_CONTENT)
+
+    (early_life, early_subsections), (career, career_subsections) = sections
+    assert early_life.text == "Born in a small town."
+    assert early_subsections[0].title == "History"
+    assert early_subsections[0].text == "Family history."
+    assert career_subsections[0].title == "History"
+    assert career_subsections[0].text == "Career history."
+    assert career_subsections[1].text == "More details."
+
+
+def test_spans_point_at_section_text():
+    for section, subsections in index_sections(PAGE_CONTENT):
+        for indexed in [section] + subsections:
+            assert PAGE_CONTENT[indexed.start:indexed.end] == indexed.text
+
+
+def test_titles_match_extract_section_titles():
+    assert extract_section_titles(PAGE_CONTENT) == [
+        ("Early life", ["History"]),
+        ("Career", ["History", "Details"]),
+    ]
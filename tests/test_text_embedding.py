@@ -1,5 +1,11 @@
-from knowledge_extractor.scripts.llama_ingestionator.transformator import EmbeddingTransformation
-from llama_index.core.schema import TextNode
+import threading
+import time
+import knowledge_extractor.scripts.llama_ingestionator.transformator as transformator
+from knowledge_extractor.scripts.llama_ingestionator.transformator import (
+    EmbeddingTransformation,
+    pack_embedding_batches,
+)
+from llama_index.core.schema import TextNode, ImageNode
 
 def test_embedding_transformation():
     # Mocked TextNode data
@@ -9,10 +15,84 @@ def test_embedding_transformation():
     # Mocked embedding model
     class MockEmbedModel:
         def get_text_embedding(self, text):
-            return [0.1, 0.2, 0.3]  
+            return [0.1, 0.2, 0.3]
 
     embedding_transformation = EmbeddingTransformation()
     transformed_docs = embedding_transformation(documents, text_embed_model=MockEmbedModel())
 
     # Check that embedding was added
     assert transformed_docs[0].embedding == [0.1, 0.2, 0.3], "Embedding was not added correctly"
+
+
+def word_tokenizer(text):
+    return text.split()
+
+
+def test_batches_are_packed_by_tokens_and_size():
+    texts = ["a b c", "d e", "f g h i", "j", "k l m n o p q r s t u v", "w"]
+
+    assert pack_embedding_batches(texts, max_tokens=6, max_size=10, tokenizer=word_tokenizer) == [
+        [0, 1],
+        [2, 3],
+        # a text over the token limit is sent on its own
+        [4],
+        [5],
+    ]
+    assert pack_embedding_batches(texts, max_tokens=100, max_size=4, tokenizer=word_tokenizer) == [
+        [0, 1, 2, 3],
+        [4, 5],
+    ]
+
+
+class BatchEmbedModel:
+    """Embeds "node <n>" as [n], answering the first batch last"""
+
+    def __init__(self):
+        self.batches = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def get_text_embedding_batch(self, texts):
+        with self.lock:
+            self.batches.append(texts)
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(0.2 if "node 0" in texts else 0.05)
+        with self.lock:
+            self.in_flight -= 1
+        return [[float(text.split()[-1])] for text in texts]
+
+
+def make_nodes(num_nodes):
+    return [
+        TextNode(text=f"node {idx}", metadata={"needs_embedding": True, "title": f"node {idx}"})
+        for idx in range(num_nodes)
+    ]
+
+
+def test_nodes_are_embedded_in_one_batch():
+    nodes = make_nodes(40)
+    skipped = TextNode(text="not embedded", metadata={"title": "skipped"})
+    image = ImageNode(metadata={"needs_embedding": True, "title": "image"})
+    model = BatchEmbedModel()
+
+    documents = EmbeddingTransformation()(nodes + [skipped, image], text_embed_model=model)
+
+    assert model.batches == [[node.text for node in nodes]]
+    assert [doc.embedding for doc in documents[:40]] == [[float(idx)] for idx in range(40)]
+    assert skipped.embedding is None and image.embedding is None
+
+
+def test_batches_are_embedded_concurrently_in_order(monkeypatch):
+    monkeypatch.setattr(transformator, "EMBEDDING_BATCH_MAX_TOKENS", 10)
+    nodes = make_nodes(40)
+    model = BatchEmbedModel()
+
+    embeddings = EmbeddingTransformation().get_text_embeddings(
+        [node.text for node in nodes], model, concurrency=4
+    )
+
+    assert len(model.batches) > 4
+    assert model.max_in_flight == 4
+    assert embeddings == [[float(idx)] for idx in range(40)]
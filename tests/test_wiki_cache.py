@@ -0,0 +1,95 @@
+import sqlite3
+from unittest.mock import patch
+from mediawiki import MediaWiki
+import scripts.cache_store as cache_store
+from scripts.cache_store import SQLiteCache
+from scripts.wiki_crawler.cachinator import CachedMediaWiki
+
+
+class FakeWikiApi:
+    """Answers the few queries made while loading a page and counts the calls"""
+
+    def __init__(self, revision=10):
+        self.revision = revision
+        self.calls = []
+
+    def __call__(self, params):
+        self.calls.append(dict(params))
+        if params.get("meta") == "siteinfo":
+            return {"query": {"general": {"generator": "MediaWiki 1.42", "server": "https://en.wikipedia.org"}, "extensions": []}}
+        page = {"pageid": 1, "title": "Eiffel Tower", "lastrevid": self.revision}
+        if params.get("prop") == "extracts":
+            page = {"pageid": 1, "title": "Eiffel Tower", "extract": f"Tower text rev {self.revision}"}
+        return {"query": {"pages": {"1": page}}}
+
+
+def load_page(client):
+    client.wiki_request({"prop": "info|pageprops", "titles": "Eiffel Tower"})
+    return client.wiki_request({"prop": "extracts", "titles": "Eiffel Tower"})
+
+
+def test_unchanged_page_is_served_from_cache(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "wiki.sqlite"))
+    api = FakeWikiApi()
+    with patch.object(MediaWiki, "_get_response", side_effect=api):
+        load_page(CachedMediaWiki(cache=cache))
+        calls_first_run = len(api.calls)
+        response = load_page(CachedMediaWiki(cache=cache))
+
+    assert len(api.calls) == calls_first_run
+    assert response["query"]["pages"]["1"]["extract"] == "Tower text rev 10"
+    assert cache.stats()["hits"] >= 2
+
+
+def test_changed_revision_is_refetched(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "wiki.sqlite"))
+    api = FakeWikiApi()
+    with patch.object(MediaWiki, "_get_response", side_effect=api):
+        load_page(CachedMediaWiki(cache=cache))
+        api.revision = 11
+        response = load_page(CachedMediaWiki(cache=cache, revalidate_after=0))
+
+    assert response["query"]["pages"]["1"]["extract"] == "Tower text rev 11"
+
+
+def test_cache_evicts_least_recently_used(tmp_path):
+    cache = SQLiteCache(str(tmp_path / "small.sqlite"), max_bytes=100)
+    cache.set("old", b"x" * 60)
+    cache.set("new", b"y" * 60)
+
+    assert cache.get("old") is None
+    assert cache.get("new") == b"y" * 60
+    assert cache.stats()["bytes"] <= 100
+    assert cache.stats()["evictions"] == 1
+
+
+def test_hits_are_written_in_batches_and_keep_entries_cached(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache_store, "TOUCH_BATCH_SIZE", 2)
+    path = str(tmp_path / "touch.sqlite")
+    cache = SQLiteCache(path, max_bytes=150)
+    cache.set("old", b"x" * 60)
+    cache.set("new", b"y" * 60)
+    accessed_at = lambda: dict(sqlite3.connect(path).execute("SELECT key, accessed_at FROM entries"))
+    before = accessed_at()
+
+    cache.get("old")
+    assert accessed_at() == before
+    cache.get("new")
+    cache.get("old")
+    assert accessed_at()["new"] > before["new"]
+
+    # the pending hit on "old" is written before evicting
+    cache.set("newest", b"z" * 60)
+    assert cache.get("old") == b"x" * 60
+    assert cache.get("new") is None
+
+
+def test_expired_entries_are_removed_from_the_file(tmp_path):
+    path = str(tmp_path / "expired.sqlite")
+    cache = SQLiteCache(path, max_age=1)
+    cache.set("page", b"text")
+    with sqlite3.connect(path) as conn:
+        conn.execute("UPDATE entries SET created_at = created_at - 10")
+
+    assert cache.get("page") is None
+    assert sqlite3.connect(path).execute("SELECT COUNT(*) FROM entries").fetchone()[0] == 0